@@ -0,0 +1,91 @@
+""" Ingest benchmarks on synthetic data (dicommodule/SyntheticData.py)
+
+    Not collected by a plain test run; run them explicitly with
+        python -m pytest Tests/Benchmark_Ingest.py
+    and compare runs with --benchmark-autosave / --benchmark-compare.
+    Throughput (slices/s, contours/s) is stored in each result's extra_info.
+"""
+import os
+import pytest
+
+pytest.importorskip('pytest_benchmark')
+
+from dicommodule.SyntheticData import make_patient
+from dicommodule.Patient import find_DCM_files_serial
+from dicommodule.Patient_Image import Patient_Image
+from dicommodule.Patient_StructureSet import Patient_StructureSet
+
+# (nSlices, rows / cols)
+SCALES = [(16, 128), (64, 256), (160, 512)]
+SCALE_IDS = ['{}x{}'.format(*scale) for scale in SCALES]
+
+
+@pytest.fixture(scope='module', params=SCALES, ids=SCALE_IDS)
+def dataset(request, tmp_path_factory):
+    nSlices, size = request.param
+    outDir = str(tmp_path_factory.mktemp('synthetic'))
+    return make_patient(outDir, nSlices=nSlices, rows=size, cols=size,
+                        dose=False)
+
+
+def load_image(dataset):
+    image = Patient_Image()
+    image.setData(fileList=dataset['images'])
+    return image
+
+
+def report(benchmark, **counts):
+    stats = getattr(benchmark.stats, 'stats', None)
+    if stats is None:  # --benchmark-disable
+        return
+    for name, count in counts.items():
+        benchmark.extra_info[name] = count / stats.mean
+
+
+def test_find_DCM_files(benchmark, dataset):
+    rootpath = os.path.dirname(dataset['rtstruct'])
+    benchmark(find_DCM_files_serial, rootpath)
+    report(benchmark, files_per_s=len(dataset['images']) + 1)
+
+
+def test_image_setData(benchmark, dataset):
+    benchmark(load_image, dataset)
+    report(benchmark, slices_per_s=len(dataset['images']))
+
+
+def test_structureset_setData(benchmark, dataset):
+    info = load_image(dataset).info
+
+    def load_rtstruct():
+        structureSet = Patient_StructureSet()
+        structureSet.setData(filePath=dataset['rtstruct'], imageInfo=info)
+        return structureSet
+
+    benchmark(load_rtstruct)
+    report(benchmark, contours_per_s=dataset['nContours'])
+
+
+def load_structureset(dataset):
+    structureSet = Patient_StructureSet()
+    structureSet.setData(filePath=dataset['rtstruct'],
+                         imageInfo=load_image(dataset).info)
+    return structureSet
+
+
+def test_structureset_over_write_file(benchmark, dataset, tmpdir):
+    structureSet = load_structureset(dataset)
+
+    def mark_all_dirty():
+        # saving marks the ROIs clean; re-extract every contour each round
+        for ROI in structureSet.ROI_List:
+            ROI.mark_dirty()
+
+    benchmark.pedantic(structureSet.over_write_file, args=(str(tmpdir),),
+                       setup=mark_all_dirty, rounds=5, iterations=1)
+    report(benchmark, contours_per_s=dataset['nContours'])
+
+
+def test_structureset_over_write_file_clean(benchmark, dataset, tmpdir):
+    # nothing edited: the contours on file are written back as they are
+    structureSet = load_structureset(dataset)
+    benchmark(structureSet.over_write_file, str(tmpdir))
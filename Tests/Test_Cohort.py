@@ -0,0 +1,103 @@
+from dicommodule.SyntheticData import make_patient
+from dicommodule.Cohort import load_patients
+import dicommodule.Cohort as Cohort
+import multiprocessing
+import numpy as np
+import pytest
+import os
+
+# big enough that image and masks go through shared memory
+SIZE = {'nSlices': 48, 'rows': 160, 'cols': 160}
+
+
+def shm_segments():
+    return {name for name in os.listdir('/dev/shm')
+            if name.startswith('psm_')}
+
+
+def make_cohort(tmpdir, n):
+    paths = []
+    for i in range(n):
+        path = str(tmpdir.join('patient{}'.format(i)))
+        make_patient(path, dose=False, **SIZE)
+        paths.append(path)
+    return paths
+
+
+needs_shm = pytest.mark.skipif(not os.path.isdir('/dev/shm'),
+                               reason="no /dev/shm to inspect")
+
+
+@needs_shm
+def test_early_break_leaves_no_segments(tmpdir):
+    paths = make_cohort(tmpdir, 3)
+    before = shm_segments()
+    for result in load_patients(paths, workers=2):
+        assert result.error is None
+        break  # the other two are never handed out
+    del result
+    assert shm_segments() == before
+
+
+@needs_shm
+@pytest.mark.skipif(multiprocessing.get_start_method() != 'fork',
+                    reason="workers must inherit the patched module")
+def test_failing_patient_leaves_no_segments(tmpdir, monkeypatch):
+    paths = make_cohort(tmpdir, 1)
+    sharer = Cohort._share_arrays
+
+    def share_then_fail(patient):
+        sharer(patient)
+        raise RuntimeError("after sharing")
+    monkeypatch.setattr(Cohort, '_share_arrays', share_then_fail)
+
+    before = shm_segments()
+    results = list(load_patients(paths, workers=1))
+    assert results[0].patient is None
+    assert 'after sharing' in results[0].error
+    assert shm_segments() == before
+
+
+def test_cohort_matches_serial_load(tmpdir):
+    from dicommodule.Patient import Patient
+    from dicommodule.LazyVolume import LazyVolume
+    import gc
+
+    paths = make_cohort(tmpdir, 2)
+    broken = str(tmpdir.mkdir('broken'))  # no DICOM at all
+    before = shm_segments() if os.path.isdir('/dev/shm') else set()
+
+    results = {result.path: result for result in
+               load_patients(paths + [broken], workers=2,
+                             parts=('image', 'ROI'))}
+    assert set(results) == set(paths + [broken])
+    assert results[broken].patient is None
+    assert 'Traceback' in results[broken].error
+
+    for path in paths:
+        result = results[path]
+        assert result.error is None
+        patient, serial = result.patient, Patient(path)
+        # image and every mask came through shared memory
+        assert len(patient.sharedBlocks) == 1 + len(serial.StructureSet
+                                                    .ROI_List)
+        assert np.array_equal(patient.Image.data, serial.Image.data)
+        for ROI in serial.StructureSet.ROI_List:
+            mine = patient.StructureSet.get_ROI(ROI.Name)
+            assert np.array_equal(np.asarray(mine.DataVolume),
+                                  np.asarray(ROI.DataVolume))
+        assert np.allclose(patient.Image.info['Pix2Pat'],
+                           serial.Image.info['Pix2Pat'])
+
+    # names are gone from /dev/shm, the mappings live on with the patients
+    if os.path.isdir('/dev/shm'):
+        assert shm_segments() == before
+    gc.collect()
+    first = results[paths[0]].patient
+    assert first.Image.data.sum() == Patient(paths[0]).Image.data.sum()
+
+    # lazy images and their slice caches travel back by pickle
+    lazy, = load_patients(paths[:1], workers=1, lazy_image=True)
+    assert isinstance(lazy.patient.Image.data, LazyVolume)
+    assert np.array_equal(lazy.patient.Image.data[:, :, 5],
+                          first.Image.data[:, :, 5])
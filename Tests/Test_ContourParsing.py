@@ -0,0 +1,121 @@
+from dicommodule.Patient_ROI import (ContourSequence2PatientArray,
+                                     ContourData2PatientArray,
+                                     _raw_contour_data, rasterize_ROIs)
+import numpy as np
+
+try:
+    import dicom as dicom
+except ImportError:
+    import pydicom as dicom
+
+
+def make_sequence(tmpdir):
+    """ a ContourSequence read back from file, so ContourData is raw """
+    ds = dicom.dataset.Dataset()
+    contours = []
+    for z, nPts in ((-2.5, 3), (0.0, 4)):
+        contour = dicom.dataset.Dataset()
+        points = np.arange(nPts * 3, dtype=float) / 7
+        points[2::3] = z
+        contour.ContourData = ['{:.4f}'.format(x) for x in points]
+        contours.append(contour)
+    ds.ContourSequence = dicom.sequence.Sequence(contours)
+    path = str(tmpdir.join('contours.dcm'))
+    ds.is_little_endian, ds.is_implicit_VR = True, True
+    dicom.filewriter.write_file(path, ds)
+    return dicom.read_file(path, force=True).ContourSequence
+
+
+def test_batch_parse_matches_per_contour(tmpdir):
+    sequence = make_sequence(tmpdir)
+    points, offsets = ContourSequence2PatientArray(sequence)
+    assert offsets.tolist() == [0, 3, 7]
+    for index, contour in enumerate(sequence):
+        expected = ContourData2PatientArray(contour.ContourData)[:3, :].T
+        assert np.array_equal(points[offsets[index]:offsets[index + 1]],
+                              expected)
+
+
+def test_raw_DS_bytes_parse_like_DSfloat(tmpdir):
+    # DS as other systems write it: padding, exponents, signs, no decimals
+    texts = [['1.5e+01 ', ' -3E-2', '7', '+2.25', '-0', '1.0E2'],
+             ['12.75', '-4.5e-3', '  8 ', '0.1', '1e1', '-2.5', '3', '4',
+              '5.000000']]
+    ds = dicom.dataset.Dataset()
+    contours = []
+    for text in texts:
+        contour = dicom.dataset.Dataset()
+        contour.add_new(0x30060050, 'DS', '\\'.join(text))
+        contours.append(contour)
+    ds.ContourSequence = dicom.sequence.Sequence(contours)
+    path = str(tmpdir.join('contours.dcm'))
+    ds.is_little_endian, ds.is_implicit_VR = True, True
+    dicom.filewriter.write_file(path, ds)
+    sequence = dicom.read_file(path, force=True).ContourSequence
+
+    # the fast path: nothing converted yet
+    assert all(isinstance(_raw_contour_data(contour), bytes)
+               for contour in sequence)
+    points, offsets = ContourSequence2PatientArray(sequence)
+    assert offsets.tolist() == [0, 2, 5]
+
+    expected = [float(dicom.valuerep.DSfloat(x.strip()))
+                for text in texts for x in text]
+    assert np.array_equal(points.ravel(), expected)
+
+    # and the slow path, once pydicom has converted the values
+    for contour in sequence:
+        contour.ContourData
+    assert _raw_contour_data(sequence[0]) is None
+    slowPoints, slowOffsets = ContourSequence2PatientArray(sequence)
+    assert np.array_equal(slowPoints, points)
+    assert np.array_equal(slowOffsets, offsets)
+
+
+def test_parallel_rasterization_matches_serial(tmpdir):
+    from dicommodule.SyntheticData import make_patient
+    from dicommodule.Patient_Image import Patient_Image
+    from dicommodule.Patient_ROI import Patient_ROI_Obj
+    from dicommodule.Patient_StructureSet import Patient_StructureSet
+    import dicommodule.Executors as Executors
+
+    written = make_patient(str(tmpdir), nSlices=24, rows=64, cols=56,
+                           dose=False)
+    image = Patient_Image()
+    image.setData(fileList=written['images'])
+
+    workers = Executors.get_max_workers()
+    Executors.configure(max_workers=4)  # real concurrency, even on 1 CPU
+    try:
+        for storage in ('uint8', 'bool', 'packed', 'cropped', 'rle', 'lazy'):
+            structureSet = Patient_StructureSet(maskStorage=storage)
+            structureSet.setData(filePath=written['rtstruct'],
+                                 imageInfo=image.info)
+            contours = structureSet.di.ROIContourSequence
+            assert len(contours) == len(structureSet.ROI_List)
+            for ROI, contour in zip(structureSet.ROI_List, contours):
+                parallel = np.asarray(ROI.DataVolume[:, :, :], dtype=bool)
+                assert parallel.any()
+                serial = Patient_ROI_Obj(contour=contour,
+                                         imageInfo=image.info,
+                                         rasterize=False)
+                rasterize_ROIs([serial])
+                assert np.array_equal(parallel,
+                                      serial.DataVolume.astype(bool)), \
+                    (storage, ROI.Name)
+    finally:
+        Executors.configure(max_workers=workers)
+
+
+def test_rasterize_keeps_edits(tmpdir):
+    from dicommodule.SyntheticData import make_patient
+    from dicommodule.Patient import Patient
+
+    make_patient(str(tmpdir), nSlices=12, rows=48, cols=48, dose=False)
+    for storage in ('uint8', 'packed', 'rle', 'lazy'):
+        ROI = Patient(str(tmpdir), mask_storage=storage) \
+            .StructureSet.ROI_List[0]
+        z = ROI.stats.sliceRange[0]
+        ROI.set_slice(z, np.zeros(ROI.volSize[:2]))
+        ROI.rasterize()  # the contours read from file don't come back
+        assert not ROI.get_slice(z).any(), storage
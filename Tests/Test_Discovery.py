@@ -0,0 +1,147 @@
+from dicommodule.SyntheticData import (make_patient, make_geometry,
+                                       write_image_series, write_rtstruct,
+                                       SOP_CLASSES)
+import dicommodule.Discovery as Discovery
+from dicommodule.ScanCache import ScanCache
+from dicommodule.HeaderIndex import read_dicom_header
+from dicommodule.Patient import Patient
+import sqlite3
+import pytest
+import os
+
+
+def opened_caches(monkeypatch):
+    """ every ScanCache iter_DCM_headers opens for itself """
+    opened = []
+
+    def open_and_record(scanCache):
+        if isinstance(scanCache, str):
+            scanCache = ScanCache(scanCache)
+            opened.append(scanCache)
+        return scanCache
+
+    monkeypatch.setattr(Discovery, 'open_scan_cache', open_and_record)
+    return opened
+
+
+def test_scan_cache_path_closed_after_scan(tmpdir, monkeypatch):
+    patientDir = str(tmpdir.join('patient'))
+    make_patient(patientDir, nSlices=4, rows=16, cols=16)
+    dbPath = str(tmpdir.join('scan.sqlite'))
+    opened = opened_caches(monkeypatch)
+
+    assert len(list(Discovery.iter_DCM_headers(patientDir,
+                                               scanCache=dbPath))) == 6
+    # abandoned part way through, too
+    scan = Discovery.iter_DCM_headers(patientDir, workers=1,
+                                      scanCache=dbPath)
+    next(scan)
+    scan.close()
+
+    assert len(opened) == 2
+    for cache in opened:
+        with pytest.raises(sqlite3.ProgrammingError):
+            cache.connection.execute("SELECT 1")
+
+    # a cache handed in is the caller's to close
+    with ScanCache(dbPath) as cache:
+        assert len(list(Discovery.iter_DCM_headers(patientDir,
+                                                   scanCache=cache))) == 6
+        firstFile = next(Discovery.iter_DCM_files(patientDir))
+        assert cache.get(firstFile) is not None
+
+
+def make_tree(rootDir):
+    """ patient A: one study with an MR series, a CT series and an
+        RTSTRUCT; patient B: one CT series. Returns the series UIDs """
+    geometryA = make_geometry(nSlices=6, rows=16, cols=16)
+    geometryA['PatientID'] = 'A'
+    mr = write_image_series(os.path.join(rootDir, 'A', 'MR'), geometryA,
+                            'MR')
+    ct = write_image_series(os.path.join(rootDir, 'A', 'CT'), geometryA,
+                            'CT')
+    write_rtstruct(os.path.join(rootDir, 'A', 'RS.dcm'), geometryA)
+    geometryB = make_geometry(nSlices=3, rows=16, cols=16)
+    geometryB['PatientID'] = 'B'
+    other = write_image_series(os.path.join(rootDir, 'B'), geometryB, 'CT')
+    seriesUIDs = [read_dicom_header(paths[0])['SeriesInstanceUID']
+                  for paths in (mr, ct, other)]
+    return geometryA, geometryB, seriesUIDs
+
+
+def test_discovery_has_no_file_limit(tmpdir):
+    patientDir = str(tmpdir.join('patient'))
+    make_patient(patientDir, nSlices=320, rows=8, cols=8, dose=False)
+    headers = list(Discovery.iter_DCM_headers(patientDir, workers=2))
+    assert len(headers) == 321  # every slice and the structure set
+    tree = Discovery.discover_series(patientDir)
+    series = Discovery.list_series(tree)
+    assert sorted(len(entry[4]) for entry in series) == [1, 320]
+
+
+def test_discovery_groups_and_selects_series(tmpdir):
+    rootDir = str(tmpdir)
+    geometryA, geometryB, (mrUID, ctUID, otherUID) = make_tree(rootDir)
+    tree = Discovery.discover_series(rootDir)
+
+    assert set(tree) == {'A', 'B'}
+    assert set(tree['A']) == {geometryA['StudyInstanceUID']}
+    studyA = tree['A'][geometryA['StudyInstanceUID']]
+    assert mrUID in studyA and ctUID in studyA and len(studyA) == 3
+    assert list(studyA[mrUID]) == [SOP_CLASSES['MR']]
+    assert len(studyA[mrUID][SOP_CLASSES['MR']]) == 6
+    assert list(tree['B'][geometryB['StudyInstanceUID']]) == [otherUID]
+
+    # one image series, plus the non-image objects of its study
+    chosen = Discovery.select_series(tree, ctUID)
+    assert set(chosen) == {SOP_CLASSES['CT'], SOP_CLASSES['RTSTRUCT']}
+    assert len(chosen[SOP_CLASSES['CT']]) == 6
+    chosen = Discovery.select_series(tree, otherUID)
+    assert set(chosen) == {SOP_CLASSES['CT']}
+    assert len(chosen[SOP_CLASSES['CT']]) == 3
+    with pytest.raises(KeyError):
+        Discovery.select_series(tree, '1.2.3')
+
+    patient = Patient(rootDir, series_uid=mrUID)
+    assert patient.Image.info['NSlices'] == 6
+    assert patient.Image.ImageModality == 'MR'
+    assert patient.hasROI()
+
+
+
+def test_loading_keeps_no_header_index_of_the_tree(tmpdir, monkeypatch):
+    import dicommodule.Patient as PatientModule
+    rootDir = str(tmpdir.join('root'))
+    geometryA, geometryB, (mrUID, ctUID, otherUID) = make_tree(rootDir)
+
+    reads = {}
+
+    def counted_read(path):
+        reads[path] = reads.get(path, 0) + 1
+        return read_dicom_header(path)
+
+    def discover_without_index(*args, **kwargs):
+        assert kwargs.get('headerIndex') is None
+        return discover_series(*args, **kwargs)
+
+    discover_series = Discovery.discover_series
+    monkeypatch.setattr(Discovery, 'read_dicom_header', counted_read)
+    monkeypatch.setattr(PatientModule, 'discover_series',
+                        discover_without_index)
+
+    patient = Patient(rootDir, series_uid=mrUID)
+    assert patient.Image.info['NSlices'] == geometryA['NSlices']
+    # the walk reads each file once; only the MR series is read again
+    mrDir = os.path.join(rootDir, 'A', 'MR')
+    assert set(reads.values()) == {1, 2}
+    assert {path for path, count in reads.items() if count == 2} == \
+        {path for path in reads if path.startswith(mrDir)}
+
+    # with a scan cache, the second look is a cache hit
+    reads.clear()
+    dbPath = str(tmpdir.join('scan.sqlite'))
+    Patient(rootDir, series_uid=mrUID, scan_cache=dbPath)
+    assert set(reads.values()) == {1}
+    reads.clear()
+    Patient(rootDir, series_uid=mrUID, scan_cache=dbPath)
+    assert reads == {}
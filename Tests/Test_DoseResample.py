@@ -0,0 +1,93 @@
+from dicommodule.SyntheticData import load_synthetic_patient
+from dicommodule.Executors import get_executor
+import numpy as np
+
+
+def load_patient(tmpdir):
+    return load_synthetic_patient(str(tmpdir.join('patient')), nSlices=16,
+                                  rows=48, cols=40, pixelSpacing=(1.2, 0.8))
+
+
+def sampled(dose, imageInfo, bbox):
+    """ dose at every voxel centre of bbox, one point at a time """
+    (x0, y0, z0), (x1, y1, z1) = bbox
+    grid = np.meshgrid(np.arange(x0, x1), np.arange(y0, y1),
+                       np.arange(z0, z1), indexing='ij')
+    voxels = np.stack(grid + [np.ones(grid[0].shape)], axis=-1)
+    points = voxels.dot(imageInfo['Pix2Pat'].T)[..., 0:3]
+    return dose.sample(points.reshape(-1, 3)).reshape(grid[0].shape)
+
+
+def test_resample_onto_image_grid(tmpdir):
+    patient = load_patient(tmpdir)
+    dose, info = patient.Dose, patient.Image.info
+    whole = [[0, 0, 0], [40, 48, 16]]
+
+    full = dose.resample(info, chunkSlices=5, executor=get_executor())
+    assert full.shape == (40, 48, 16)
+    assert full.dtype == np.float32
+    assert np.allclose(full, sampled(dose, info, whole), atol=1e-4)
+    assert full.max() > 0 and full[0, 0, 0] < full[20, 24, 8]
+
+    # boxes inside are cut from it; the whole grid is kept
+    bbox = np.array([[5, 10, 3], [30, 40, 12]])
+    box = dose.resample(info, bbox)
+    assert np.shares_memory(box, full)
+    assert np.allclose(box, sampled(dose, info, bbox), atol=1e-4)
+    assert dose.resample(info) is full
+
+
+def test_resample_any_orientation(tmpdir):
+    patient = load_patient(tmpdir)
+    dose = patient.Dose
+    info = dict(patient.Image.info)
+    angle = 0.4
+    rotation = np.eye(4)
+    rotation[0:2, 0:2] = [[np.cos(angle), -np.sin(angle)],
+                          [np.sin(angle), np.cos(angle)]]
+    info['Pix2Pat'] = rotation.dot(info['Pix2Pat'])
+
+    bbox = np.array([[5, 10, 3], [30, 40, 12]])
+    box = dose.resample(info, bbox)
+    assert np.allclose(box, sampled(dose, info, bbox), atol=1e-4)
+
+    # frames needn't be evenly spaced
+    offsets = dose.info['GridFrameOffsetVector']
+    offsets[1:-1] += 0.7 * np.sin(np.arange(1, len(offsets) - 1))
+    dose.version += 1
+    box = dose.resample(patient.Image.info, bbox)
+    assert np.allclose(box, sampled(dose, patient.Image.info, bbox),
+                       atol=1e-4)
+
+
+def test_resample_falling_frame_offsets(tmpdir):
+    from dicommodule.Patient_Dose import Patient_Dose
+    try:
+        import dicom as dicom
+    except ImportError:
+        import pydicom as dicom
+
+    patient = load_patient(tmpdir)
+    info = patient.Image.info
+    doseFile = str(tmpdir.join('patient', 'RD.dcm'))
+
+    # the same grid, stored last frame first: offsets 0, -2.5, -5, ...
+    ds = dicom.read_file(doseFile)
+    frames = ds.pixel_array
+    offsets = np.array(ds.GridFrameOffsetVector, dtype=float)
+    position = [float(x) for x in ds.ImagePositionPatient]
+    position[2] += offsets[-1]
+    ds.ImagePositionPatient = position
+    ds.GridFrameOffsetVector = list(offsets[0] - offsets)
+    ds.PixelData = np.ascontiguousarray(frames[::-1]).tobytes()
+    flipped = str(tmpdir.join('RD_flipped.dcm'))
+    ds.save_as(flipped)
+
+    dose = Patient_Dose(flipped)
+    assert dose.info['SliceSpacing'] < 0
+    assert np.array_equal(dose.DoseGrid, patient.Dose.DoseGrid[:, :, ::-1])
+    bbox = np.array([[5, 10, 3], [30, 40, 12]])
+    box = dose.resample(info, bbox)
+    assert box.max() > 0
+    assert np.allclose(box, patient.Dose.resample(info, bbox), atol=1e-4)
+    assert np.allclose(box, sampled(dose, info, bbox), atol=1e-4)
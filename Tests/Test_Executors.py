@@ -0,0 +1,53 @@
+import os
+import dicommodule.Executors as Executors
+import pytest
+
+
+def test_executors_configure_resizes_pools():
+    workers = Executors.get_max_workers()
+    try:
+        before = Executors.get_executor()
+        assert Executors.get_executor() is before  # shared, not per call
+        Executors.configure(max_workers=3)
+        assert Executors.get_max_workers() == 3
+        after = Executors.get_executor()
+        assert after is not before and after._max_workers == 3
+        with pytest.raises(RuntimeError):
+            before.submit(int, 1)  # the old pool was shut down
+        assert after.submit(int, '7').result() == 7
+
+        with pytest.raises(ValueError):
+            Executors.configure(max_workers=0)
+        with pytest.raises(ValueError):
+            Executors.get_executor('fibre')
+
+        jpeg = '1.2.840.10008.1.2.4.50'
+        Executors.configure(process_decoding=False)
+        assert Executors.get_decode_executor(jpeg) is \
+            Executors.get_executor('thread')
+        Executors.configure(process_decoding=True)
+        assert Executors.get_decode_executor(jpeg) is \
+            Executors.get_executor('process')
+        assert Executors.get_decode_executor('1.2.840.10008.1.2.1') is \
+            Executors.get_executor('thread')
+    finally:
+        Executors.configure(max_workers=workers, process_decoding=True)
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason="needs os.fork")
+def test_forked_child_gets_its_own_pool():
+    parent = Executors.get_executor()
+    assert parent.submit(int, '1').result() == 1  # parent has live threads
+
+    pid = os.fork()
+    if pid == 0:  # child: the parent's pool would never run this
+        ok = False
+        try:
+            child = Executors.get_executor()
+            ok = child is not parent and \
+                child.submit(int, '2').result(timeout=10) == 2
+        finally:
+            os._exit(0 if ok else 1)
+    _, status = os.waitpid(pid, 0)
+    assert os.WIFEXITED(status) and os.WEXITSTATUS(status) == 0
+    assert Executors.get_executor() is parent
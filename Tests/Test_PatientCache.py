@@ -0,0 +1,162 @@
+from dicommodule.PatientCache import (_encode, _decode, save_patient_cache,
+                                      load_patient_cache)
+from dicommodule.Patient import Patient
+import numpy as np
+import os
+
+
+def test_info_round_trip():
+    info = {'UID2Ind': {'1.2.3': 0}, 'Ind2Loc': {0: 1.5, 1: 3.0},
+            'Pix2Pat': np.eye(4), 'NSlices': np.int64(2)}
+    decoded = _decode(_encode(info))
+    assert decoded['Ind2Loc'] == {0: 1.5, 1: 3.0}
+    assert decoded['UID2Ind'] == {'1.2.3': 0}
+    assert np.array_equal(decoded['Pix2Pat'], np.eye(4))
+    assert decoded['NSlices'] == 2
+
+
+def test_cache_invalidated_by_change(tmpdir):
+    patientDir = tmpdir.mkdir('patient')
+    dcmFile = patientDir.join('slice.dcm')
+    dcmFile.write('not really dicom')
+    cacheDir = str(tmpdir.join('cache'))
+
+    save_patient_cache(Patient(), cacheDir, str(patientDir))
+    assert load_patient_cache(Patient(), cacheDir, str(patientDir))
+
+    dcmFile.write('changed contents')
+    assert not load_patient_cache(Patient(), cacheDir, str(patientDir))
+
+
+def test_cache_invalidated_by_mtime(tmpdir):
+    patientDir = tmpdir.mkdir('patient')
+    dcmFile = patientDir.join('slice.dcm')
+    dcmFile.write('not really dicom')
+    cacheDir = str(tmpdir.join('cache'))
+
+    save_patient_cache(Patient(), cacheDir, str(patientDir))
+    assert load_patient_cache(Patient(), cacheDir, str(patientDir))
+
+    # same size and contents, touched later
+    stat = os.stat(str(dcmFile))
+    os.utime(str(dcmFile), ns=(stat.st_atime_ns,
+                               stat.st_mtime_ns + 1000000000))
+    assert not load_patient_cache(Patient(), cacheDir, str(patientDir))
+
+
+def test_cache_round_trip(tmpdir):
+    from dicommodule.SyntheticData import make_patient
+
+    patientDir = str(tmpdir.join('patient'))
+    make_patient(patientDir, nSlices=12, rows=48, cols=40)
+    cacheDir = str(tmpdir.join('cache'))
+
+    original = Patient(patientDir, cache_dir=cacheDir)  # reads and saves
+    edited = original.StructureSet.ROI_List[0]
+    edited.mark_dirty([3, 4])
+    original.StructureSet.ROI_List[1].mark_dirty()
+    save_patient_cache(original, cacheDir, patientDir,
+                       {'series_uid': None, 'reverse_rotation': False,
+                        'lazy_image': False, 'mask_storage': 'uint8'})
+
+    cached = Patient(patientDir, cache_dir=cacheDir)
+    assert isinstance(cached.Image.data, np.memmap)
+    assert cached.patientContents == original.patientContents
+    assert np.array_equal(cached.Image.data, original.Image.data)
+    assert _encode(cached.Image.info) == _encode(original.Image.info)
+    assert cached.Image.ImageModality == original.Image.ImageModality
+
+    assert len(cached.StructureSet.ROI_List) == \
+        len(original.StructureSet.ROI_List)
+    for mine, theirs in zip(cached.StructureSet.ROI_List,
+                            original.StructureSet.ROI_List):
+        assert (mine.Name, mine.Number) == (theirs.Name, theirs.Number)
+        assert list(mine.Color) == list(theirs.Color)
+        assert np.array_equal(np.asarray(mine.DataVolume),
+                              np.asarray(theirs.DataVolume))
+        assert mine.dirtySlices == theirs.dirtySlices
+        assert mine.allDirty == theirs.allDirty
+    assert cached.StructureSet.ROI_List[0].dirtySlices == {3, 4}
+    assert cached.StructureSet.ROI_List[1].allDirty
+    assert not cached.StructureSet.ROI_List[2].isDirty()
+
+    assert np.array_equal(cached.Dose.DoseGrid, original.Dose.DoseGrid)
+    assert _encode(cached.Dose.info) == _encode(original.Dose.info)
+    # a new grid as far as DVHs and resampling are concerned
+    assert cached.Dose.version > 0
+    assert cached.Dose.maxDose == original.Dose.maxDose
+
+
+def test_cache_keyed_on_load_options(tmpdir):
+    from dicommodule.SyntheticData import make_patient
+    from dicommodule.ROI_Masks import MaskVolume
+
+    patientDir = str(tmpdir.join('patient'))
+    make_patient(patientDir, nSlices=8, rows=32, cols=32, dose=False)
+    cacheDir = str(tmpdir.join('cache'))
+
+    Patient(patientDir, cache_dir=cacheDir)
+    packed = Patient(patientDir, cache_dir=cacheDir, mask_storage='packed')
+    for ROI in packed.StructureSet.ROI_List:
+        assert isinstance(ROI.DataVolume, MaskVolume)
+    again = Patient(patientDir, cache_dir=cacheDir, mask_storage='packed')
+    assert again.StructureSet.ROI_List[0].storage == 'packed'
+
+
+def test_cache_keeps_mask_storage(tmpdir):
+    from dicommodule.SyntheticData import make_patient
+    from dicommodule.ROI_Masks import MaskVolume
+
+    patientDir = str(tmpdir.join('patient'))
+    make_patient(patientDir, nSlices=8, rows=32, cols=32, dose=False)
+    dense = Patient(patientDir)
+
+    for storage in ('packed', 'cropped', 'rle', 'lazy'):
+        cacheDir = str(tmpdir.join(storage))
+        original = Patient(patientDir, cache_dir=cacheDir,
+                           mask_storage=storage)
+        # an edited slice has to survive too, not just the contours
+        ROI = original.StructureSet.ROI_List[0]
+        z = ROI.DataVolume.shape[2] // 2
+        edit = np.array(ROI.DataVolume[:, :, z])
+        edit[:2, :2] = 1
+        ROI.DataVolume[:, :, z] = edit
+        save_patient_cache(original, cacheDir, patientDir,
+                           {'series_uid': None, 'reverse_rotation': False,
+                            'lazy_image': False, 'mask_storage': storage})
+        # no dense copies of the masks
+        assert not [name for name in os.listdir(cacheDir)
+                    if name.startswith('roi_') and name.endswith('.npy')]
+
+        cached = Patient(patientDir, cache_dir=cacheDir,
+                         mask_storage=storage)
+        for mine, theirs, plain in zip(cached.StructureSet.ROI_List,
+                                       original.StructureSet.ROI_List,
+                                       dense.StructureSet.ROI_List):
+            assert isinstance(mine.DataVolume, MaskVolume)
+            assert type(mine.DataVolume) is type(theirs.DataVolume)
+            assert np.array_equal(np.asarray(mine.DataVolume),
+                                  np.asarray(theirs.DataVolume))
+            if mine is not cached.StructureSet.ROI_List[0]:
+                assert np.array_equal(np.asarray(mine.DataVolume),
+                                      plain.DataVolume)
+
+
+def test_cache_keeps_image_lazy(tmpdir):
+    from dicommodule.SyntheticData import make_patient
+    from dicommodule.LazyVolume import LazyVolume
+
+    patientDir = str(tmpdir.join('patient'))
+    make_patient(patientDir, nSlices=8, rows=32, cols=32, dose=False)
+    cacheDir = str(tmpdir.join('cache'))
+    eager = Patient(patientDir)
+
+    Patient(patientDir, cache_dir=cacheDir, lazy_image=True)
+    assert not os.path.exists(os.path.join(cacheDir, 'image.npy'))
+
+    cached = Patient(patientDir, cache_dir=cacheDir, lazy_image=True)
+    assert isinstance(cached.Image.data, LazyVolume)
+    assert cached.Image.data.dtype == eager.Image.data.dtype
+    assert np.array_equal(cached.Image.data[:, :, 3],
+                          eager.Image.data[:, :, 3])
+    assert np.array_equal(np.asarray(cached.Image.data), eager.Image.data)
@@ -0,0 +1,198 @@
+from dicommodule.Patient_Image import (Patient_Image, getPixelDtype,
+                                       memmapPixelData)
+from dicommodule.HeaderIndex import build_header_index
+import dicommodule.HeaderIndex as HeaderIndex
+import dicommodule.Patient_Image as Patient_Image_module
+from dicommodule.LazyVolume import LazyVolume
+import numpy as np
+import pytest
+try:
+    import dicom as dicom
+except ImportError:
+    import pydicom as dicom
+
+CT = '1.2.840.10008.5.1.4.1.1.2'
+US_MULTIFRAME = '1.2.840.10008.5.1.4.1.1.3.1'
+EXPLICIT_VR_LE = '1.2.840.10008.1.2.1'
+IMPLICIT_VR_LE = '1.2.840.10008.1.2'
+
+
+def write_image(path, pixels, position=(0.0, 0.0, 0.0), sopClass=CT,
+                transferSyntax=EXPLICIT_VR_LE):
+    """ [rows, cols] slice, or [frames, rows, cols] multiframe, stored with
+        pixels' own dtype """
+    meta = dicom.dataset.FileMetaDataset()
+    meta.MediaStorageSOPClassUID = sopClass
+    meta.MediaStorageSOPInstanceUID = dicom.uid.generate_uid()
+    meta.TransferSyntaxUID = transferSyntax
+    ds = dicom.dataset.FileDataset(path, {}, file_meta=meta,
+                                     preamble=b'\0' * 128)
+    ds.is_little_endian = True
+    ds.is_implicit_VR = transferSyntax == IMPLICIT_VR_LE
+    ds.SOPClassUID = sopClass
+    ds.SOPInstanceUID = meta.MediaStorageSOPInstanceUID
+    ds.PatientName = 'Test^Image'
+    ds.PatientPosition = 'HFS'
+    ds.ImageOrientationPatient = [1, 0, 0, 0, 1, 0]
+    ds.ImagePositionPatient = list(position)
+    ds.PixelSpacing = [0.5, 0.5]
+    ds.SliceThickness = 2.0
+    if pixels.ndim == 3:
+        ds.NumberOfFrames = pixels.shape[0]
+    ds.Rows, ds.Columns = pixels.shape[-2:]
+    ds.SamplesPerPixel = 1
+    ds.PhotometricInterpretation = 'MONOCHROME2'
+    ds.BitsAllocated = ds.BitsStored = pixels.dtype.itemsize * 8
+    ds.HighBit = ds.BitsStored - 1
+    ds.PixelRepresentation = int(pixels.dtype.kind == 'i')
+    data = pixels.astype(pixels.dtype.newbyteorder('<')).tobytes()
+    ds.PixelData = data + b'\0' * (len(data) % 2)  # even length
+    ds.save_as(path, write_like_original=False)
+    return path
+
+
+def test_pixel_dtype_from_header():
+    for bits, signed, dtype in [(8, 0, np.uint8), (8, 1, np.int8),
+                                (16, 0, np.uint16), (16, 1, np.int16),
+                                (32, 0, np.uint32), (32, 1, np.int32),
+                                (None, None, np.uint16)]:
+        header = {'BitsAllocated': bits, 'PixelRepresentation': signed}
+        assert getPixelDtype(header) == dtype
+
+
+def test_slices_decoded_in_position_order(tmpdir, monkeypatch):
+    rng = np.random.default_rng(5)
+    slices = [rng.integers(-1000, 1000, (6, 8)).astype(np.int16)
+              for z in range(5)]
+    # written (and listed) out of position order
+    order = [3, 0, 4, 1, 2]
+    fileList = [write_image(str(tmpdir.join('CT{}.dcm'.format(n))),
+                            slices[z], position=(0.0, 0.0, 2.0 * z))
+                for n, z in enumerate(order)]
+    headerIndex = build_header_index(fileList)
+
+    # geometry and order come from the index; no header is read again
+    def no_reads(filePath):
+        raise AssertionError("re-read the header of {}".format(filePath))
+    monkeypatch.setattr(HeaderIndex, 'read_dicom_header', no_reads)
+    monkeypatch.setattr(Patient_Image_module, 'read_dicom_header', no_reads)
+
+    image = Patient_Image()
+    image.setData(fileList=fileList, headerIndex=headerIndex)
+    assert image.data.dtype == np.int16
+    assert image.data.shape == (6, 8, 5)
+    for z in range(5):
+        assert np.array_equal(image.data[:, :, z], slices[z])
+        assert image.info['Ind2UID'][z] == \
+            headerIndex[fileList[order.index(z)]]['SOPInstanceUID']
+    assert image.info['SliceSpacing'] == 2.0
+
+
+def counting_loader(volume):
+    """ loader over a dense [Rows, Cols, NSlices] array, with a log """
+    loads = []
+
+    def loader(index):
+        loads.append(index)
+        return volume[:, :, index].copy()
+    return loader, loads
+
+
+def test_lazy_volume_indexing_matches_numpy():
+    dense = np.arange(4 * 5 * 6, dtype=np.int16).reshape((4, 5, 6))
+    loader, loads = counting_loader(dense)
+    lazy = LazyVolume(dense.shape, np.int16, loader)
+    assert lazy.shape == dense.shape and len(lazy) == 4
+    assert loads == []  # nothing decoded up front
+
+    for key in [(slice(None), slice(None), 2), (Ellipsis, -1), 3,
+                (1, 2, 3), (slice(1, 3), slice(None, None, 2), slice(4)),
+                (Ellipsis, slice(2, 5)), (slice(None), -2),
+                (slice(None), slice(None), slice(5, 1, -2)), Ellipsis]:
+        assert np.array_equal(lazy[key], dense[key]), key
+    assert np.array_equal(lazy[[0, 2]], dense[[0, 2]])  # fancy: dense
+    assert np.array_equal(np.asarray(lazy), dense)
+
+    swapped = lazy.swapaxes(0, 1)
+    assert swapped.shape == (5, 4, 6)
+    assert swapped.cache is lazy.cache
+    for key in [(Ellipsis, 4), (2, slice(None), slice(1, 3)), (0, 1, 2)]:
+        assert np.array_equal(swapped[key],
+                              np.swapaxes(dense, 0, 1)[key]), key
+    slabs = lazy.swapaxes(1, 2)
+    assert np.array_equal(slabs[:, 3], dense[:, :, 3])
+
+    with pytest.raises(IndexError):
+        lazy[:, :, 6]
+    with pytest.raises(IndexError):
+        lazy[0, 0, 0, 0]
+
+
+def test_lazy_volume_evicts_to_budget():
+    dense = np.ones((10, 10, 6), dtype=np.uint16)  # 200 bytes a slice
+    loader, loads = counting_loader(dense)
+    lazy = LazyVolume(dense.shape, np.uint16, loader, budget=500)
+
+    for index in (0, 1, 2):
+        lazy[:, :, index]
+    assert loads == [0, 1, 2]
+    assert lazy.cache.nbytes == 400  # slice 0 made way for slice 2
+
+    lazy[:, :, 1]  # cached: no decode, and now most recently used
+    assert loads == [0, 1, 2]
+    lazy[:, :, 3]  # evicts 2, the least recently used
+    lazy[:, :, 1]
+    lazy[:, :, 2]
+    assert loads == [0, 1, 2, 3, 2]
+    lazy[:, :, 0]
+    assert loads == [0, 1, 2, 3, 2, 0]
+    assert lazy.cache.nbytes <= 500
+
+    # a single slice over budget is still kept
+    tiny = LazyVolume(dense.shape, np.uint16, loader, budget=10)
+    tiny[:, :, 4]
+    tiny[:, :, 4]
+    assert loads[-2:] == [0, 4] and tiny.cache.nbytes == 200
+
+
+def test_lazy_image_matches_eager(tmpdir):
+    fileList = [write_image(str(tmpdir.join('CT{}.dcm'.format(z))),
+                            np.full((6, 8), z * 10, dtype=np.uint16),
+                            position=(0.0, 0.0, 2.0 * z))
+                for z in range(4)]
+    eager = Patient_Image(fileList=fileList)
+    lazy = Patient_Image(fileList=fileList, lazy=True)
+    assert isinstance(lazy.data, LazyVolume)
+    assert lazy.data.cache.nbytes == 0
+    assert np.array_equal(lazy.data[:, :, 2], eager.data[:, :, 2])
+    assert np.array_equal(np.asarray(lazy.data), eager.data)
+
+
+def test_multiframe_memmap_matches_pixel_array(tmpdir):
+    rng = np.random.default_rng(7)
+    for transferSyntax in (EXPLICIT_VR_LE, IMPLICIT_VR_LE):
+        for dtype in (np.uint8, np.uint16, np.int16, np.int32):
+            info = np.iinfo(dtype)
+            frames = rng.integers(max(info.min, -3000), min(info.max, 3000),
+                                  (3, 5, 7)).astype(dtype)
+            path = write_image(str(tmpdir.join('US.dcm')), frames,
+                               sopClass=US_MULTIFRAME,
+                               transferSyntax=transferSyntax)
+            header = HeaderIndex.read_dicom_header(path)
+            mapped = memmapPixelData(path, header)
+            assert isinstance(mapped, np.memmap), (transferSyntax, dtype)
+            assert mapped.dtype == np.dtype(dtype)
+            assert np.array_equal(mapped, dicom.dcmread(path).pixel_array)
+            assert np.array_equal(mapped, frames)
+            del mapped
+
+
+def test_multiframe_image_is_rows_cols_frames(tmpdir):
+    frames = np.arange(4 * 5 * 6, dtype=np.uint16).reshape((4, 5, 6))
+    path = write_image(str(tmpdir.join('US.dcm')), frames,
+                       sopClass=US_MULTIFRAME)
+    image = Patient_Image(fileList=[path])
+    assert image.data.shape == (5, 6, 4)  # [rows, cols, frames]
+    assert image.info['NSlices'] == 4
+    for f in range(4):
+        assert np.array_equal(image.data[:, :, f], frames[f])
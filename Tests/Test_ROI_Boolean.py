@@ -0,0 +1,43 @@
+from dicommodule.ROI_Boolean import combine_masks
+from dicommodule.ROI_Masks import as_mask
+from dicommodule.Patient_StructureSet import Patient_StructureSet
+import numpy as np
+
+
+def make_pair():
+    one = np.zeros((30, 20, 10), dtype=np.uint8)
+    two = np.zeros_like(one)
+    one[5:15, 5:15, 2:6] = 1
+    two[10:20, 8:12, 4:8] = 1
+    return one, two
+
+
+def test_combine_matches_numpy():
+    one, two = make_pair()
+    expected = {'union': one | two,
+                'intersection': one & two,
+                'difference': one & (1 - two),
+                'xor': one ^ two}
+    for storage in ('uint8', 'packed', 'cropped', 'rle'):
+        masks = [as_mask(one, storage), as_mask(two, storage)]
+        for operation, want in expected.items():
+            got = combine_masks(masks, operation, storage=storage,
+                                chunkSlices=3)
+            assert np.array_equal(np.asarray(got), want)
+
+
+def test_structure_set_algebra():
+    info = {'Cols': 30, 'Rows': 20, 'NSlices': 10}
+    SS = Patient_StructureSet(imageInfo=info)
+    one, two = make_pair()
+    SS.add_ROI(name='ptv', dataVolume=one, imageInfo=info)
+    SS.add_ROI(name='urethra', dataVolume=two, imageInfo=info)
+
+    ROI = SS.subtract_ROIs('ptv', ['urethra'], save_as='ptv_minus_urethra')
+    assert SS.ROI_byName['ptv_minus_urethra'] is ROI
+    assert ROI.allDirty
+    assert np.array_equal(np.asarray(ROI.DataVolume), one & (1 - two))
+
+    overlap = SS.intersect_ROIs(['ptv', 'urethra'])
+    assert overlap.Name == 'intersection_ptv_urethra'
+    assert overlap.stats.nVoxels == 5 * 4 * 2
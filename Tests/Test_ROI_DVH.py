@@ -0,0 +1,61 @@
+from dicommodule.SyntheticData import load_synthetic_patient
+import dicommodule.ROI_DVH as ROI_DVH
+import numpy as np
+
+
+def load_patient(tmpdir):
+    return load_synthetic_patient(str(tmpdir.join('patient')), nSlices=16,
+                                  rows=64, cols=64)
+
+
+def reference_doses(ROI, dose):
+    """ dose at every voxel of the ROI, one point at a time """
+    voxels = np.argwhere(np.asarray(ROI.DataVolume[:, :, :]))
+    points = np.c_[voxels, np.ones(len(voxels))].dot(
+        ROI.imageInfo['Pix2Pat'].T)[:, 0:3]
+    return dose.sample(points)
+
+
+def test_dvh_matches_voxel_doses(tmpdir):
+    patient = load_patient(tmpdir)
+    ROI = patient.StructureSet.get_ROI('prostate')
+    dvh = ROI.dvh(patient.Dose)
+    doses = reference_doses(ROI, patient.Dose)
+
+    assert np.isclose(dvh.volume, ROI.stats.volume)
+    assert np.isclose(dvh.Dmax, doses.max())
+    assert np.isclose(dvh.Dmean, doses.mean())
+    assert np.isclose(dvh.cumulative[0], dvh.volume)
+    assert abs(dvh.D(90) - np.percentile(doses, 10)) <= dvh.binWidth
+    metrics = dvh.metrics(prescription=10.0)
+    assert np.isclose(metrics['V100'], 100 * np.mean(doses >= 10.0),
+                      atol=0.5)
+    assert metrics['V200'] <= metrics['V150'] <= metrics['V100']
+
+
+def test_dvh_cached_until_edit(tmpdir):
+    patient = load_patient(tmpdir)
+    DVHs = patient.StructureSet.compute_DVHs(patient.Dose)
+    assert set(DVHs) == {'prostate', 'urethra', 'rectum'}
+
+    ROI = patient.StructureSet.get_ROI('rectum')
+    assert ROI.dvh(patient.Dose) is DVHs['rectum']
+    z = ROI.stats.sliceRange[0]
+    ROI.set_slice(z, np.zeros(ROI.volSize[0:2]))
+    assert ROI.dvh(patient.Dose) is not DVHs['rectum']
+    assert ROI.dvh(patient.Dose).volume < DVHs['rectum'].volume
+
+    isodose = patient.Dose.thresholdDose(10.0)
+    assert isodose.shape == patient.Dose.DoseGrid.shape
+    assert isodose.any() and not isodose.all()
+
+
+def test_dvh_of_box_without_mask(tmpdir):
+    patient = load_patient(tmpdir)
+    ROI = patient.StructureSet.get_ROI('urethra')
+    empty = np.array([[0, 0, 0], [4, 4, 2]])  # corner the ROI misses
+    dvh = ROI_DVH.compute_dvh(ROI.DataVolume, ROI.imageInfo, patient.Dose,
+                              bbox=empty)
+    assert dvh.volume == 0
+    assert dvh.Dmax == 0 and dvh.Dmin == 0 and dvh.Dmean == 0
+    assert dvh.D(90) == 0 and dvh.V(10.0) == 0
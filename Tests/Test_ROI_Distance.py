@@ -0,0 +1,70 @@
+from dicommodule.Patient_ROI import Patient_ROI_Obj
+from dicommodule.ROI_Distance import SignedDistanceField
+from dicommodule.SyntheticData import make_image_info
+import numpy as np
+
+
+def make_ROI():
+    info = make_image_info(cols=60, rows=50, nSlices=20,
+                           origin=(-20.0, -10.0, 40.0))
+    ROI = Patient_ROI_Obj(imageInfo=info)
+    for z in range(6, 14):
+        ImSlice = ROI.get_slice(z)
+        ImSlice[20:40, 15:35] = 1
+        ROI.set_slice(z, ImSlice)
+    return ROI
+
+
+def test_distances_in_mm():
+    ROI = make_ROI()
+    field = ROI.distance_field(band=5.0)
+    assert field.field.dtype == np.float32
+
+    # voxel [30, 25, 9]: 10 voxels from the nearest side, whose face is
+    # half a voxel nearer: 4.75 mm
+    assert np.isclose(field.sample([30, 25, 9]), -4.75)
+    # 3 voxels outside in x (1.25 mm to the face); 2 slices beyond the top
+    # (3 mm); far enough to be clamped
+    assert np.isclose(field.sample([42, 25, 9]), 1.25)
+    assert np.isclose(field.sample([30, 25, 15]), 3.0)
+    assert np.isclose(field.sample([30, 25, 18]), 5.0)
+    # patient space: voxel [42, 25, 9] is at (1, 2.5, 58) mm
+    assert np.isclose(ROI.distance([[1.0, 2.5, 58.0]]), 1.25)
+    # trilinear between voxel centres; zero on the face
+    assert np.isclose(field.sample([41.5, 25, 9]), 1.0)
+    assert np.isclose(field.sample([39.5, 25, 9]), 0.0)
+    assert ROI.distance_field(band=5.0) is field
+
+
+def test_edits_update_the_field():
+    ROI = make_ROI()
+    field = ROI.distance_field(band=5.0)
+    ImSlice = ROI.get_slice(9)
+    ImSlice[28:32, 22:26] = 0
+    ROI.set_slice(9, ImSlice)
+
+    updated = ROI.distance_field(band=5.0)
+    rebuilt = SignedDistanceField(ROI.DataVolume, [0.5, 0.5, 2.0], band=5.0)
+    assert updated is field
+    assert np.array_equal(updated.origin, rebuilt.origin)
+    assert np.allclose(updated.field, rebuilt.field)
+    assert np.isclose(updated.sample([30, 24, 9]), 0.75)
+
+
+def test_distances_run_to_the_voxel_faces():
+    volume = np.zeros((20, 20, 10), dtype=np.uint8)
+    volume[5:10, 5:10, 2:6] = 1
+    spacing = [0.5, 0.8, 2.0]
+    field = SignedDistanceField(volume, spacing, band=20.0)
+
+    # straight out of each face: the steps less half a voxel
+    assert np.isclose(field.sample([12, 7, 3]), 3 * 0.5 - 0.25)
+    assert np.isclose(field.sample([7, 3, 3]), 2 * 0.8 - 0.4)
+    assert np.isclose(field.sample([7, 7, 8]), 3 * 2.0 - 1.0)
+    # off a corner: to the corner of the last voxel's box
+    assert np.isclose(field.sample([11, 12, 3]),
+                      np.hypot(2 * 0.5 - 0.25, 3 * 0.8 - 0.4))
+    # inside, by the same rule, and symmetric across a face
+    assert np.isclose(field.sample([6, 7, 4]), -(2 * 0.5 - 0.25))
+    assert np.isclose(field.sample([9, 7, 3]), -0.25)
+    assert np.isclose(field.sample([10, 7, 3]), 0.25)
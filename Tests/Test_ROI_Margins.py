@@ -0,0 +1,38 @@
+from dicommodule.ROI_Manipulations import margin_mask
+from dicommodule.Patient_StructureSet import Patient_StructureSet
+import numpy as np
+
+
+def test_margin_honours_spacing():
+    volume = np.zeros((40, 40, 20), dtype=np.uint8)
+    volume[20, 20, 10] = 1
+    spacing = [0.5, 0.5, 2.0]
+
+    grown = np.asarray(margin_mask(volume, 2.0, spacing))
+    # 2 mm is 4 voxels in-plane, but only 1 slice out of plane
+    assert grown[16:25, 20, 10].all() and not grown[15, 20, 10]
+    assert grown[20, 20, 9:12].all() and not grown[20, 20, 8]
+
+    # grow then shrink by the same margin gets the point back
+    shrunk = np.asarray(margin_mask(grown, -2.0, spacing))
+    assert np.array_equal(shrunk, volume)
+
+    # no margin out of plane
+    flat = np.asarray(margin_mask(volume, [2.0, 2.0, 0], spacing))
+    assert flat[:, :, 10].sum() > 1 and flat[:, :, [9, 11]].sum() == 0
+
+
+def test_structure_set_margin():
+    info = {'Cols': 30, 'Rows': 30, 'NSlices': 10,
+            'PixelSpacing': [1.0, 1.0], 'SliceSpacing': 1.0}
+    SS = Patient_StructureSet(imageInfo=info, maskStorage='cropped')
+    volume = np.zeros((30, 30, 10), dtype=np.uint8)
+    volume[10:20, 10:20, 3:7] = 1
+    SS.add_ROI(name='Prostate', dataVolume=volume, imageInfo=info,
+               storage='cropped')
+
+    PTV = SS.margin_ROI('prostate', 3, save_as='ptv')
+    assert PTV.stats.bbox.tolist() == [[7, 7, 0], [23, 23, 10]]
+    CTV = SS.margin_ROI('Prostate', -1)
+    assert CTV.Name == 'Prostate_margin'
+    assert CTV.stats.bbox.tolist() == [[11, 11, 4], [19, 19, 6]]
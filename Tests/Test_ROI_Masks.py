@@ -0,0 +1,132 @@
+from dicommodule.ROI_Masks import (new_mask, as_mask, get_view_slice,
+                                   fill_contours)
+from dicommodule.Patient_ROI import ImageArray2CVContour
+import numpy as np
+import pytest
+
+
+def random_mask(shape=(13, 10, 4)):
+    return (np.random.RandomState(0).rand(*shape) > 0.5).astype(np.uint8)
+
+
+def test_packed_mask_round_trip():
+    dense = random_mask()
+    packed = as_mask(dense, 'packed')
+    assert packed.nbytes < dense.nbytes
+    assert np.array_equal(np.asarray(packed), dense)
+    assert np.array_equal(packed[:, :, 2], dense[:, :, 2])
+
+
+def test_packed_mask_slice_writes_are_binary():
+    packed = new_mask((13, 10, 4), 'packed')
+    image = np.zeros((13, 10), dtype=np.uint8)
+    image[2:5, 3:7] = 255
+    packed[:, :, 1] = image
+    assert np.array_equal(packed[:, :, 1], image > 0)
+    assert np.asarray(packed).sum() == 12
+
+
+def test_view_slice_matches_swapaxes():
+    dense = random_mask()
+    packed = as_mask(dense, 'packed')
+    for planeInd in range(3):
+        expected = np.swapaxes(dense, planeInd, 2)[:, :, 3]
+        assert np.array_equal(get_view_slice(dense, planeInd, 3), expected)
+        assert np.array_equal(get_view_slice(packed, planeInd, 3), expected)
+
+
+def test_cropped_mask_grows_and_crops():
+    cropped = as_mask(np.zeros((40, 30, 5), dtype=np.uint8), 'cropped')
+    assert cropped.nbytes == 0
+    image = np.zeros((40, 30), dtype=np.uint8)
+    image[10:12, 5:8] = 255
+    cropped[:, :, 1] = image
+    image[30:33, 20:22] = 255  # outside the current box
+    cropped[:, :, 3] = image
+    assert np.array_equal(cropped[:, :, 3], image > 0)
+    cropped.crop()
+    assert cropped.bbox.tolist() == [[10, 5, 1], [33, 22, 4]]
+    assert np.asarray(cropped).sum() == 6 + 12
+
+
+def test_rle_mask_matches_dense():
+    a, b = random_mask(), random_mask()[::-1].copy()
+    rleA, rleB = as_mask(a, 'rle'), as_mask(b, 'rle')
+    assert np.array_equal(np.asarray(rleA), a)
+    assert rleA.area() == a.sum()
+    assert np.array_equal(np.asarray(rleA.union(rleB)), a | b)
+    assert np.array_equal(np.asarray(rleA.intersection(rleB)), a & b)
+
+
+def test_rle_contours_match_dense():
+    dense = np.zeros((60, 50, 1), dtype=np.uint8)
+    dense[5:20, 10:30, 0] = 1
+    dense[8:12, 15:20, 0] = 0  # a hole
+    dense[40:60, 0:8, 0] = 1  # touching the image edge
+    expected = ImageArray2CVContour(dense[:, :, 0].T)
+    contours = as_mask(dense, 'rle').cv_contours(0)
+    assert len(contours) == len(expected)
+    for contour, other in zip(contours, expected):
+        assert np.array_equal(contour, other)
+
+
+def test_lazy_mask_fills_on_read():
+    square = np.array([[5, 5], [15, 5], [15, 12], [5, 12]],
+                      dtype=np.int32).reshape((-1, 1, 2))
+    lazy = as_mask(np.zeros((40, 30, 5), dtype=np.uint8), 'lazy')
+    lazy.set_contours({2: [square]})
+    assert lazy.slices == {}
+    assert lazy[:, :, 2][10, 8] == 1 and lazy[:, :, 2][20, 8] == 0
+    assert list(lazy.slices) == [2]
+
+    lazy.set_contours({2: [square + 10]})  # invalidates the filled slice
+    assert lazy.slices == {}
+    assert lazy[:, :, 2][20, 18] == 1 and lazy[:, :, 2][10, 8] == 0
+
+
+def test_slice_index_out_of_range_raises():
+    for storage in ('packed', 'cropped', 'rle', 'lazy'):
+        mask = new_mask((10, 8, 4), storage)
+        mask.set_slice(-1, np.ones((10, 8)))  # negative counts from the end
+        assert np.asarray(mask)[:, :, 3].all()
+        for z in (4, -5):
+            with pytest.raises(IndexError):
+                mask.get_slice(z)
+            with pytest.raises(IndexError):
+                mask.set_slice(z, np.ones((10, 8)))
+            with pytest.raises(IndexError):
+                mask[:, :, z]
+        assert np.asarray(mask)[:, :, 0:3].sum() == 0
+
+
+def test_partial_writes_touch_only_their_slices():
+    square = np.array([[5, 5], [15, 5], [15, 12], [5, 12]],
+                      dtype=np.int32).reshape((-1, 1, 2))
+    lazy = new_mask((40, 30, 6), 'lazy')
+    lazy.set_contours({z: [square] for z in range(6)})
+    lazy[3, 4, 2] = 1
+    lazy[0:2, :, 4:6] = 1
+    assert sorted(lazy.slices) == [2, 4, 5]  # nothing else filled
+
+    reference = new_mask((40, 30, 6), 'lazy')
+    reference.set_contours({z: [square] for z in range(6)})
+    dense = np.asarray(reference)
+    dense[3, 4, 2] = 1
+    dense[0:2, :, 4:6] = 1
+    assert np.array_equal(np.asarray(lazy), dense)
+    picks = (np.array([3, 10, 0]), np.array([4, 8, 29]), np.array([2, 0, 5]))
+    assert np.array_equal(lazy[picks], dense[picks])
+
+
+def test_fill_contours_keeps_holes():
+    ImSlice = np.zeros((40, 30), dtype=np.uint8)
+    ImSlice[5:35, 5:25] = 1
+    ImSlice[12:28, 10:20] = 0  # a hole
+    ImSlice[15:20, 13:17] = 1  # an island in it
+    contours = ImageArray2CVContour(ImSlice.T)
+    assert len(contours) == 3
+
+    x0, y0, patch = fill_contours(contours, 40, 30)
+    filled = np.zeros_like(ImSlice)
+    filled[x0:x0 + patch.shape[0], y0:y0 + patch.shape[1]] = patch > 0
+    assert np.array_equal(filled, ImSlice)
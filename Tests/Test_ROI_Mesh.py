@@ -0,0 +1,52 @@
+from dicommodule.Patient_ROI import Patient_ROI_Obj
+from dicommodule.SyntheticData import make_image_info
+import numpy as np
+import os
+
+
+def make_ROI():
+    info = make_image_info(cols=40, rows=30, nSlices=12,
+                           pixelSpacing=(0.8, 0.5), sliceSpacing=3.0,
+                           origin=(-10.0, 4.0, 20.0))
+    ROI = Patient_ROI_Obj(name='prostate', imageInfo=info)
+    grid = np.ogrid[:40, :30]
+    disc = ((grid[0] - 20) / 12.) ** 2 + ((grid[1] - 15) / 9.) ** 2 <= 1
+    for z in range(3, 9):
+        ROI.set_slice(z, disc)
+    return ROI
+
+
+def test_mesh_in_patient_space(tmpdir):
+    ROI = make_ROI()
+    mesh = ROI.mesh()
+
+    # closed: every edge is shared by exactly two triangles
+    edges = np.sort(np.concatenate([mesh.faces[:, [0, 1]],
+                                    mesh.faces[:, [1, 2]],
+                                    mesh.faces[:, [2, 0]]]), axis=1)
+    assert set(np.unique(edges, axis=0, return_counts=True)[1]) == {2}
+    # normals outwards, and about the mask's volume and place
+    assert abs(mesh.volume - ROI.stats.volume) < 0.1 * ROI.stats.volume
+    assert np.allclose(mesh.verts.mean(axis=0), ROI.stats.centroid_mm,
+                       atol=0.5)
+    assert mesh.verts[:, 2].min() > 20.0 + 3 * 3.0 - 3.0
+    assert ROI.mesh() is mesh
+
+    coarse = ROI.mesh(decimate=2.0)
+    assert len(coarse.faces) < len(mesh.faces)
+
+    stlPath = str(tmpdir.join('prostate.stl'))
+    ROI.save_mesh(stlPath)
+    assert os.path.getsize(stlPath) == 84 + 50 * len(mesh.faces)
+    plyPath = str(tmpdir.join('prostate.ply'))
+    ROI.save_mesh(plyPath)
+    with open(plyPath, 'rb') as fp:
+        assert fp.read(3) == b'ply'
+
+
+def test_mesh_redone_after_edit():
+    ROI = make_ROI()
+    mesh = ROI.mesh()
+    ROI.set_slice(5, np.zeros((40, 30)))
+    assert ROI.mesh() is not mesh
+    assert ROI.mesh().volume < mesh.volume
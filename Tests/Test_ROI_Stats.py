@@ -0,0 +1,56 @@
+from dicommodule.ROI_Stats import ROIStats
+from dicommodule.ROI_Manipulations import findBoundingCuboid
+from dicommodule.Patient_ROI import Patient_ROI_Obj
+from dicommodule.SyntheticData import make_image_info
+import scipy.ndimage as spnd
+import numpy as np
+
+
+def test_stats_of_a_box():
+    volume = np.zeros((40, 30, 10), dtype=np.uint8)
+    volume[10:20, 5:9, 2:5] = 1
+    stats = ROIStats(volume, make_image_info())
+
+    assert stats.nVoxels == 120
+    assert stats.volume == 120 * 0.5 * 0.5 * 2.0 / 1000
+    assert stats.bbox.tolist() == [[10, 5, 2], [20, 9, 5]]
+    assert stats.sliceRange == (2, 4)
+    assert np.allclose(stats.centroid, spnd.center_of_mass(volume))
+    assert np.allclose(stats.centroid_mm, [7.25, 3.25, 6.0])
+    assert np.allclose(stats.extent_mm, [5.0, 2.0, 6.0])
+
+    # same answer as the slice-by-slice contour search it replaced
+    bounds, rectSize = findBoundingCuboid(volume)
+    assert bounds.tolist() == [[10, 5, 2], [21, 10, 7]]
+    assert rectSize.tolist() == [10, 4, 4]
+
+
+def test_stats_follow_edits():
+    info = make_image_info()
+    for storage in ('uint8', 'packed', 'cropped', 'rle'):
+        ROI = Patient_ROI_Obj(imageInfo=info, storage=storage)
+        assert ROI.stats.isEmpty()
+
+        ImSlice = ROI.get_slice(3)
+        ImSlice[4:8, 4:8] = 1
+        ROI.set_slice(3, ImSlice)
+        assert ROI.stats.nVoxels == 16
+        assert ROI.stats.sliceRange == (3, 3)
+
+        ROI.set_slice(3, np.zeros_like(ImSlice))
+        assert ROI.stats.isEmpty()
+
+
+def test_stats_of_lazy_mask_keep_no_slices():
+    from dicommodule.ROI_Masks import as_mask
+
+    square = np.array([[[5, 4]], [[5, 11]], [[14, 11]], [[14, 4]]],
+                      dtype=np.int32)
+    lazy = as_mask(np.zeros((40, 30, 10), dtype=np.uint8), 'lazy')
+    lazy.set_contours({z: [square] for z in (3, 4, 5)})
+    dense = np.asarray(lazy)
+
+    stats = ROIStats(lazy, make_image_info())
+    assert lazy.slices == {}  # looked at, not kept
+    assert stats.nVoxels == np.count_nonzero(dense)
+    assert stats.bbox.tolist() == ROIStats(dense).bbox.tolist()
@@ -0,0 +1,45 @@
+from dicommodule.ScanCache import ScanCache
+import os
+
+dummyHeader = {'FileName': 'slice.dcm',
+               'SOPClassUID': '1.2.840.10008.5.1.4.1.1.4',
+               'SeriesInstanceUID': '1.2.3.4',
+               'ImagePositionPatient': [-10.0, -20.0, 2.5],
+               'PixelSpacing': [0.5, 0.5],
+               'Rows': 64}
+
+
+def make_file(tmpdir, name='slice.dcm', contents=b'not really dicom'):
+    path = str(tmpdir.join(name))
+    with open(path, 'wb') as fp:
+        fp.write(contents)
+    return path
+
+
+def test_scan_cache_miss_on_unknown_file(tmpdir):
+    cache = ScanCache(str(tmpdir.join('scan.sqlite')))
+    path = make_file(tmpdir)
+    assert cache.get(path) is None
+
+
+def test_scan_cache_round_trip(tmpdir):
+    cache = ScanCache(str(tmpdir.join('scan.sqlite')))
+    path = make_file(tmpdir)
+    cache.put(path, dummyHeader)
+    assert cache.get(path) == dummyHeader
+
+
+def test_scan_cache_persists(tmpdir):
+    dbPath = str(tmpdir.join('scan.sqlite'))
+    path = make_file(tmpdir)
+    with ScanCache(dbPath) as cache:
+        cache.put(path, dummyHeader)
+    assert ScanCache(dbPath).get(path) == dummyHeader
+
+
+def test_scan_cache_invalidated_by_change(tmpdir):
+    cache = ScanCache(str(tmpdir.join('scan.sqlite')))
+    path = make_file(tmpdir)
+    cache.put(path, dummyHeader)
+    make_file(tmpdir, contents=b'a different, longer set of bytes')
+    assert cache.get(path) is None
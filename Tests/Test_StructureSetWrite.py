@@ -0,0 +1,93 @@
+from dicommodule.SyntheticData import make_patient
+from dicommodule.Patient import Patient
+import numpy as np
+import shutil
+import os
+
+
+def test_save_rewrites_only_edited_slices(tmpdir):
+    patientDir = str(tmpdir.join('patient'))
+    made = make_patient(patientDir, nSlices=12, rows=64, cols=64,
+                        dose=False)
+    patient = Patient(patientDir)
+    SS = patient.StructureSet
+    assert not any(ROI.isDirty() for ROI in SS.ROI_List)
+
+    # nothing edited: the file goes back out byte for byte
+    cleanDir = tmpdir.mkdir('clean')
+    SS.over_write_file(str(cleanDir))
+    with open(made['rtstruct'], 'rb') as fp:
+        original = fp.read()
+    assert cleanDir.join(SS.SSFile).read_binary() == original
+
+    ROI = SS.ROI_List[0]
+    sliceIndex = ROI.DataVolume.shape[2] // 2
+    ImSlice = ROI.get_slice(sliceIndex)
+    ImSlice[:, :] = 0
+    ImSlice[5:15, 5:15] = 1
+    ROI.set_slice(sliceIndex, ImSlice)
+    assert ROI.dirtySlices == {sliceIndex}
+
+    editedDir = str(tmpdir.join('edited'))
+    shutil.copytree(patientDir, editedDir)
+    os.remove(os.path.join(editedDir, SS.SSFile))
+    SS.over_write_file(editedDir)
+    assert not ROI.isDirty()
+
+    reloaded = Patient(editedDir).StructureSet
+    for ROI_ in SS.ROI_List:
+        assert np.array_equal(np.asarray(ROI_.DataVolume),
+                              np.asarray(reloaded.ROI_byName[ROI_.Name]
+                                         .DataVolume))
+
+
+def test_contour_data_fits_DS_and_matches_repr():
+    from dicommodule.Patient_ROI import PatientArray2ContourData
+
+    rng = np.random.RandomState(3)
+    points = np.concatenate([
+        rng.uniform(-500, 500, 3000),  # anywhere in a scanner
+        -249.51171875 + 0.9765625 * np.arange(300),  # a 512 grid
+        [0.1 + 0.2, -0.0, 1e-9, 99999.9999996, -12345.678901, 1e7]])
+    VectorArray = np.vstack((points.reshape((3, -1), order='F'),
+                             np.ones((1, len(points) // 3))))
+
+    ContourData = PatientArray2ContourData(VectorArray)
+    old = [str(x) for x in points]  # as written before: repr
+    assert len(ContourData) == len(old)
+    assert max(len(value) for value in ContourData) <= 16
+    assert np.abs(np.array(ContourData, dtype=float) -
+                  np.array(old, dtype=float)).max() <= 1e-6
+    assert PatientArray2ContourData(np.ones((4, 0))) == []
+
+
+def test_extracted_contours_match_full_slice_trace():
+    from dicommodule.Patient_ROI import (Patient_ROI_Obj,
+                                         ImageArray2CVContour)
+    from dicommodule.Patient_StructureSet import extract_ROI_contours
+    from dicommodule.Executors import get_executor
+
+    cols, rows, nSlices = 40, 36, 10
+    volume = np.zeros((cols, rows, nSlices), dtype=np.uint8)
+    x, y = np.mgrid[0:cols, 0:rows]
+    for z in range(1, 8):
+        volume[:, :, z] = (x - 20) ** 2 + (y - 18) ** 2 < (3 + 2 * z) ** 2
+    volume[16:24, 15:21, 4] = 0  # a hole
+    volume[0:6, 0:5, 6] = 1  # touching the image edges
+    volume[cols - 3:, rows - 2:, 7] = 1
+    volume[30:33, 2:4, 9] = 1  # away from the rest
+
+    for storage in ('uint8', 'bool', 'packed', 'cropped', 'rle', 'lazy'):
+        for compression in (0, 1.5):
+            ROI = Patient_ROI_Obj(name=storage, dataVolume=volume,
+                                  storage=storage)
+            ROI.polyCompression = compression
+            for executor in (None, get_executor()):
+                found = extract_ROI_contours([ROI], executor)[storage]
+                assert sorted(found) == [1, 2, 3, 4, 5, 6, 7, 9]
+                for z, contours in found.items():
+                    expected = ImageArray2CVContour(volume[:, :, z].T,
+                                                    compression)
+                    assert len(contours) == len(expected), (storage, z)
+                    for mine, theirs in zip(contours, expected):
+                        assert np.array_equal(mine, theirs), (storage, z)
@@ -0,0 +1,188 @@
+# Cohort.py
+"""
+    Cohort loader
+    Load many patient directories at once, one patient per worker process.
+    Image volumes, ROI masks and dose grids come back through shared memory
+    instead of being pickled through the pool's pipes, and a patient that
+    fails to load is reported without stopping the others.
+"""
+
+# Built-In Modules
+import pickle
+import traceback
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory, resource_tracker
+
+# Third-Party Modules
+import numpy as np
+
+# Locals
+from dicommodule.Executors import get_max_workers
+
+
+# arrays smaller than this are just pickled along with the patient
+SHARED_MIN_BYTES = 2 ** 20
+
+CohortResult = namedtuple('CohortResult', ['path', 'patient', 'error'])
+
+
+class SharedArray(object):
+    """ Picklable stand-in for an ndarray living in a shared memory block """
+
+    def __init__(self, array):
+        super().__init__()
+        array = np.ascontiguousarray(array)
+        self.shape = array.shape
+        self.dtype = array.dtype.str
+        shm = _create_block(array.nbytes)
+        try:
+            np.ndarray(self.shape, self.dtype, buffer=shm.buf)[...] = array
+        except Exception:
+            shm.close()
+            shm.unlink()
+            raise
+        self.name = shm.name
+        shm.close()
+
+    def attach(self):
+        """ (ndarray, block): the array stays valid while block is alive """
+        shm = shared_memory.SharedMemory(name=self.name)
+        array = np.ndarray(self.shape, self.dtype, buffer=shm.buf)
+        # the name goes now; the mapping lasts until shm is closed
+        shm.unlink()
+        return array, shm
+
+    def release(self):
+        """ free the block without attaching it """
+        try:
+            shm = shared_memory.SharedMemory(name=self.name)
+        except FileNotFoundError:  # already gone
+            return
+        shm.close()
+        shm.unlink()
+
+
+def load_patients(paths, workers=None, parts=('image', 'ROI'),
+                  **patientKwargs):
+    """ Load each directory in paths as a Patient, in a process pool
+
+        ~~ INPUTS ~~
+        - paths (list of strs): patient directories
+        - workers (int): number of processes (default: Executors setting)
+        - parts (tuple): any of 'image', 'ROI', 'plan', 'dose'
+        - patientKwargs: passed to each Patient(), e.g. reverse_rotation
+
+        Yields CohortResult(path, patient, error) in the order patients
+        finish; exactly one of patient / error is None. A patient's arrays
+        stay mapped while patient.sharedBlocks is alive. Stopping early
+        (break) cancels patients not yet started and frees the shared
+        memory of those loaded but not handed out.
+    """
+    if workers is None:
+        workers = get_max_workers()
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(_load_patient, path, parts, patientKwargs):
+                   path for path in paths}
+        unclaimed = set(futures)
+
+        try:
+            for future in as_completed(futures):
+                unclaimed.discard(future)
+                path = futures[future]
+                try:
+                    patient, error = future.result()
+                except Exception:  # the worker itself died
+                    patient, error = None, traceback.format_exc()
+
+                if patient is not None:
+                    try:
+                        _attach_arrays(patient)
+                    except Exception:
+                        _release_arrays(patient)
+                        patient, error = None, traceback.format_exc()
+                yield CohortResult(path, patient, error)
+        finally:
+            # left early (break, or an error): free what nobody will attach
+            for future in unclaimed:
+                future.cancel()
+            for future in unclaimed:
+                if future.cancelled():
+                    continue
+                try:
+                    patient, error = future.result()
+                except Exception:
+                    continue
+                if patient is not None:
+                    _release_arrays(patient)
+
+
+def _load_patient(path, parts, patientKwargs):
+    """ worker: build one patient, move its big arrays to shared memory """
+    from dicommodule.Patient import Patient
+
+    patient = None
+    try:
+        seriesUID = patientKwargs.pop('series_uid', None)
+        scanCache = patientKwargs.pop('scan_cache', None)
+        patient = Patient(**patientKwargs)
+        patient.add_data(path, scanCache=scanCache, seriesUID=seriesUID,
+                         parts=parts)
+        _share_arrays(patient)
+        # failing to pickle in the pool would lose the block names
+        pickle.dumps(patient)
+        return patient, None
+    except Exception:
+        if patient is not None:
+            _release_arrays(patient)
+        return None, traceback.format_exc()
+
+
+def _array_slots(patient):
+    """ (owner, attribute name) of each large array a patient may hold """
+    slots = [(patient.Image, 'data'), (patient.Dose, 'DoseGrid')]
+    for ROI in patient.StructureSet.ROI_List:
+        slots.append((ROI, 'DataVolume'))
+    return slots
+
+
+def _share_arrays(patient):
+    for owner, name in _array_slots(patient):
+        array = getattr(owner, name, None)
+        if isinstance(array, np.ndarray) and array.nbytes >= SHARED_MIN_BYTES:
+            setattr(owner, name, SharedArray(array))
+    if getattr(patient.Image, 'd', None) is not None:
+        patient.Image.d = None  # a view of data; re-made on the other side
+
+
+def _attach_arrays(patient):
+    patient.sharedBlocks = []
+    for owner, name in _array_slots(patient):
+        shared = getattr(owner, name, None)
+        if isinstance(shared, SharedArray):
+            array, shm = shared.attach()
+            setattr(owner, name, array)
+            patient.sharedBlocks.append(shm)
+    if hasattr(patient.Image, 'd'):
+        patient.Image.d = patient.Image.data
+
+
+def _release_arrays(patient):
+    """ free every block still held only by name """
+    for owner, name in _array_slots(patient):
+        shared = getattr(owner, name, None)
+        if isinstance(shared, SharedArray):
+            shared.release()
+            setattr(owner, name, None)
+
+
+def _create_block(nbytes):
+    """ a shared memory block this process won't clean up on exit """
+    try:
+        return shared_memory.SharedMemory(create=True, size=max(nbytes, 1),
+                                          track=False)
+    except TypeError:  # python < 3.13: no 'track', unregister by hand
+        shm = shared_memory.SharedMemory(create=True, size=max(nbytes, 1))
+        resource_tracker.unregister(shm._name, 'shared_memory')
+        return shm
@@ -6,7 +6,8 @@
 
 import sys
 from PyQt5.QtCore import (Qt, pyqtSignal)
-from PyQt5.QtWidgets import (QDialog,)
+from PyQt5.QtWidgets import (QDialog, QComboBox, QLineEdit, QPushButton,
+                             QGridLayout, QLabel)
 
 import pyqtgraph as pg
 import numpy as np
@@ -127,18 +128,19 @@ class QContourDrawerWidget(QContourViewerWidget):
         self.tempCoordList.append([[y, x]])
 
         # see if any contours exist on this slice
-        oldImVol = self.StructureSet.activeROI.DataVolume
-        isEmpty = checkEmpty(oldImVol[:, :, ts])
+        thisROI = self.StructureSet.activeROI
+        oldIm = thisROI.get_slice(ts)
+        isEmpty = checkEmpty(oldIm)
 
         if isEmpty or self.inContour:
             self.primeToFill()
         else:
             self.primeToWipe()
 
-        oldImVol[:, :, ts] = paintCircle(image=oldImVol[:, :, ts],
-                                         fill=self.fill,
-                                         x=y, y=x,
-                                         radius=self.radius)
+        thisROI.set_slice(ts, paintCircle(image=oldIm,
+                                          fill=self.fill,
+                                          x=y, y=x,
+                                          radius=self.radius))
         self.updateContours(isNewSlice=True)
 
     def PaintReleaseEvent(self, event):
@@ -148,8 +150,7 @@ class QContourDrawerWidget(QContourViewerWidget):
 
         self.editingFlag = False
 
-        if checkEmpty(self.StructureSet.activeROI.DataVolume[:, :,
-                                                             self.thisSlice]):
+        if checkEmpty(self.StructureSet.activeROI.get_slice(self.thisSlice)):
             self.primeToFill()
 
     def scrollWheelEvent(self, event):
@@ -185,7 +186,7 @@ class QContourDrawerWidget(QContourViewerWidget):
 
             if not self.editingFlag:  # mouse motion without click
 
-                binaryContIm = thisROI.DataVolume[:, :, self.thisSlice]
+                binaryContIm = thisROI.get_slice(self.thisSlice)
                 NowInContour = inContourCheck((x, y), binaryContIm)
 
                 if NowInContour is True and self.prevInContour is not True:
@@ -202,17 +203,16 @@ class QContourDrawerWidget(QContourViewerWidget):
             else:  # mouse motion yes click
 
                 ts = self.thisSlice
-                oldIm = thisROI.DataVolume[:, :, ts]
+                oldIm = thisROI.get_slice(ts)
                 self.tempCoordList.append([[y, x]])
                 pts = [np.array(self.tempCoordList).astype(np.int32)]
-                thisVol = thisROI.DataVolume
-                thisVol[:, :, ts] = cv2.polylines(img=oldIm.copy(),
-                                                  pts=pts,
-                                                  isClosed=False,
-                                                  color=(self.fill,
-                                                         self.fill,
-                                                         self.fill),
-                                                  thickness=2 * self.radius)
+                thisROI.set_slice(ts, cv2.polylines(img=oldIm.copy(),
+                                                    pts=pts,
+                                                    isClosed=False,
+                                                    color=(self.fill,
+                                                           self.fill,
+                                                           self.fill),
+                                                    thickness=2 * self.radius))
                 self.updateContours()
 
         except Exception as ae:
@@ -263,6 +263,10 @@ class QContourDrawerWidget(QContourViewerWidget):
                 self.dilate_erode_ROI(thisROI, 1)
             if event.key() == 69:  # e -- erode ROI
                 self.dilate_erode_ROI(thisROI, -1)
+            if event.key() == 85:  # u -- new ROI: union of two
+                self.combineROIs(unionDialog)
+            if event.key() == 77:  # m -- new ROI: one minus another
+                self.combineROIs(subtractDialog)
             if event.key() == 32:  # SPACE -- Rotate through ROIs
                 indList = [ROI.id for ROI in ss.ROI_List]
                 ind = indList.index(thisROI.id)
@@ -297,7 +301,7 @@ class QContourDrawerWidget(QContourViewerWidget):
 
     def doControlModifier(self):
         thisROI = self.StructureSet.activeROI
-        oldIm = thisROI.DataVolume[:, :, self.thisSlice]
+        oldIm = thisROI.get_slice(self.thisSlice)
         if checkEmpty(oldIm) or self.prevInContour:
             self.primeToWipe()
         else:
@@ -311,7 +315,7 @@ class QContourDrawerWidget(QContourViewerWidget):
 
     def undoControlModifier(self):
         thisROI = self.StructureSet.activeROI
-        oldIm = thisROI.DataVolume[:, :, self.thisSlice]
+        oldIm = thisROI.get_slice(self.thisSlice)
         if checkEmpty(oldIm) or self.prevInContour:
             self.primeToFill()
         else:
@@ -334,10 +338,10 @@ class QContourDrawerWidget(QContourViewerWidget):
             print("already at top!")
             return
 
-        neighbIm = roi.DataVolume[:, :, slice0 + direction].copy()
-        thisIm = roi.DataVolume[:, :, slice0].copy()
+        neighbIm = roi.get_slice(slice0 + direction)
+        thisIm = roi.get_slice(slice0)
 
-        roi.DataVolume[:, :, slice0] = neighbIm + thisIm
+        roi.set_slice(slice0, doUnion(neighbIm, thisIm))
 
         # ~~~~~~~~~~~~~~~ TABLE Section
     def dilate_erode_ROI(self, roi, direction):
@@ -345,14 +349,30 @@ class QContourDrawerWidget(QContourViewerWidget):
         # kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (10, 10))
         kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE,
                                            (self.morphSize, self.morphSize))
-        im = roi.DataVolume[:, :, slice0].copy()
+        im = roi.get_slice(slice0).astype(np.uint8)
         if direction > 0:
 
-            roi.DataVolume[:, :, slice0] = cv2.dilate(im, kernel)
+            roi.set_slice(slice0, cv2.dilate(im, kernel))
         elif direction < 0:
-            roi.DataVolume[:, :, slice0] = cv2.erode(im, kernel)
+            roi.set_slice(slice0, cv2.erode(im, kernel))
         self.updateContours()
 
+    def combineROIs(self, dialogClass):
+        """ Ask for two ROIs and make a new one from them """
+        names = [ROI.Name for ROI in self.StructureSet.ROI_List]
+        combineDialog = dialogClass(names)
+        combineDialog.exec_()
+        if not combineDialog.makeStatus:
+            print("cancelled")
+            return
+
+        first, second, name = combineDialog.getProperties()
+        new_ROI = self.StructureSet.combine_ROIs(
+            [first, second], combineDialog.operation, save_as=name or None,
+            color=(108, 238, 108), enablePlotting=True)
+        self.register_ROI(new_ROI)
+        self.updateContours(isNewSlice=True)
+
 
 def repositionShape(shape, x, y, radius):
     shape.setRect(x - radius,
@@ -386,20 +406,73 @@ def modifyBrushStyle(shape, color=(255, 100, 100), penWidth=2,
     shape.setBrush(brush)
 
 
-class unionDialog(QDialog):
-    pass
+class combineDialog(QDialog):
+    """ Pick two ROIs (and a name) to make a new ROI from """
+
+    operation = 'union'
+    title = 'Combine ROIs'
+    joiner = 'and'
+
+    def __init__(self, names, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        self.makeStatus = False
+
+        okBttn = QPushButton("Create")
+        okBttn.clicked.connect(self.onAccept)
+        cancelBttn = QPushButton("Cancel")
+        cancelBttn.clicked.connect(self.close)
+
+        self.firstPick = QComboBox()
+        self.firstPick.addItems(names)
+        self.secondPick = QComboBox()
+        self.secondPick.addItems(names)
+        self.nameEdit = QLineEdit()
+
+        layout = QGridLayout()
+        layout.addWidget(QLabel("ROI"), 0, 0)
+        layout.addWidget(self.firstPick, 0, 1, 1, 2)
+        layout.addWidget(QLabel(self.joiner), 1, 0)
+        layout.addWidget(self.secondPick, 1, 1, 1, 2)
+        layout.addWidget(QLabel("New ROI Name"), 2, 0)
+        layout.addWidget(self.nameEdit, 2, 1, 1, 2)
+        layout.addWidget(okBttn, 3, 1)
+        layout.addWidget(cancelBttn, 3, 2)
+
+        self.setLayout(layout)
+        self.setWindowTitle(self.title)
+        self.setWindowFlags(Qt.FramelessWindowHint)
+
+    def getProperties(self):
+        return (self.firstPick.currentText(), self.secondPick.currentText(),
+                self.nameEdit.text())
+
+    def onAccept(self):
+        self.makeStatus = True
+        self.close()
+
+
+class unionDialog(combineDialog):
+    operation = 'union'
+    title = 'Union of ROIs'
+    joiner = 'plus'
 
 
-class subtractDialog(QDialog):
-    pass
+class subtractDialog(combineDialog):
+    operation = 'difference'
+    title = 'Subtract ROIs'
+    joiner = 'minus'
 
 
 def doSubtraction(subtractor, subtractee):
-    pass
+    """ subtractee with subtractor taken out (uint8 0/1) """
+    return np.logical_and(subtractee, np.logical_not(subtractor)).astype(
+        np.uint8)
 
 
 def doUnion(one, two):
-    pass
+    """ everything in either (uint8 0/1) """
+    return np.logical_or(one, two).astype(np.uint8)
 
 
 def paintCircle(image, fill, x, y, radius):
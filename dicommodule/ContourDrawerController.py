@@ -5,11 +5,8 @@ import numpy as np
 from dicommodule.ContourDrawer import QContourDrawerWidget
 # from dicommodule.ContourViewer import countContourSlices
 from dicommodule.Patient import Patient as PatientObj
-
-try:
-    from deformableregistration import Affine_Registration_Fcns as ARF
-except ImportError:
-    print("NO ARF")
+from dicommodule.LazyVolume import swap_axes
+from dicommodule.ROI_Manipulations import findBoundingCuboid
 
 
 class PatientContourDrawer(QContourDrawerWidget):
@@ -51,8 +48,8 @@ class PatientContourDrawer(QContourDrawerWidget):
                 hasProstate = True
                 break
         if hasProstate:
-            pros = self.StructureSet.ROI_byName[MRProsKey].DataVolume
-            bounds, size = ARF.findBoundingCuboid(pros)
+            pros = self.StructureSet.ROI_byName[MRProsKey]
+            bounds, size = findBoundingCuboid(pros.DataVolume, pros.stats)
             print('prostate bounds', bounds)
             self.prostateStart = bounds[0, :]
             self.prostateStop = bounds[1, :]
@@ -102,7 +99,7 @@ class PatientContourDrawer(QContourDrawerWidget):
             ratio = spacing[1] / spacing[2]
 
         viewBox.setAspectLocked(lock=True, ratio=ratio)
-        self.imageData = np.swapaxes(self.originalImage, self.planeInd, 2)
+        self.imageData = swap_axes(self.originalImage, self.planeInd, 2)
         self.init_Slider(self.slider)
         self.updateContours(isNewSlice=True)
         viewBox.autoRange(items=[self.imageItem, ])
@@ -22,6 +22,8 @@ import numpy as np
 import cv2
 
 from dicommodule.new_ROI_dialog import newROIDialog
+from dicommodule.LazyVolume import swap_axes
+from dicommodule.ROI_Masks import get_view_slice
 from dicommodule.Patient_ROI import CVContour2VectorArray
 from dicommodule.Patient_StructureSet import Patient_StructureSet
 
@@ -59,7 +61,8 @@ class QContourViewerWidget(QWidget):
         # Lists
         self.TableSliceCount = []
         self.TableHideCheck = []
-        self.tableHeaders = ['ROI', 'Color', 'Show']
+        self.TableVolume = []
+        self.tableHeaders = ['ROI', 'Color', 'Show', 'cc']
 
         # Data Items
         self.imageItem = pg.ImageItem()
@@ -89,10 +92,10 @@ class QContourViewerWidget(QWidget):
     def init_Image(self, imageData):
         """ registers imageData to Viewer, extracts some more variables;
         such as image dimensions"""
-        self.originalImage = np.swapaxes(imageData, 0, 1)
-        self.imageData = self.originalImage.copy()
+        # a view (not a copy), so LazyVolume data stays lazy
+        self.originalImage = swap_axes(imageData, 0, 1)
+        self.imageData = self.originalImage
         # self.imageData = np.swapaxes(self.imageData, 0, 2)
-        self.contourImg = np.zeros(self.imageData.shape)
         self.nRows, self.nCols, self.nSlices = self.imageData.shape
         self.backgroundIm = np.array((self.nRows, self.nCols))
         self.imageItem.setImage(self.imageData[:, :, 0], autoLevels=True)
@@ -248,6 +251,8 @@ class QContourViewerWidget(QWidget):
         qCol = QBrush(QColor(*ROI.Color[0:3]))
         self.tablePicker.item(ROI_Index, 1).setBackground(qCol)
 
+        self.TableVolume[ROI_Index].setText(formatVolume(ROI))
+
         # self.TableContCount[ROI['ROINumber']].setText(str(nConts))
         # self.TableVertCount[ROI['ROINumber']].setText(str(nVerts))
 
@@ -267,7 +272,7 @@ class QContourViewerWidget(QWidget):
             myItem = self.tablePicker.item(row, col)
             myItem.setBackground(qCol)
 
-        elif col == 3:  # SLICES
+        elif col == 3:  # VOLUME
             pass
 
         elif col == 2:  # VISIBLE
@@ -321,6 +326,12 @@ class QContourViewerWidget(QWidget):
         self.TableHideCheck.append(visibleCheck)
         self.tablePicker.setItem(row, 2, visibleCheck)
 
+        # ROI Volume
+        volume = QTableWidgetItem(formatVolume(ROI))
+        volume.setFlags(Qt.ItemIsEnabled)
+        self.TableVolume.append(volume)
+        self.tablePicker.setItem(row, 3, volume)
+
         # ROI COntours-On-Slice Count
         # contCount = QTableWidgetItem()
         # self.TableContCount.append(contCount)
@@ -378,8 +389,8 @@ class QContourViewerWidget(QWidget):
 
                 # roiDataVolume = np.swapaxes(myROI_self.planeInd)
 
-                myROI = np.swapaxes(ROI.DataVolume, self.planeInd, 2)
-                contBinaryIm = myROI[:, :, self.thisSlice].copy()
+                contBinaryIm = get_view_slice(ROI.DataVolume, self.planeInd,
+                                              self.thisSlice).copy()
                 contours, hi = getContours(inputImage=contBinaryIm,
                                            compression=ROI.polyCompression)
 
@@ -404,8 +415,8 @@ class QContourViewerWidget(QWidget):
             thisROI = self.StructureSet.activeROI
 
             activeColor = scaleColor(thisROI.Color, self.imageItem.levels)
-            myROI = np.swapaxes(thisROI.DataVolume, self.planeInd, 2)
-            contBinaryIm = myROI[:, :, self.thisSlice].copy()
+            contBinaryIm = get_view_slice(thisROI.DataVolume, self.planeInd,
+                                          self.thisSlice).copy()
             activeCompression = thisROI.polyCompression
             activeCont, hierarchy = getContours(inputImage=contBinaryIm,
                                                 compression=activeCompression)
@@ -473,7 +484,7 @@ class QContourViewerWidget(QWidget):
             viewBox.setAspectLocked(lock=True, ratio=(1 / 7))
             self.planeInd = 1
 
-        self.imageData = np.swapaxes(self.originalImage, self.planeInd, 2)
+        self.imageData = swap_axes(self.originalImage, self.planeInd, 2)
         self.init_Slider(self.slider)
         self.updateContours(isNewSlice=True)
         viewBox.autoRange(items=[self.imageItem, ])
@@ -648,6 +659,14 @@ def scaleColor(color, levels):
     return newColor
 
 
+def formatVolume(ROI):
+    """ ROI volume in cc, for the table """
+    try:
+        return '{:.2f}'.format(ROI.stats.volume)
+    except (KeyError, TypeError):  # no image geometry to measure with
+        return '-'
+
+
 def formatHTML(ROI):
     htmlOpener = '<font size="6" color=%s>' % ColorDec2Hex(ROI.Color)
     htmlCloser = '</font>'
@@ -0,0 +1,160 @@
+# Discovery.py
+"""
+    Streaming DICOM discovery
+    Walks a directory tree lazily, reads headers through a bounded pool of
+    workers, and groups files by Patient / Study / Series / SOP Class.
+    Nothing but file paths is held on to, so memory does not grow with the
+    size of each header, and there is no cap on the number of files.
+"""
+
+# Built-In Modules
+import os
+from collections import deque
+
+# Locals
+from dicommodule.Executors import get_executor, get_max_workers
+from dicommodule.HeaderIndex import read_dicom_header
+from dicommodule.ScanCache import open_scan_cache
+
+
+IMAGE_CLASSES = {'1.2.840.10008.5.1.4.1.1.4': 'MR',
+                 '1.2.840.10008.5.1.4.1.1.6.1': 'US',
+                 '1.2.840.10008.5.1.4.1.1.3.1': 'US_Multiframe',
+                 '1.2.840.10008.5.1.4.1.1.2': 'CT'}
+
+
+def iter_DCM_files(rootpath):
+    """ Lazily walk rootpath, yield the path of every '*.dcm' file """
+    for root, dirs, files in os.walk(rootpath):
+        dirs.sort()
+        for file in sorted(files):
+            if file.endswith('.dcm'):
+                yield os.path.join(root, file)
+
+
+def iter_DCM_headers(rootpath, workers=None, scanCache=None):
+    """ Yield (path, header) for every '*.dcm' file below rootpath
+        Headers are read as by iter_headers, so the file list is never
+        materialized.
+        scanCache: a ScanCache, left open, or a path to one, which is
+        opened here and closed once the scan ends (or is abandoned)
+    """
+    return iter_headers(iter_DCM_files(rootpath), workers, scanCache)
+
+
+def iter_headers(paths, workers=None, scanCache=None):
+    """ Yield (path, header) for each of paths (any iterable), in order
+        Headers are read on the shared thread pool (see Executors.py), with
+        no more than 2 * workers reads in flight. Files found in scanCache
+        (unchanged since cached) are not opened.
+        scanCache: as for iter_DCM_headers
+    """
+    if workers is None:
+        workers = get_max_workers()
+
+    openedCache = open_scan_cache(scanCache)
+    ownCache = openedCache is not scanCache  # opened here from a path
+    scanCache = openedCache
+    window = deque()
+    pool = get_executor()
+
+    try:
+        for path in paths:
+
+            if scanCache is not None:
+                stat = os.stat(path)
+                header = scanCache.get(path, stat)
+                if header is not None:
+                    window.append((path, None, header))
+                else:
+                    window.append((path, stat,
+                                   pool.submit(read_dicom_header, path)))
+            else:
+                window.append((path, None,
+                               pool.submit(read_dicom_header, path)))
+
+            while len(window) > 2 * workers:
+                yield _resolve(window.popleft(), scanCache)
+
+        while window:
+            yield _resolve(window.popleft(), scanCache)
+
+        if scanCache is not None:
+            scanCache.commit()
+    finally:
+        if ownCache:
+            scanCache.close()
+
+
+def _resolve(entry, scanCache):
+    path, stat, header = entry
+    if isinstance(header, dict):
+        return path, header
+    header = header.result()
+    if scanCache is not None:
+        scanCache.put(path, header, stat)
+    return path, header
+
+
+def discover_series(rootpath, workers=None, scanCache=None, headerIndex=None):
+    """ Group every '*.dcm' file below rootpath
+    output: {PatientID: {StudyInstanceUID: {SeriesInstanceUID:
+                {SOPClassUID: [paths]}}}}
+            missing UIDs are grouped under 'unknown'
+    headerIndex: optional dict, filled with {path: header} as files are read;
+    it grows with the tree, so leave it out for large ones
+    """
+    tree = {}
+    for path, header in iter_DCM_headers(rootpath, workers, scanCache):
+        if headerIndex is not None:
+            headerIndex[path] = header
+        keys = [header.get(key) or 'unknown' for key in
+                ('PatientID', 'StudyInstanceUID', 'SeriesInstanceUID',
+                 'SOPClassUID')]
+        branch = tree
+        for key in keys[:-1]:
+            branch = branch.setdefault(key, {})
+        branch.setdefault(keys[-1], []).append(path)
+
+    return tree
+
+
+def list_series(tree):
+    """ Flatten a discover_series tree
+    output: list of (PatientID, StudyUID, SeriesUID, SOPClassUID, [paths])
+    """
+    seriesList = []
+    for patientID, studies in tree.items():
+        for studyUID, series in studies.items():
+            for seriesUID, classes in series.items():
+                for sopClass, paths in classes.items():
+                    seriesList.append((patientID, studyUID, seriesUID,
+                                       sopClass, paths))
+    return seriesList
+
+
+def select_series(tree, seriesUID=None):
+    """ Pick the files for one Patient object out of a discovery tree
+    output: {SOPClassUID: [paths]}, as expected by Patient.loadPatientData
+
+    With no seriesUID everything is merged by SOP Class. Otherwise the
+    chosen image series is kept along with every non-image object (RT
+    Structure Set, RT Dose, ...) from the same study.
+    """
+    dcmFiles = {}
+    seriesList = list_series(tree)
+
+    if seriesUID is None:
+        chosen = seriesList
+    else:
+        studies = [entry[1] for entry in seriesList if entry[2] == seriesUID]
+        if not bool(studies):
+            raise KeyError("No series {} found".format(seriesUID))
+        chosen = [entry for entry in seriesList
+                  if entry[2] == seriesUID or
+                  (entry[1] in studies and entry[3] not in IMAGE_CLASSES)]
+
+    for patientID, studyUID, thisSeries, sopClass, paths in chosen:
+        dcmFiles.setdefault(sopClass, []).extend(paths)
+
+    return dcmFiles
@@ -0,0 +1,100 @@
+# Executors.py
+"""
+    Shared worker pools
+    One bounded thread pool (and, on request, one process pool) for every
+    loader in the package, instead of a new pool per call. Sized to about
+    the CPU count by default; see configure(). Pools are created on first
+    use and shut down at interpreter exit.
+
+    Tasks run on these pools must not themselves wait on tasks submitted
+    to the same pool. A forked child starts with no pools: the parent's
+    threads don't come across the fork.
+"""
+
+# Built-In Modules
+import os
+import atexit
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+
+# Transfer syntaxes whose pixel data is stored as-is; anything else needs
+# a codec, which holds the GIL while it decodes
+UNCOMPRESSED_SYNTAXES = ('1.2.840.10008.1.2',  # Implicit VR Little Endian
+                         '1.2.840.10008.1.2.1',  # Explicit VR Little Endian
+                         '1.2.840.10008.1.2.1.99',  # Deflated Explicit VR LE
+                         '1.2.840.10008.1.2.2')  # Explicit VR Big Endian
+
+_settings = {'max_workers': os.cpu_count() or 1,
+             'process_decoding': True}
+_executors = {}
+_lock = threading.Lock()
+
+
+def configure(max_workers=None, process_decoding=None):
+    """ Change pool settings; running pools are shut down and recreated
+        - max_workers (int): threads (and processes) per pool
+        - process_decoding (bool): decode compressed transfer syntaxes in a
+          process pool rather than the thread pool
+    """
+    if max_workers is not None:
+        if int(max_workers) < 1:
+            raise ValueError("max_workers must be at least 1")
+        _settings['max_workers'] = int(max_workers)
+    if process_decoding is not None:
+        _settings['process_decoding'] = bool(process_decoding)
+    shutdown_executors()
+
+
+def get_max_workers():
+    return _settings['max_workers']
+
+
+def get_executor(kind='thread'):
+    """ the shared pool of the given kind: 'thread' or 'process' """
+    with _lock:
+        if kind not in _executors:
+            if kind == 'thread':
+                _executors[kind] = ThreadPoolExecutor(
+                    max_workers=_settings['max_workers'],
+                    thread_name_prefix='dicommodule')
+            elif kind == 'process':
+                _executors[kind] = ProcessPoolExecutor(
+                    max_workers=_settings['max_workers'])
+            else:
+                raise ValueError("Unknown executor kind {}".format(kind))
+        return _executors[kind]
+
+
+def is_compressed(transferSyntaxUID):
+    if transferSyntaxUID is None:
+        return False
+    return str(transferSyntaxUID) not in UNCOMPRESSED_SYNTAXES
+
+
+def get_decode_executor(transferSyntaxUID=None):
+    """ pool to decode pixel data of the given transfer syntax with """
+    if _settings['process_decoding'] and is_compressed(transferSyntaxUID):
+        return get_executor('process')
+    return get_executor('thread')
+
+
+def shutdown_executors(wait=True):
+    """ shut down every shared pool; they are recreated on next use """
+    with _lock:
+        executors = list(_executors.values())
+        _executors.clear()
+    for executor in executors:
+        executor.shutdown(wait=wait)
+
+
+def _forget_executors():
+    """ in a forked child: drop the parent's pools, they have no workers """
+    global _lock
+    _lock = threading.Lock()
+    _executors.clear()
+
+
+atexit.register(shutdown_executors)
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_forget_executors)
@@ -0,0 +1,89 @@
+# HeaderIndex.py
+"""
+    Header Index
+    One header-only read per DICOM file, shared by file discovery and by
+    the Patient_Image loader so that no stage has to re-open a file just to
+    look at its tags.
+"""
+
+# Third-Party Modules
+try:
+    import dicom as dicom
+except ImportError:
+    import pydicom as dicom
+
+
+# tags pulled from every file; reading stops at these (and before pixels)
+HEADER_TAGS = ['SOPClassUID',
+               'SOPInstanceUID',
+               'Modality',
+               'PatientID',
+               'PatientName',
+               'PatientPosition',
+               'StudyInstanceUID',
+               'SeriesInstanceUID',
+               'FrameOfReferenceUID',
+               'Rows',
+               'Columns',
+               'PixelSpacing',
+               'SliceThickness',
+               'ImagePositionPatient',
+               'ImageOrientationPatient',
+               'NumberOfFrames',
+               'SamplesPerPixel',
+               'BitsAllocated',
+               'PixelRepresentation']
+
+
+def read_dicom_header(filePath):
+    """ Header-only read of a DICOM file (never touches PixelData)
+    input: path to a dicom file
+    output: dictionary of plain python values, keyed by tag keyword;
+            missing tags are None
+    """
+    di = dicom.read_file(filePath, force=True, stop_before_pixels=True,
+                         specific_tags=HEADER_TAGS)
+
+    header = {'FileName': filePath}
+    for keyword in HEADER_TAGS:
+        header[keyword] = _plain_value(getattr(di, keyword, None))
+
+    # 'Cols' is the name used throughout the Patient_* info dictionaries
+    header['Cols'] = header.pop('Columns')
+
+    try:
+        header['TransferSyntaxUID'] = str(di.file_meta.TransferSyntaxUID)
+    except AttributeError:
+        header['TransferSyntaxUID'] = None
+
+    return header
+
+
+def build_header_index(fileList, headerIndex=None):
+    """ Read the header of every file not already in the index
+    input: list of file paths, (optional) existing index to extend
+    output: dictionary of {filePath: header}
+    """
+    if headerIndex is None:
+        headerIndex = {}
+
+    for filePath in fileList:
+        if filePath not in headerIndex:
+            headerIndex[filePath] = read_dicom_header(filePath)
+
+    return headerIndex
+
+
+def _plain_value(value):
+    """ pydicom values (DS, IS, MultiValue, PersonName, UID) to python """
+    if value is None or value == '':
+        return None
+    if isinstance(value, (list, tuple)) or type(value).__name__ in (
+            'MultiValue', 'MultiValueList'):
+        return [_plain_value(v) for v in value]
+    if isinstance(value, (int, float, str)):
+        # DSfloat, IS, UID are subclasses; strip them back to builtins
+        for builtin in (bool, int, float, str):
+            if isinstance(value, builtin):
+                return builtin(value)
+    return str(value)
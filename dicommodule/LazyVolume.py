@@ -0,0 +1,193 @@
+# LazyVolume.py
+"""
+    Lazy image volume
+    Looks like a 3D numpy array, but only decodes a slice the first time
+    it is indexed. Decoded slices are kept in an LRU cache with a memory
+    budget, so browsing a large series never holds more than the budget.
+"""
+
+# Built-In Modules
+import threading
+from collections import OrderedDict
+
+# Third-Party Modules
+import numpy as np
+
+
+DEFAULT_BUDGET = 512 * 2 ** 20  # bytes of decoded slices to keep around
+
+
+class SliceCache(object):
+    """ Thread-safe LRU cache of decoded slices, bounded by total bytes """
+
+    def __init__(self, budget=DEFAULT_BUDGET):
+        super().__init__()
+        self.budget = budget
+        self.nbytes = 0
+        self._slices = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, index):
+        with self._lock:
+            if index not in self._slices:
+                return None
+            self._slices.move_to_end(index)
+            return self._slices[index]
+
+    def put(self, index, array):
+        with self._lock:
+            if index in self._slices:
+                return
+            self._slices[index] = array
+            self.nbytes += array.nbytes
+            # always keep the newest slice, even if it alone is over budget
+            while self.nbytes > self.budget and len(self._slices) > 1:
+                oldIndex, oldArray = self._slices.popitem(last=False)
+                self.nbytes -= oldArray.nbytes
+
+    def clear(self):
+        with self._lock:
+            self._slices.clear()
+            self.nbytes = 0
+
+    def __getstate__(self):
+        # decoded slices and the lock don't travel between processes
+        return {'budget': self.budget}
+
+    def __setstate__(self, state):
+        self.__init__(state['budget'])
+
+
+class LazyVolume(object):
+    """ Read-only, array-like [Rows, Cols, NSlices] volume
+
+        ~~ INPUTS ~~
+        - shape (tuple): (Rows, Cols, NSlices) of the full volume
+        - dtype: numpy dtype of the decoded pixels
+        - loader (callable): loader(sliceIndex) -> 2D (Rows, Cols) array
+        - budget (int): bytes of decoded slices to keep cached
+
+        Supports integer / slice / Ellipsis indexing like numpy, plus
+        swapaxes(); np.asarray(volume) decodes everything.
+    """
+
+    ndim = 3
+
+    def __init__(self, shape, dtype, loader, budget=DEFAULT_BUDGET,
+                 axes=(0, 1, 2), cache=None):
+        super().__init__()
+        self.baseShape = tuple(int(x) for x in shape)
+        self.dtype = np.dtype(dtype)
+        self.loader = loader
+        self.axes = tuple(axes)
+        self.cache = SliceCache(budget) if cache is None else cache
+
+    def __str__(self):
+        return "Lazy Volume {} ({} cached)".format(self.shape,
+                                                    len(self.cache._slices))
+
+    @property
+    def shape(self):
+        return tuple(self.baseShape[ax] for ax in self.axes)
+
+    @property
+    def size(self):
+        return int(np.prod(self.baseShape))
+
+    @property
+    def nbytes(self):
+        return self.size * self.dtype.itemsize
+
+    def __len__(self):
+        return self.shape[0]
+
+    def swapaxes(self, axis1, axis2):
+        """ view with two axes exchanged (no decoding, shares the cache) """
+        axes = list(self.axes)
+        axes[axis1], axes[axis2] = axes[axis2], axes[axis1]
+        return LazyVolume(self.baseShape, self.dtype, self.loader,
+                          axes=axes, cache=self.cache)
+
+    def get_slice(self, index):
+        """ decoded [Rows, Cols] slice at index along the slice axis """
+        array = self.cache.get(index)
+        if array is None:
+            array = np.asarray(self.loader(index), dtype=self.dtype)
+            self.cache.put(index, array)
+        return array
+
+    def __getitem__(self, rawKey):
+        key = _expand_key(rawKey, self.ndim)
+        if key is None:  # fancy indexing: fall back to the dense array
+            return np.asarray(self)[rawKey]
+
+        # key in terms of the underlying [Rows, Cols, NSlices] axes
+        baseKey = [None] * 3
+        for viewAxis, baseAxis in enumerate(self.axes):
+            baseKey[baseAxis] = _normalize(key[viewAxis],
+                                           self.baseShape[baseAxis])
+
+        if isinstance(baseKey[2], int):
+            result = self.get_slice(baseKey[2])[baseKey[0], baseKey[1]]
+        else:
+            sliceInds = range(self.baseShape[2])[baseKey[2]]
+            parts = [self.get_slice(ind)[baseKey[0], baseKey[1]]
+                     for ind in sliceInds]
+            if bool(parts):
+                result = np.stack(parts, axis=-1)
+            else:
+                emptyShape = [len(range(self.baseShape[ax])[baseKey[ax]])
+                              for ax in (0, 1)
+                              if not isinstance(baseKey[ax], int)]
+                result = np.empty(emptyShape + [0], dtype=self.dtype)
+
+        # put the surviving axes back into view order
+        keptBase = [self.axes[ax] for ax in range(3)
+                    if not isinstance(key[ax], int)]
+        order = sorted(keptBase)
+        return result.transpose([order.index(ax) for ax in keptBase])
+
+    def __array__(self, dtype=None, copy=None):
+        full = np.empty(self.baseShape, dtype=self.dtype)
+        for ind in range(self.baseShape[2]):
+            full[:, :, ind] = self.get_slice(ind)
+        full = full.transpose(self.axes)
+        if dtype is not None:
+            full = full.astype(dtype)
+        return full
+
+    def copy(self):
+        return np.array(self)
+
+
+def swap_axes(volume, axis1, axis2):
+    """ np.swapaxes that keeps a LazyVolume lazy """
+    if isinstance(volume, LazyVolume):
+        return volume.swapaxes(axis1, axis2)
+    return np.swapaxes(volume, axis1, axis2)
+
+
+def _expand_key(key, ndim):
+    """ key as a tuple of ndim ints / slices, or None if fancy indexing """
+    if not isinstance(key, tuple):
+        key = (key,)
+    if any(key_ is Ellipsis for key_ in key):
+        ind = key.index(Ellipsis)
+        fill = (slice(None),) * (ndim - len(key) + 1)
+        key = key[:ind] + fill + key[ind + 1:]
+    key = key + (slice(None),) * (ndim - len(key))
+    if len(key) != ndim:
+        raise IndexError("too many indices for volume")
+    for key_ in key:
+        if not isinstance(key_, (slice, int, np.integer)):
+            return None
+    return tuple(int(k) if isinstance(k, np.integer) else k for k in key)
+
+
+def _normalize(key, length):
+    if isinstance(key, slice):
+        return key
+    if key < -length or key >= length:
+        raise IndexError("index {} out of bounds for size {}".format(
+            key, length))
+    return key % length
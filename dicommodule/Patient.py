@@ -3,7 +3,6 @@
 # Built-ins
 import os
 import time
-from multiprocessing.pool import ThreadPool
 
 # Third-parties
 try:
@@ -12,10 +11,13 @@ except ImportError:
     import pydicom as dicom
 
 # Locals
+from dicommodule.Discovery import (iter_DCM_headers, iter_headers,
+                                   discover_series, select_series)
 from dicommodule.Patient_StructureSet import Patient_StructureSet
 from dicommodule.Patient_Image import Patient_Image
 from dicommodule.Patient_Plan import Patient_Plan
 from dicommodule.Patient_Dose import Patient_Dose
+from dicommodule.PatientCache import load_patient_cache, save_patient_cache
 
 
 class Patient(object):
@@ -28,6 +30,19 @@ class Patient(object):
         - imagefiles (list of strs): paths to patient image files
         - structureset (str): path to patient structureset file
         - reverse_rotation (bool): a patch for mis-rotated dicoms, ignore.
+        - scan_cache (str or ScanCache): optional sqlite file remembering
+          file headers between scans of patientPath (see ScanCache.py)
+        - series_uid (str): which image series to load, when patientPath
+          holds several; see self.seriesTree after loading for choices
+        - lazy_image (bool): decode image slices only as they're viewed
+          (see LazyVolume.py)
+        - mask_storage (str): 'uint8' (default), 'bool', 'packed' (1 bit
+          per voxel), 'cropped' (bounding box only), 'rle' (row runs) or
+          'lazy' (contours, filled per slice on demand) for ROI masks; see
+          ROI_Masks.py
+        - cache_dir (str): with patientPath, reload from this cache if the
+          DICOM files are unchanged, otherwise load them and write the
+          cache (see PatientCache.py)
 
         If initialized with patientPath: will scan the directory for DICOM
         files, and will attempt to populate Patient Object with data from
@@ -45,7 +60,12 @@ class Patient(object):
                  imagefiles=None,
                  structureset=None,
                  dosefile=None,
-                 reverse_rotation=False):
+                 reverse_rotation=False,
+                 scan_cache=None,
+                 series_uid=None,
+                 lazy_image=False,
+                 mask_storage='uint8',
+                 cache_dir=None):
         super().__init__()
 
         self.patientContents = {'image': False,
@@ -54,14 +74,29 @@ class Patient(object):
                                 'dose': False}
 
         self.reverseRotation = reverse_rotation
+        self.seriesTree = {}
 
-        self.Image = Patient_Image(revRot=reverse_rotation)
-        self.StructureSet = Patient_StructureSet()
+        self.Image = Patient_Image(revRot=reverse_rotation, lazy=lazy_image)
+        self.StructureSet = Patient_StructureSet(maskStorage=mask_storage)
         self.Plan = Patient_Plan(patient=self)
         self.Dose = Patient_Dose()
 
+        if patientPath is not None and cache_dir is not None:
+            options = {'series_uid': series_uid,
+                       'reverse_rotation': reverse_rotation,
+                       'lazy_image': lazy_image,
+                       'mask_storage': mask_storage}
+            if load_patient_cache(self, cache_dir, patientPath, options):
+                print("Loaded patient from cache {}".format(cache_dir))
+                return
+            self.add_data(patientPath, scanCache=scan_cache,
+                          seriesUID=series_uid)
+            save_patient_cache(self, cache_dir, patientPath, options)
+            return
+
         if patientPath is not None:
-            self.add_data(patientPath)
+            self.add_data(patientPath, scanCache=scan_cache,
+                          seriesUID=series_uid)
             return
 
         if imagefiles is not None:
@@ -84,14 +119,20 @@ class Patient(object):
 
         return strang
 
-    def add_data(self, patientPath):
+    def add_data(self, patientPath, scanCache=None, seriesUID=None,
+                 parts=None):
         if patientPath is not None:
-            dcmFiles = find_DCM_files_serial(patientPath)
+            # no header index over the whole walk: only the loaded image
+            # series' headers are kept, re-read (or taken from scanCache)
+            self.seriesTree = discover_series(patientPath,
+                                              scanCache=scanCache)
+            dcmFiles = select_series(self.seriesTree, seriesUID)
             # for key in dcmFiles.keys():
                 # print('Patient has {}'.format(key))
 
             if bool(dcmFiles):
-                self.loadPatientData(dcmFiles)
+                self.loadPatientData(dcmFiles, parts=parts,
+                                     scanCache=scanCache)
             else:
                 print("No DICOM Files Found at {}".format(patientPath))
                 raise IOError
@@ -114,8 +155,10 @@ class Patient(object):
     def hasDose(self):
         return self.patientContents['dose']
 
-    def add_images(self, filelist):
-        self.Image.setData(fileList=filelist)
+    def add_images(self, filelist, headerIndex=None, scanCache=None):
+        if headerIndex is None:  # this series' headers, on the shared pool
+            headerIndex = dict(iter_headers(filelist, scanCache=scanCache))
+        self.Image.setData(fileList=filelist, headerIndex=headerIndex)
         self.patientContents['image'] = True
 
     def add_rtst(self, file):
@@ -127,7 +170,21 @@ class Patient(object):
         self.Dose.setData(filePath=dosefile)
         self.patientContents['dose'] = True
 
-    def loadPatientData(self, dcmFiles={}):
+    def loadPatientData(self, dcmFiles={}, headerIndex=None, parts=None,
+                        scanCache=None):
+        """ dcmFiles: {SOPClassUID: [paths]}, as from find_DCM_files_serial
+            headerIndex: {path: header} collected during discovery, handed
+            on so the image loader doesn't re-read any headers
+            scanCache: otherwise, where the image headers may be found
+            parts: which of 'image', 'ROI', 'plan', 'dose' to load (all, if
+            None). ROIs need the image geometry, so asking for 'ROI'
+            without 'image' loads the image lazily (no pixels decoded) """
+        if parts is None:
+            parts = self.patientContents.keys()
+        if 'ROI' in parts and 'image' not in parts:
+            self.Image.lazy = True
+        wantImage = 'image' in parts or 'ROI' in parts
+
         # print(dcmFiles)
         # MR = 'MR Image Storage'
         # RTST = 'RT Structure Set Storage'
@@ -140,28 +197,38 @@ class Patient(object):
         DO = '1.2.840.10008.5.1.4.1.1.481.2'
 
         # IMAGES
-        if MR in dcmFiles.keys():
-            self.add_images(filelist=dcmFiles[MR])
+        if not wantImage:
+            pass
+
+        elif MR in dcmFiles.keys():
+            self.add_images(filelist=dcmFiles[MR],
+                            headerIndex=headerIndex, scanCache=scanCache)
 
         elif US in dcmFiles.keys():
-            self.add_images(filelist=dcmFiles[US])
+            self.add_images(filelist=dcmFiles[US],
+                            headerIndex=headerIndex, scanCache=scanCache)
 
         elif US_Multiframe in dcmFiles.keys():
-            self.add_images(filelist=dcmFiles[US_Multiframe])
+            self.add_images(filelist=dcmFiles[US_Multiframe],
+                            headerIndex=headerIndex, scanCache=scanCache)
 
         elif CT in dcmFiles.keys():
-            self.add_images(filelist=dcmFiles[CT])
+            self.add_images(filelist=dcmFiles[CT],
+                            headerIndex=headerIndex, scanCache=scanCache)
 
         # STRUCTURE SET
-        if RTST in dcmFiles.keys():
+        if 'ROI' not in parts:
+            pass
+
+        elif RTST in dcmFiles.keys():
             self.add_rtst(file=dcmFiles[RTST][0])
 
         # DOSE
-        if DO in dcmFiles.keys():
+        if DO in dcmFiles.keys() and 'dose' in parts:
             self.add_dose(dosefile=dcmFiles[DO][0])
 
         # SOMETHING ELSE?
-        if 'unknown' in dcmFiles.keys():
+        if 'unknown' in dcmFiles.keys() and 'ROI' in parts:
             self.StructureSet.setData(filePath=dcmFiles['unknown'][0],
                                       imageInfo=self.Image.info)
             self.patientContents['ROI'] = True
@@ -180,74 +247,34 @@ class Patient(object):
         pass
 
 
-def find_DCM_files_parallel(rootpath=None):
-    """ Walk rootpath input directory, find all '*.dcm' files """
+def find_DCM_files_parallel(rootpath=None, workers=None):
+    """ Walk rootpath input directory, find all '*.dcm' files
+        output: {Modality: [paths]} """
     time_zero = time.time()
-    dcmFileList = []
-
-    # ~~ Walk directory, add all '*.dcm' files to list
-    for root, dirs, files in os.walk(rootpath):
-        for file in files:
-            if file.endswith('.dcm'):
-                fullpath = os.path.join(root, file)
-                dcmFileList.append(fullpath)
-
-    print("Found {} files".format(len(dcmFileList)))
-
-    if len(dcmFileList) > 300:
-        print('Too many files!')
-        return {}
-
-    # ~~ Create Threadpool same size as dcm list, get modality for each file
-    if not bool(dcmFileList):
-        return {}
-
-    pool = ThreadPool(len(dcmFileList))
-    results = pool.map(func=lambda x: (dicom.read_file(x, force=True).Modality, x),
-                       iterable=dcmFileList)
-    pool.close()
-    pool.join()
 
     # ~~ sort into a dictionary by modality type
     dcmDict = {}
-    for result in results:
-        mode, filepath = result
+    for filepath, header in iter_DCM_headers(rootpath, workers=workers):
+        mode = header['Modality']
         if mode not in dcmDict:
             dcmDict[mode] = []
         dcmDict[mode].append(filepath)
 
+    print("Found {} files".format(sum(len(v) for v in dcmDict.values())))
     print("parallel took %.2fs to sort DCMs" % (time.time() - time_zero))
     return dcmDict
 
 
-def find_DCM_files_serial(rootpath=None):
-    """ Walk rootpath input directory, find all '*.dcm' files """
-    time_zero = time.time()
-    dcmList = []
-    dcmDict = {}
-
-    # ~~ Walk directory, add all '*.dcm' files to dict by modality
-    for root, dirs, files in os.walk(rootpath):
-        for file in files:
-            if file.endswith('.dcm'):
-                fullpath = os.path.join(root, file)
-                dcmList.append(fullpath)
-
-    if len(dcmList) > 300:
-        print('Too many files!')
-        return {}
-
-    for fullpath in dcmList:
-        try:
-            modality = dicom.read_file(fullpath, force=True).SOPClassUID
-        except AttributeError:
-            modality = 'unknown'
-        if modality not in dcmDict:
-            dcmDict[modality] = []
-
-        dcmDict[modality].append(fullpath)
-
-    return dcmDict
+def find_DCM_files_serial(rootpath=None, headerIndex=None, scanCache=None):
+    """ Walk rootpath input directory, find all '*.dcm' files
+        output: {SOPClassUID: [paths]} ('unknown' if it has none)
+        headerIndex: optional dict, filled with {path: header} for every
+        file read, so later loading stages can skip re-reading them
+        scanCache: optional ScanCache (or path to one); files unchanged
+        since they were cached are not opened at all """
+    tree = discover_series(rootpath, workers=1, scanCache=scanCache,
+                           headerIndex=headerIndex)
+    return select_series(tree)
 
 
 def backupFile_finder(path):
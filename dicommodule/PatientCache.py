@@ -0,0 +1,239 @@
+# PatientCache.py
+"""
+    Fast-reload patient cache
+    After a patient has been read from DICOM once, its image volume, ROI
+    masks and dose grid are written to a cache directory as .npy files,
+    with the info dicts, transforms and UID maps in a JSON manifest. Later
+    loads memory-map the arrays straight back, as long as the '*.dcm' files
+    under the patient directory are unchanged (same paths, sizes, mtimes).
+    Masks kept packed, cropped, as runs or as contours are saved in that
+    form (.npz); a lazy image saves no pixels, and is lazy again on load.
+"""
+
+# Built-In Modules
+import os
+import json
+from collections.abc import MutableSequence
+
+# Third-Party Modules
+import numpy as np
+
+# Locals
+from dicommodule.Discovery import iter_DCM_files
+from dicommodule.Patient_ROI import Patient_ROI_Obj
+from dicommodule.ROI_Masks import MaskVolume, mask_from_arrays
+from dicommodule.LazyVolume import LazyVolume
+
+
+CACHE_VERSION = 3
+MANIFEST = 'manifest.json'
+
+
+def fingerprint_sources(patientPath):
+    """ {path: [size, mtime_ns]} of every '*.dcm' file below patientPath """
+    sources = {}
+    for path in iter_DCM_files(patientPath):
+        stat = os.stat(path)
+        sources[os.path.abspath(path)] = [stat.st_size, stat.st_mtime_ns]
+    return sources
+
+
+def save_patient_cache(patient, cacheDir, patientPath, options=None):
+    """ Write patient's loaded data to cacheDir
+
+        ~~ INPUTS ~~
+        - patient (Patient): a loaded patient
+        - cacheDir (str): directory for the cache; created if missing
+        - patientPath (str): directory the patient was read from
+        - options (dict): load options (series, rotation, ...) the cache
+          is only valid for
+    """
+    os.makedirs(cacheDir, exist_ok=True)
+    manifest = {'version': CACHE_VERSION,
+                'sources': fingerprint_sources(patientPath),
+                'options': _encode(options or {}),
+                'patientContents': patient.patientContents}
+
+    # written last, so a half-written cache never looks valid
+    manifestPath = os.path.join(cacheDir, MANIFEST)
+    if os.path.exists(manifestPath):
+        os.remove(manifestPath)
+
+    if patient.hasImage():
+        Image = patient.Image
+        lazy = isinstance(Image.data, LazyVolume)
+        if not lazy:
+            _save_array(cacheDir, 'image.npy', Image.data)
+        manifest['image'] = {'info': _encode(Image.info),
+                             'lazy': lazy,
+                             'dtype': Image.data.dtype.str,
+                             'ImageModality': Image.ImageModality,
+                             'dataDict': _encode(getattr(Image, 'dataDict',
+                                                         {})),
+                             'UID_zero': getattr(Image, 'UID_zero', None),
+                             'multiframe': hasattr(Image, 'd')}
+
+    if patient.hasROI():
+        SS = patient.StructureSet
+        ROIs = []
+        for index, ROI in enumerate(SS.ROI_List):
+            if isinstance(ROI.DataVolume, MaskVolume):
+                fileName = 'roi_{}.npz'.format(index)
+                np.savez(os.path.join(cacheDir, fileName),
+                         **ROI.DataVolume.to_arrays())
+            else:
+                fileName = 'roi_{}.npy'.format(index)
+                _save_array(cacheDir, fileName, ROI.DataVolume)
+            ROIs.append({'Name': ROI.Name,
+                         'Number': ROI.Number,
+                         'Color': _encode(ROI.Color),
+                         'linewidth': ROI.linewidth,
+                         'FrameRef_UID': _encode(ROI.FrameRef_UID),
+                         'hidden': ROI.hidden,
+                         'polyCompression': ROI.polyCompression,
+                         'storage': ROI.storage,
+                         'dirtySlices': sorted(ROI.dirtySlices),
+                         'allDirty': ROI.allDirty,
+                         'shape': list(ROI.DataVolume.shape),
+                         'file': fileName})
+        manifest['structureSet'] = {
+            'filePath': os.path.join(SS.fileroot, SS.SSFile),
+            'FrameRef_UID': _encode(getattr(SS, 'FrameRef_UID', None)),
+            'ROIs': ROIs}
+
+    if patient.hasDose():
+        _save_array(cacheDir, 'dose.npy', patient.Dose.DoseGrid)
+        manifest['dose'] = {'info': _encode(patient.Dose.info)}
+
+    with open(manifestPath, 'w') as fp:
+        json.dump(manifest, fp)
+
+
+def load_patient_cache(patient, cacheDir, patientPath, options=None):
+    """ Fill an empty patient from cacheDir
+        Returns False (leaving patient untouched) if there is no cache, or
+        if it is out of date with the files under patientPath.
+    """
+    manifest = _read_manifest(cacheDir)
+    if manifest is None:
+        return False
+    if manifest.get('version') != CACHE_VERSION:
+        return False
+    if manifest['options'] != _encode(options or {}):
+        return False
+    if manifest['sources'] != fingerprint_sources(patientPath):
+        return False
+
+    if 'image' in manifest:
+        Image = patient.Image
+        entry = manifest['image']
+        Image.info = _decode(entry['info'])
+        Image.ImageModality = entry['ImageModality']
+        Image.dataDict = _decode(entry['dataDict'])
+        Image.UID_zero = entry['UID_zero']
+        if entry['lazy']:
+            info = Image.info
+            Image.data = LazyVolume(shape=(info['Rows'], info['Cols'],
+                                           info['NSlices']),
+                                    dtype=entry['dtype'],
+                                    loader=Image.get_slice_pixels,
+                                    budget=Image.cacheBudget)
+        else:
+            Image.data = np.load(os.path.join(cacheDir, 'image.npy'),
+                                 mmap_mode='r')
+        if entry['multiframe']:
+            Image.d = Image.data
+
+    if 'structureSet' in manifest:
+        SS = patient.StructureSet
+        entry = manifest['structureSet']
+        SS.setImageInfo(patient.Image.info)
+        SS.filePath = entry['filePath']
+        (SS.fileroot, SS.SSFile) = os.path.split(entry['filePath'])
+        SS.FrameRef_UID = _decode(entry['FrameRef_UID'])
+        for ROIentry in entry['ROIs']:
+            maskPath = os.path.join(cacheDir, ROIentry['file'])
+            if maskPath.endswith('.npz'):
+                with np.load(maskPath) as arrays:
+                    mask = mask_from_arrays(ROIentry['storage'],
+                                            tuple(ROIentry['shape']),
+                                            arrays)
+            else:
+                # copy-on-write, so masks stay editable without touching
+                # the cache
+                mask = np.load(maskPath, mmap_mode='c')
+            ROI = Patient_ROI_Obj(name=ROIentry['Name'],
+                                  number=ROIentry['Number'],
+                                  color=_decode(ROIentry['Color']),
+                                  linewidth=ROIentry['linewidth'],
+                                  frameRef_UID=_decode(
+                                      ROIentry['FrameRef_UID']),
+                                  hidden=ROIentry['hidden'],
+                                  dataVolume=mask,
+                                  imageInfo=patient.Image.info,
+                                  storage=ROIentry['storage'])
+            ROI.polyCompression = ROIentry['polyCompression']
+            # edits not yet saved to the structure set file
+            ROI.mark_clean()
+            ROI.dirtySlices = set(ROIentry.get('dirtySlices', []))
+            ROI.allDirty = ROIentry.get('allDirty', False)
+            SS.add_ROI(ROI)
+
+    if 'dose' in manifest:
+        patient.Dose.setDoseGrid(
+            np.load(os.path.join(cacheDir, 'dose.npy'), mmap_mode='r'),
+            _decode(manifest['dose']['info']))
+
+    patient.patientContents.update(manifest['patientContents'])
+    return True
+
+
+def _read_manifest(cacheDir):
+    try:
+        with open(os.path.join(cacheDir, MANIFEST)) as fp:
+            return json.load(fp)
+    except (OSError, ValueError):
+        return None
+
+
+def _save_array(cacheDir, fileName, array):
+    np.save(os.path.join(cacheDir, fileName), np.asarray(array))
+
+
+def _encode(obj):
+    """ obj as plain JSON; arrays and non-str dict keys are tagged """
+    if isinstance(obj, dict):
+        if all(isinstance(key, str) for key in obj):
+            return {key: _encode(value) for key, value in obj.items()}
+        return {'__items__': [[_encode(key), _encode(value)]
+                              for key, value in obj.items()]}
+    if isinstance(obj, np.ndarray):
+        return {'__ndarray__': obj.tolist(), 'dtype': obj.dtype.str}
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, (list, tuple, MutableSequence)):  # and MultiValues
+        return [_encode(item) for item in obj]
+    if isinstance(obj, str):
+        return str(obj)  # drops str subclasses such as pydicom UIDs
+    if isinstance(obj, float):
+        return float(obj)
+    if isinstance(obj, int) and not isinstance(obj, bool):
+        return int(obj)
+    return obj
+
+
+def _decode(obj):
+    if isinstance(obj, dict):
+        if '__ndarray__' in obj:
+            return np.array(obj['__ndarray__'], dtype=obj['dtype'])
+        if '__items__' in obj:
+            return {_hashable(_decode(key)): _decode(value)
+                    for key, value in obj['__items__']}
+        return {key: _decode(value) for key, value in obj.items()}
+    if isinstance(obj, list):
+        return [_decode(item) for item in obj]
+    return obj
+
+
+def _hashable(key):
+    return tuple(key) if isinstance(key, list) else key
@@ -6,43 +6,286 @@
 import os
 import sys
 import numpy as np
+import scipy.ndimage as spnd
 try:
     import dicom as dicom
 except ImportError:
     import pydicom as dicom
 
 
+RESAMPLE_CHUNK = 16  # image slices resampled at once
+RESAMPLE_CACHE_SIZE = 8  # grids / boxes kept
+
+
 class Patient_Dose(object):
     """
-        INCOMPLETE MODULE
+        RT Dose grid
 
-    """
+        DoseGrid is [Rows, Cols, Frames], in DoseUnits. Frames are placed
+        by GridFrameOffsetVector, which needn't be evenly spaced; sample()
+        gives the dose at any point in patient coordinates, and version
+        goes up whenever a new grid is read, so results worked out from the
+        dose (DVHs; see ROI_DVH.py) know when they're stale.
 
+        resample() puts the dose on an image's voxel grid (or a box of it),
+        and keeps what it has worked out until a new grid is read, so
+        everything looking at the dose on the image shares one copy.
+    """
 
     def __init__(self, file=None):
         super().__init__()
 
         self.info = {}
+        self.version = 0
+        self._maxDose = None
+        self._resampled = {}
+        self._resampledVersion = None
 
         if file is not None:
             self.setData(filePath=file)
 
+    def __str__(self):
+        if 'Rows' not in self.info:
+            return "Dose Object (empty)"
+        return "Dose Object: {} x {} x {} ({})".format(
+            self.info['Rows'], self.info['Cols'], self.info['NFrames'],
+            self.info['DoseUnits'])
+
     def setData(self, filePath):
         # pass
         # if type(filePath) is not str:
             # raise
         # print('got file {}'.format(filePath))
         di = dicom.read_file(filePath)
-        dosevol = di.pixel_array * di.DoseGridScaling
-        self.DoseGrid = np.swapaxes(dosevol, 0, 2)
-        self.DoseGrid = np.swapaxes(self.DoseGrid, 0, 1)
-        self.info['ImagePositionPatient'] = di.ImagePositionPatient
-        self.info['ImageOrientationPatient'] = di.ImageOrientationPatient
-        self.info['PixelSpacing'] = [float(x) for x in di.PixelSpacing]
-        self.info['DoseUnits'] = di.DoseUnits
-
-    def thresholdDose(self):
+        dosevol = di.pixel_array * float(di.DoseGridScaling)
+        if dosevol.ndim == 2:  # single frame
+            dosevol = dosevol[np.newaxis]
+        DoseGrid = np.swapaxes(dosevol, 0, 2)
+        DoseGrid = np.swapaxes(DoseGrid, 0, 1)
+        info = dict(self.info)
+        info['ImagePositionPatient'] = di.ImagePositionPatient
+        info['ImageOrientationPatient'] = di.ImageOrientationPatient
+        info['PixelSpacing'] = [float(x) for x in di.PixelSpacing]
+        info['DoseUnits'] = di.DoseUnits
+        info.update(getDoseGeometry(di, DoseGrid.shape[2]))
+        self.setDoseGrid(DoseGrid, info)
+
+    def setDoseGrid(self, DoseGrid, info):
+        """ take a [Rows, Cols, Frames] grid and its info read elsewhere
+            (e.g. from PatientCache); a new grid as far as version goes """
+        self.DoseGrid = DoseGrid
+        self.info = info
+        self.version += 1
+        self._maxDose = None
+        self._resampled = {}
+
+    @property
+    def maxDose(self):
+        if self._maxDose is None:
+            self._maxDose = float(self.DoseGrid.max())
+        return self._maxDose
+
+    def thresholdDose(self, level):
+        """ [Rows, Cols, Frames] bool grid of where dose >= level (the
+            isodose volume) """
         Image = self.DoseGrid
+        return Image >= level
+
+    def patient2dose(self, patientPoints):
+        """ (N, 3) patient-space points as fractional [row, col, frame]
+            indices into DoseGrid; frames beyond the grid come out as -1 """
+        patientPoints = np.atleast_2d(np.asarray(patientPoints, dtype=float))
+        PA = np.vstack((patientPoints.T, np.ones((1, len(patientPoints)))))
+        indices = self.info['Pat2Pix'].dot(PA)
+        return np.column_stack((indices[1], indices[0],
+                                 self.frame_indices(indices[2])))
+
+    def frame_indices(self, evenFrames):
+        """ true (fractional) frame indices from those Pat2Pix gives, which
+            take the frames as evenly spaced; -1 beyond the grid """
+        offsets = self.info['GridFrameOffsetVector']
+        offsetsMM = offsets[0] + np.asarray(evenFrames, dtype=float) * \
+            self.info['SliceSpacing']
+        if len(offsets) == 1:  # one plane: no thickness to interpolate in
+            return np.where(np.abs(offsetsMM - offsets[0]) < 0.5, 0, -1)
+        # np.interp wants rising offsets; they often fall (0, -2, -4, ...)
+        order = np.argsort(offsets, kind='stable')
+        return np.interp(offsetsMM, offsets[order], order.astype(float),
+                         left=-1, right=-1)
+
+    def sample(self, patientPoints):
+        """ dose at (N, 3) patient-space points (trilinear); 0 outside
+            the grid """
+        indices = self.patient2dose(patientPoints)
+        return spnd.map_coordinates(self.DoseGrid, indices.T, order=1,
+                                    mode='constant', cval=0.0,
+                                    output=np.float64)
+
+    def resample(self, imageInfo, bbox=None, chunkSlices=RESAMPLE_CHUNK,
+                 executor=None):
+        """ Dose (trilinear, float32) at the voxel centres of an image
+
+            ~~ INPUTS ~~
+            - imageInfo (dict): Patient_Image.info (Cols, Rows, NSlices,
+              Pix2Pat)
+            - bbox: [[x0, y0, z0], [x1, y1, z1]] part of the image grid
+              wanted (upper bounds exclusive, as ROIStats.bbox); the whole
+              grid if None
+            - chunkSlices (int): slices worked on at once
+            - executor: with one (e.g. Executors.get_executor()), each
+              chunk of slices is a separate task
+
+            Returns a (x, y, z) array, laid out like ROI masks. Results are
+            kept until a new dose is read; a box inside one already worked
+            out is cut from it.
+        """
+        if self._resampledVersion != self.version:
+            self._resampled = {}
+            self._resampledVersion = self.version
+        shape = (imageInfo['Cols'], imageInfo['Rows'], imageInfo['NSlices'])
+        if bbox is None:
+            bbox = [[0, 0, 0], shape]
+        bbox = np.asarray(bbox, dtype=int)
+        grid = (np.asarray(imageInfo['Pix2Pat'], dtype=float).tobytes(),
+                shape)
+
+        for (cachedGrid, low, high), doses in self._resampled.items():
+            if (cachedGrid == grid and np.all(bbox[0] >= low) and
+                    np.all(bbox[1] <= high)):
+                if np.all(bbox[0] == low) and np.all(bbox[1] == high):
+                    return doses
+                (x0, y0, z0), (x1, y1, z1) = bbox - low
+                return doses[x0:x1, y0:y1, z0:z1]
+
+        doses = self._resample_box(imageInfo['Pix2Pat'], bbox, chunkSlices,
+                                   executor)
+        self._resampled[(grid, tuple(bbox[0]), tuple(bbox[1]))] = doses
+        while len(self._resampled) > RESAMPLE_CACHE_SIZE:
+            del self._resampled[next(iter(self._resampled))]
+        return doses
+
+    def _resample_box(self, pix2pat, bbox, chunkSlices, executor):
+        # image [x, y, z] index to dose [col, row, even frame] index
+        transform = self.info['Pat2Pix'].dot(pix2pat)
+        rotation = transform[0:3, 0:3]
+        separable = np.abs(rotation - np.diag(np.diag(rotation))).max() <= \
+            1e-6 * np.abs(rotation).max()
+
+        (x0, y0, z0), (x1, y1, z1) = bbox
+        doses = np.zeros((x1 - x0, y1 - y0, z1 - z0), dtype=np.float32)
+        chunks = [(start, min(start + chunkSlices, z1))
+                  for start in range(z0, z1, chunkSlices)]
+
+        def run(chunk):
+            start, stop = chunk
+            if separable:
+                block = self._separable_chunk(transform, bbox, start, stop)
+            else:
+                block = self._pointwise_chunk(transform, bbox, start, stop)
+            doses[:, :, start - z0:stop - z0] = block
+
+        if executor is None:
+            for chunk in chunks:
+                run(chunk)
+        else:
+            list(executor.map(run, chunks))
+        return doses
+
+    def _separable_chunk(self, transform, bbox, start, stop):
+        """ image axes run along the dose grid's: trilinear interpolation
+            is a product of 1D ones, so a chunk is three matrix products
+            """
+        (x0, y0, _), (x1, y1, _) = bbox
+        grid = self.DoseGrid
+        Wx = linear_weights(transform[0, 0] * np.arange(x0, x1) +
+                            transform[0, 3], grid.shape[1])
+        Wy = linear_weights(transform[1, 1] * np.arange(y0, y1) +
+                            transform[1, 3], grid.shape[0])
+        Wz = linear_weights(self.frame_indices(
+            transform[2, 2] * np.arange(start, stop) + transform[2, 3]),
+            grid.shape[2])
+
+        used = np.flatnonzero(Wz.any(axis=0))
+        if not len(used):  # beyond the dose grid
+            return np.zeros((x1 - x0, y1 - y0, stop - start))
+        planes = grid[:, :, used].dot(Wz[:, used].T)  # [row, col, k]
+        # summed over cols, then rows; comes out [x, y, k] as laid out
+        return np.matmul(Wy, np.tensordot(Wx, planes, axes=(1, 1)))
+
+    def _pointwise_chunk(self, transform, bbox, start, stop):
+        """ any other orientation: every voxel centre mapped on its own """
+        (x0, y0, _), (x1, y1, _) = bbox
+        xs, ys = np.meshgrid(np.arange(x0, x1), np.arange(y0, y1),
+                             indexing='ij')
+        block = np.zeros((x1 - x0, y1 - y0, stop - start))
+        for k, z in enumerate(range(start, stop)):
+            VA = np.vstack((xs.ravel(), ys.ravel(), np.full(xs.size, z),
+                            np.ones(xs.size)))
+            indices = transform.dot(VA)
+            coords = np.vstack((indices[1], indices[0],
+                                self.frame_indices(indices[2])))
+            block[:, :, k] = spnd.map_coordinates(
+                self.DoseGrid, coords, order=1, mode='constant',
+                cval=0.0).reshape(xs.shape)
+        return block
+
+
+def linear_weights(positions, n):
+    """ (len(positions), n) linear interpolation weights onto 0..n-1;
+        rows for positions outside the grid are all zero """
+    weights = np.zeros((len(positions), n))
+    inside = np.flatnonzero((positions >= 0) & (positions <= n - 1))
+    lower = np.minimum(np.floor(positions[inside]).astype(np.int64),
+                       max(n - 2, 0))
+    fraction = positions[inside] - lower
+    weights[inside, lower] = 1 - fraction
+    if n > 1:
+        weights[inside, lower + 1] += fraction
+    return weights
+
+
+def getDoseGeometry(di, nFrames):
+    """ placement of a dose grid in patient space, from its header
+        - Origin: position of the first voxel centre
+        - R (3x3): rows are the row direction, the column direction and
+          their cross product (the frame direction)
+        - GridFrameOffsetVector: each frame's offset (mm) from Origin
+          along the frame direction
+        - Pix2Pat / Pat2Pix: [col, row, frame] index to patient mm and
+          back, as in image info (using the mean frame spacing) """
+    origin = np.array([float(x) for x in di.ImagePositionPatient])
+    IOP = [float(x) for x in di.ImageOrientationPatient]
+    R = np.array([IOP[0:3], IOP[3:6], np.cross(IOP[0:3], IOP[3:6])])
+
+    if 'GridFrameOffsetVector' in di and di.GridFrameOffsetVector:
+        offsets = np.atleast_1d(np.array(di.GridFrameOffsetVector,
+                                         dtype=float))
+    else:
+        offsets = np.zeros(1)
+    offsets = offsets[0:nFrames]
+    if offsets[0] != 0:
+        # "type b": offsets are positions along the frame direction
+        offsets = offsets - R[2].dot(origin)
+
+    rowSpacing, colSpacing = [float(x) for x in di.PixelSpacing]
+    frameSpacing = 1.0
+    if len(offsets) > 1:
+        frameSpacing = (offsets[-1] - offsets[0]) / (len(offsets) - 1)
+
+    Pix2Pat = np.eye(4)
+    Pix2Pat[0:3, 0:3] = R.T.dot(np.diag([colSpacing, rowSpacing,
+                                         frameSpacing]))
+    Pix2Pat[0:3, 3] = origin + R[2] * offsets[0]
+
+    return {'Rows': int(di.Rows),
+            'Cols': int(di.Columns),
+            'NFrames': int(nFrames),
+            'Origin': origin,
+            'R': R,
+            'GridFrameOffsetVector': offsets,
+            'SliceSpacing': frameSpacing,
+            'Pix2Pat': Pix2Pat,
+            'Pat2Pix': np.linalg.inv(Pix2Pat)}
 
 
 if __name__ == "__main__":
@@ -2,14 +2,23 @@
 
 import numpy as np
 import os
+import struct
 from copy import deepcopy
-from multiprocessing.pool import ThreadPool
+from concurrent.futures import ProcessPoolExecutor
 
 try:
     import dicom as dicom
 except:
     import pydicom as dicom
 
+from dicommodule.HeaderIndex import build_header_index, read_dicom_header
+from dicommodule.Executors import get_decode_executor
+from dicommodule.LazyVolume import LazyVolume, DEFAULT_BUDGET
+
+# transfer syntaxes whose PixelData can be mapped straight from the file
+MEMMAP_SYNTAXES = ('1.2.840.10008.1.2',  # Implicit VR Little Endian
+                   '1.2.840.10008.1.2.1')  # Explicit VR Little Endian
+
 modality_dict = {'MR': '1.2.840.10008.5.1.4.1.1.4',
                  'US': '1.2.840.10008.5.1.4.1.1.6.1',
                  'US_Multiframe': '1.2.840.10008.5.1.4.1.1.3.1',
@@ -26,9 +35,13 @@ class Patient_Image(object):
         Patient2Pixels Transform
         Pixels2Patient Transform
         UID2IPP
+
+    lazy=True makes Data a LazyVolume: slices are only decoded when first
+    indexed, and at most cacheBudget bytes of them are kept in memory.
     """
 
-    def __init__(self, fileList=(), revRot=False):
+    def __init__(self, fileList=(), revRot=False, lazy=False,
+                 cacheBudget=DEFAULT_BUDGET):
 
         # must have fileList attribute
         # must all belong to same reference set
@@ -46,6 +59,8 @@ class Patient_Image(object):
                      'Pat2Pix': np.eye(4)}
 
         self.revRot = revRot
+        self.lazy = lazy
+        self.cacheBudget = cacheBudget
 
         if bool(fileList):
             self.setData(fileList=fileList)
@@ -53,31 +68,48 @@ class Patient_Image(object):
     def get_Image_Info(self, multiframe):
         pass
 
-    def setData(self, fileList):
+    def setData(self, fileList, headerIndex=None):
         """ some DICOM exporters put the whole set into a single file
             this must be handled differently than when each slices gets its
-            own file.  Can check for this by looking up SOPClassUID) """
+            own file.  Can check for this by looking up SOPClassUID)
+            headerIndex: {filePath: header} from discovery, if available;
+            any file missing from it gets a single header-only read here """
 
-        self.ImageModality = get_image_modality(fileList[0])
-        multiframe = is_file_multiframe(fileList[0])
+        headerIndex = build_header_index(fileList, headerIndex)
+        header0 = headerIndex[fileList[0]]
 
-        info = self.info = getStaticDicomSizeProps(fileList[0], self.info)
+        self.ImageModality = get_image_modality(fileList[0], header0)
+        multiframe = is_file_multiframe(fileList[0], header0)
+
+        info = self.info = getStaticDicomSizeProps(fileList[0], self.info,
+                                                   header=header0)
 
         if multiframe:
-            dcm = dicom.read_file(fileList[0])
-            self.data = dcm.pixel_array
-            self.d = np.transpose(self.data, [1, 2, 0])
+            frames = getMultiframePixelData(fileList[0], header0)
+            # [frames, rows, cols] -> [rows, cols, frames], as a view
+            self.data = np.transpose(frames, [1, 2, 0])
+            self.d = self.data
             info['NSlices'] = self.data.shape[2]
-            info['SliceSpacing'] = float(dcm.SliceThickness)
-            info['ImagePositionPatient'] = np.asarray(dcm.ImagePositionPatient)
+            info['SliceSpacing'] = float(header0['SliceThickness'])
+            info['ImagePositionPatient'] = np.asarray(
+                header0['ImagePositionPatient'])
             info['R'] = info['ImageOrientationPatient']
             info['RT'] = info['ImageOrientationPatient'].T
             sliceLoc0 = info['ImagePositionPatient']
 
         else:
             info['NSlices'] = len(fileList)
-            self.get_sliceVariable_Properties(fileList)
-            self.data = self.get_pixel_data()
+            self.get_sliceVariable_Properties(fileList, headerIndex)
+            if self.lazy:
+                self.data = LazyVolume(shape=(info['Rows'], info['Cols'],
+                                              info['NSlices']),
+                                       dtype=getPixelDtype(header0),
+                                       loader=self.get_slice_pixels,
+                                       budget=self.cacheBudget)
+            else:
+                self.data = self.get_pixel_data(
+                    dtype=getPixelDtype(header0),
+                    transferSyntax=header0['TransferSyntaxUID'])
             sliceLoc0 = info['UID2IPP'][self.UID_zero]
 
         info['R'] = info['ImageOrientationPatient']
@@ -99,8 +131,9 @@ class Patient_Image(object):
         strang = "Image Object: {} slices".format(self.info['NSlices'])
         return strang
 
-    def get_sliceVariable_Properties(self, imFileList):
-        """ a dictionary to map UID to property dictionary"""
+    def get_sliceVariable_Properties(self, imFileList, headerIndex=None):
+        """ a dictionary to map UID to property dictionary
+            slice order comes from headers alone; no pixel data is read """
         # sp = self.staticProperties
         info = self.info
         self.dataDict = {}
@@ -108,8 +141,9 @@ class Patient_Image(object):
         tempLocList = []
         tempUIDList = []
         # tempPosList = []
-        pool = ThreadPool(self.info['NSlices'])
-        results = pool.map(func=getDicomPixelData, iterable=imFileList)
+        headerIndex = build_header_index(imFileList, headerIndex)
+        results = [getDicomSliceGeometry(x, headerIndex[x])
+                   for x in imFileList]
 
         for ind, entry in enumerate(results):  # each dicom's data
             thisUID = entry['UID']
@@ -142,15 +176,31 @@ class Patient_Image(object):
         ipp1 = info['UID2IPP'][uid1]
         info['SliceSpacing'] = np.linalg.norm(ipp1 - ipp0)
 
-    def get_pixel_data(self):
-        pixelData = np.zeros([self.info['Rows'],
+    def get_pixel_data(self, dtype=np.uint16, transferSyntax=None):
+        """ decode every slice straight into its place in one volume """
+        pixelData = np.empty([self.info['Rows'],
                               self.info['Cols'],
-                              self.info['NSlices']], dtype=np.uint16)
-        for uid in self.dataDict:
-            ind = self.info['UID2Ind'][uid]
-            pixelData[:, :, ind] = self.dataDict[uid]['PixelData']
+                              self.info['NSlices']], dtype=dtype)
+        fileNames = [self.dataDict[self.info['Ind2UID'][ind]]['FileName']
+                     for ind in range(self.info['NSlices'])]
+
+        pool = get_decode_executor(transferSyntax)
+        if isinstance(pool, ProcessPoolExecutor):
+            # can't write into our memory from another process
+            arrays = pool.map(getDicomPixelArray, fileNames)
+            for ind, array in enumerate(arrays):
+                pixelData[:, :, ind] = array
+        else:
+            list(pool.map(decodeSliceInto, fileNames,
+                          [pixelData] * len(fileNames),
+                          range(len(fileNames))))
         return pixelData
 
+    def get_slice_pixels(self, index):
+        """ decode the single slice at (sorted) index """
+        uid = self.info['Ind2UID'][index]
+        return getDicomPixelArray(self.dataDict[uid]['FileName'])
+
     def GetPatient2Pixels(self, sliceLoc0, R=np.eye(3)):
         """ Transformaton of Patient Coordinate to Pixel Indices
             """
@@ -214,71 +264,149 @@ class Patient_Image(object):
         print(prettyString)
 
 
-def getStaticDicomSizeProps(imFile, staticProps={}):
+def getStaticDicomSizeProps(imFile, staticProps={}, header=None):
     # set the DICOM properties that remain constant for all image files
-    di = dicom.read_file(imFile)
+    if header is None:
+        header = read_dicom_header(imFile)
     # staticProps = {}
-    staticProps['ImageOrientationPatient'] = getImOrientationMatrix(di)
-    try:
-        staticProps['IOP'] = di.ImageOrientationPatient
-    except AttributeError:
+    staticProps['ImageOrientationPatient'] = getImOrientationMatrix(header)
+    if header['ImageOrientationPatient'] is not None:
+        staticProps['IOP'] = header['ImageOrientationPatient']
+    else:
         staticProps['IOP'] = [1, 0, 0, 0, 1, 0]
-    staticProps['Rows'] = di.Rows
-    staticProps['Cols'] = di.Columns
-    staticProps['PixelSpacing'] = [float(pxsp) for pxsp in di.PixelSpacing]
+    staticProps['Rows'] = header['Rows']
+    staticProps['Cols'] = header['Cols']
+    staticProps['PixelSpacing'] = [float(pxsp) for pxsp in
+                                   header['PixelSpacing']]
 
-    staticProps['PatientName'] = di.PatientName
+    staticProps['PatientName'] = header['PatientName']
 
-    try:
-        staticProps['PatientPosition'] = di.PatientPosition
-        print("Patient Position: {}".format(di.PatientPosition))
-    except AttributeError:
+    if header['PatientPosition'] is not None:
+        staticProps['PatientPosition'] = header['PatientPosition']
+        print("Patient Position: {}".format(header['PatientPosition']))
+    else:
         print("No Patient Position field")
         staticProps['PatientPosition'] = ''
     return staticProps
 
 
-def is_file_multiframe(filepath):
-    dcm = dicom.read_file(filepath)
+def is_file_multiframe(filepath, header=None):
+    if header is None:
+        header = read_dicom_header(filepath)
     multifile_CLASSUID = '1.2.840.10008.5.1.4.1.1.3.1'
-    multiframe = True if dcm.SOPClassUID == multifile_CLASSUID else False
+    multiframe = True if header['SOPClassUID'] == multifile_CLASSUID else False
     return multiframe
 
 
-def get_image_modality(filepath):
-    dcm = dicom.read_file(filepath)
-    IM_CLASS = dcm.SOPClassUID
+def get_image_modality(filepath, header=None):
+    if header is None:
+        header = read_dicom_header(filepath)
+    IM_CLASS = header['SOPClassUID']
     for modality in modality_dict.keys():
         if IM_CLASS in modality_dict[modality]:
             return modality
 
 
-def getDicomPixelData(filePath):
-    di = dicom.read_file(filePath)
-    imageOrientation = getImOrientationMatrix(di)
-    imPos = np.array([float(x) for x in di.ImagePositionPatient])
+def getPixelDtype(header):
+    """ numpy dtype matching the stored pixels (BitsAllocated & sign) """
+    bits = header.get('BitsAllocated') or 16
+    signed = bool(header.get('PixelRepresentation'))
+    if bits <= 8:
+        return np.int8 if signed else np.uint8
+    elif bits <= 16:
+        return np.int16 if signed else np.uint16
+    return np.int32 if signed else np.uint32
+
+
+def getDicomSliceGeometry(filePath, header=None):
+    """ per-slice position properties, from the header only """
+    if header is None:
+        header = read_dicom_header(filePath)
+    imageOrientation = getImOrientationMatrix(header)
+    imPos = np.array([float(x) for x in header['ImagePositionPatient']])
     sliceLoc = imageOrientation.dot(imPos)[2]
-    pixelData = np.asarray(di.pixel_array)
-    thisDiDict = {'UID': di.SOPInstanceUID,
+    thisDiDict = {'UID': header['SOPInstanceUID'],
                   'ImagePositionPatient': imPos,
                   'SliceLocation': sliceLoc,
-                  'PixelData': pixelData,
                   'FileName': filePath}
     return thisDiDict
 
 
+def getMultiframePixelData(filePath, header=None):
+    """ [frames, rows, cols] pixels of a multiframe file; a read-only
+        np.memmap of the file when the pixel data is stored uncompressed """
+    if header is None:
+        header = read_dicom_header(filePath)
+    frames = memmapPixelData(filePath, header)
+    if frames is None:
+        frames = dicom.read_file(filePath).pixel_array
+    return frames
+
+
+def memmapPixelData(filePath, header):
+    """ map PixelData of a little-endian, uncompressed, single-sample file
+        returns None if the file isn't laid out that way """
+    if header['TransferSyntaxUID'] not in MEMMAP_SYNTAXES:
+        return None
+    if (header['SamplesPerPixel'] or 1) != 1:
+        return None
+    if header['BitsAllocated'] not in (8, 16, 32):
+        return None
+
+    nFrames = int(header['NumberOfFrames'] or 1)
+    shape = (nFrames, header['Rows'], header['Cols'])
+    dtype = np.dtype(getPixelDtype(header)).newbyteorder('<')
+
+    # reading stops (and rewinds) at the start of the PixelData element
+    with open(filePath, 'rb') as fp:
+        dicom.read_file(fp, force=True, stop_before_pixels=True)
+        elementStart = fp.tell()
+        elementHeader = fp.read(12)
+
+    if len(elementHeader) < 12 or \
+            struct.unpack('<HH', elementHeader[0:4]) != (0x7FE0, 0x0010):
+        return None
+
+    if header['TransferSyntaxUID'] == MEMMAP_SYNTAXES[0]:  # implicit VR
+        length, = struct.unpack('<I', elementHeader[4:8])
+        offset = elementStart + 8
+    else:  # explicit VR: OB / OW have a 2 byte pad before a 4 byte length
+        length, = struct.unpack('<I', elementHeader[8:12])
+        offset = elementStart + 12
+
+    if length == 0xFFFFFFFF or length < np.prod(shape) * dtype.itemsize:
+        return None  # encapsulated, or not what the header promised
+
+    return np.memmap(filePath, dtype=dtype, mode='r', offset=offset,
+                     shape=shape)
+
+
+def getDicomPixelArray(filePath):
+    return dicom.read_file(filePath).pixel_array
+
+
+def decodeSliceInto(filePath, volume, index):
+    """ decode filePath, write it into volume[:, :, index] """
+    volume[:, :, index] = dicom.read_file(filePath).pixel_array
+
+
 def getImOrientationMatrix(di):
     # get the Volume Rotation from file (remains const)
     if isinstance(di, str):
-        di = dicom.read_file(di)
+        di = read_dicom_header(di)
     # try:
     #     patPos = di.PatientPosition
     # except AttributeError as AE:
     #     patPos = None
-    try:
-        imOr = di.ImageOrientationPatient  # Field exists in both US and MR
-    except AttributeError:
-        imOr = [1, 0, 0, 0, 1, 0]
+    if isinstance(di, dict):  # a HeaderIndex entry
+        imOr = di['ImageOrientationPatient']
+        if imOr is None:
+            imOr = [1, 0, 0, 0, 1, 0]
+    else:
+        try:
+            imOr = di.ImageOrientationPatient  # Field exists in both US and MR
+        except AttributeError:
+            imOr = [1, 0, 0, 0, 1, 0]
     v1Str = imOr[0:3]
     v2Str = imOr[3:]
     V1 = np.array([float(x) for x in v1Str])
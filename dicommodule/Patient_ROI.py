@@ -5,6 +5,7 @@
 
 # Built-In Modules
 import os
+import threading
 # import sys
 
 # Third-Party Modules
@@ -19,6 +20,13 @@ except ImportError:
 
 import pyqtgraph as pg
 
+from dicommodule.ROI_Masks import (new_mask, as_mask, fill_contours,
+                                   CroppedMask, LazyContourMask)
+from dicommodule.ROI_Stats import ROIStats
+from dicommodule.ROI_Distance import SignedDistanceField, DEFAULT_BAND
+from dicommodule.ROI_Mesh import mesh_mask
+from dicommodule.ROI_DVH import compute_dvh, DEFAULT_BIN_WIDTH
+
 
 class Patient_ROI_Obj(object):
 
@@ -33,7 +41,25 @@ class Patient_ROI_Obj(object):
                  hidden=False,
                  enablePlotting=False,
                  dataVolume=None,
-                 imageInfo=None):
+                 imageInfo=None,
+                 storage='uint8',
+                 rasterize=True):
+        """ storage: how DataVolume is kept, 'uint8', 'bool', 'packed'
+            (bit-packed), 'cropped' (bounding box), 'rle' (row runs) or
+            'lazy' (kept as contours, filled per slice when read); see
+            ROI_Masks.py
+            rasterize: fill DataVolume from contour now; if False, call
+            rasterize() (or rasterize_ROIs) later
+
+            Edits made through set_slice() are tracked: dirtySlices holds
+            the slices changed since the ROI was loaded or last saved, and
+            version goes up with every change. An ROI not read from a
+            file starts out wholly dirty (allDirty).
+            stats (see ROI_Stats.py) is worked out when first asked for,
+            and kept up to date by set_slice(); so is distance_field()
+            (see ROI_Distance.py). mesh() and dvh() are kept until the
+            next change.
+            """
 
         self.Name = name
         self.Number = number
@@ -44,13 +70,33 @@ class Patient_ROI_Obj(object):
         self.id = uuid.uuid4()
         self.polyCompression = 0
         self.vector = []  # list of plottable items
+        self.storage = storage
         self.DataVolume = dataVolume
+        if dataVolume is not None:
+            self.DataVolume = as_mask(dataVolume, storage)
 
         if enablePlotting:
             self.makePlottable()
 
+        self.sliceContours = {}
+        self.version = 0
+        self.dirtySlices = set()
+        self.allDirty = False
+        self._stats = None
+        self._statsVersion = None
+        self._field = None
+        self._fieldVersion = None
+        self._fieldEdits = None  # box of voxels edited since the field
+        self._meshes = {}
+        self._meshVersion = None
+        self._dvhs = {}
+        self._dvhVersion = None
         self.setImageInfo(imageInfo)
-        self.setData(structure=structure, contour=contour)
+        self.setData(structure=structure, contour=contour,
+                     rasterize=rasterize)
+
+        if contour is None:
+            self.mark_dirty()  # nothing of it is in a file yet
 
     def __str__(self):
         return "Region of Interest {}: {}".format(self.Number, self.Name)
@@ -65,9 +111,9 @@ class Patient_ROI_Obj(object):
         self.volSize = (self.imageInfo['Cols'], self.imageInfo['Rows'],
                         self.imageInfo['NSlices'])
         if self.DataVolume is None:
-            self.DataVolume = np.zeros(self.volSize)
+            self.DataVolume = new_mask(self.volSize, self.storage)
 
-    def setData(self, structure, contour):
+    def setData(self, structure, contour, rasterize=True):
         if structure is not None:
 
             self.Name = structure.ROIName.lower()
@@ -82,21 +128,163 @@ class Patient_ROI_Obj(object):
             try:
                 contourSequence = contour.ContourSequence
                 self.nContours = len(contourSequence)
+                self.sliceContours = ContourSequence2SliceContours(
+                    contourSequence, self.imageInfo['Pat2Pix'])
+                if isinstance(self.DataVolume, LazyContourMask):
+                    self.DataVolume.set_contours(self.sliceContours)
 
-                for contour in contourSequence:
-                    PA = ContourData2PatientArray(contour.ContourData)
-                    VA = Patient2VectorArray(PA, self.imageInfo['Pat2Pix'])
+            except:
+                print("NO CONTOUR SEQUENCE< WHAT {}".format(self.Name))
+                return
+
+            if rasterize:
+                self.rasterize()
+
+    def rasterize(self, executor=None):
+        """ fill DataVolume from self.sliceContours; see rasterize_ROIs """
+        rasterize_ROIs([self], executor)
+
+    def rasterize_slice(self, sliceIndex, CVContours, lock=None):
+        """ Fill contours into one slice of DataVolume, drawing only
+            within their bounding box. Safe to run on different slices of
+            one ROI at once; lock guards mask types that aren't plain
+            arrays. """
+        cols, rows, nSlices = self.volSize
+        if not 0 <= sliceIndex < nSlices:
+            print("{}: contour off the image, slice {}".format(self.Name,
+                                                               sliceIndex))
+            return
 
-                    CA = [VectorArray2CVContour(VA)]
-                    ImSlice = CVContour2ImageArray(CA, self.volSize[1],
-                                                   self.volSize[0])
-                    ind = int(np.around(VA[2, 0]))
-                    self.DataVolume[:, :, ind] += ImSlice.copy()
+        filled = fill_contours(CVContours, cols, rows)
+        if filled is None:
+            return
+        x0, y0, patch = filled
+        x1, y1 = x0 + patch.shape[0], y0 + patch.shape[1]
 
-                self.DataVolume[self.DataVolume > 0] = 1
+        if isinstance(self.DataVolume, np.ndarray):
+            # slices don't overlap in memory: no lock needed
+            region = self.DataVolume[x0:x1, y0:y1, sliceIndex]
+            region[patch > 0] = 1
+            return
 
-            except:
-                print("NO CONTOUR SEQUENCE< WHAT {}".format(self.Name))
+        with lock or threading.Lock():
+            ImSlice = self.DataVolume[:, :, sliceIndex]
+            ImSlice[x0:x1, y0:y1] |= patch > 0
+            self.DataVolume[:, :, sliceIndex] = ImSlice
+
+    def get_slice(self, sliceIndex):
+        """ (Cols, Rows) uint8 copy of one slice of the mask """
+        return np.array(self.DataVolume[:, :, sliceIndex], dtype=np.uint8)
+
+    def set_slice(self, sliceIndex, ImSlice):
+        """ replace one slice of the mask (nonzero is inside) """
+        ImSlice = np.asarray(ImSlice) > 0
+        # the slice's contours from the file no longer describe it
+        self.sliceContours.pop(sliceIndex, None)
+        fieldCurrent = self._fieldVersion == self.version
+        if fieldCurrent:
+            changed = self.DataVolume[:, :, sliceIndex] != ImSlice
+        self.DataVolume[:, :, sliceIndex] = ImSlice
+        statsCurrent = self._statsVersion == self.version
+        self.mark_dirty([sliceIndex])
+        if statsCurrent:
+            self._stats.update_slice(sliceIndex, ImSlice)
+            self._statsVersion = self.version
+        if fieldCurrent:  # redone around the change when next asked for
+            self._note_field_edit(changed, sliceIndex)
+            self._fieldVersion = self.version
+
+    @property
+    def stats(self):
+        """ ROIStats of the mask, re-worked only after changes """
+        if self._statsVersion != self.version:
+            self._stats = ROIStats(self.DataVolume,
+                                   getattr(self, 'imageInfo', None))
+            self._statsVersion = self.version
+        return self._stats
+
+    def distance_field(self, band=None):
+        """ SignedDistanceField of the ROI, in mm, exact to band mm from
+            its surface (default: as last asked for, or DEFAULT_BAND);
+            kept between calls, and only redone near edits made since """
+        if band is None:
+            band = DEFAULT_BAND if self._field is None else self._field.band
+        if self._fieldVersion != self.version or self._field.band != band:
+            self._field = SignedDistanceField(
+                self.DataVolume, self.stats.spacing, band=band,
+                bbox=self.stats.bbox, pat2pix=self.imageInfo.get('Pat2Pix'))
+        elif self._fieldEdits is not None:
+            self._field.update(self.DataVolume, self._fieldEdits,
+                               bbox=self.stats.bbox)
+        self._fieldEdits = None
+        self._fieldVersion = self.version
+        return self._field
+
+    def _note_field_edit(self, changed, sliceIndex):
+        """ grow the box of edited voxels by the changed pixels of a slice """
+        xs = np.flatnonzero(changed.any(axis=1))
+        ys = np.flatnonzero(changed.any(axis=0))
+        if not len(xs):
+            return
+        editBox = np.array([[xs[0], ys[0], sliceIndex],
+                            [xs[-1] + 1, ys[-1] + 1, sliceIndex + 1]])
+        if self._fieldEdits is not None:
+            editBox = np.array([np.minimum(editBox[0], self._fieldEdits[0]),
+                                np.maximum(editBox[1], self._fieldEdits[1])])
+        self._fieldEdits = editBox
+
+    def mesh(self, step=1, decimate=None):
+        """ ROIMesh of the ROI's surface in patient mm (see ROI_Mesh.py);
+            kept, per (step, decimate), until the ROI next changes """
+        if self._meshVersion != self.version:
+            self._meshes = {}
+            self._meshVersion = self.version
+        key = (step, decimate)
+        if key not in self._meshes:
+            self._meshes[key] = mesh_mask(self.DataVolume,
+                                          self.imageInfo['Pix2Pat'],
+                                          bbox=self.stats.bbox, step=step,
+                                          decimate=decimate)
+        return self._meshes[key]
+
+    def save_mesh(self, filePath, step=1, decimate=None):
+        """ write the ROI's surface as binary STL or PLY """
+        self.mesh(step, decimate).save(filePath, name=self.Name)
+
+    def dvh(self, dose, binWidth=DEFAULT_BIN_WIDTH):
+        """ DVH of the ROI in a Patient_Dose (see ROI_DVH.py); kept, per
+            dose, until the ROI or the dose next changes """
+        if self._dvhVersion != self.version:
+            self._dvhs = {}
+            self._dvhVersion = self.version
+        key = (dose, dose.version, binWidth)
+        if key not in self._dvhs:
+            self._dvhs[key] = compute_dvh(self.DataVolume, self.imageInfo,
+                                          dose, bbox=self.stats.bbox,
+                                          binWidth=binWidth, name=self.Name)
+        return self._dvhs[key]
+
+    def distance(self, patientPoints):
+        """ signed distance in mm from each (N, 3) patient-space point
+            to the ROI's surface; negative inside """
+        return self.distance_field().distance(patientPoints)
+
+    def mark_dirty(self, sliceIndices=None):
+        """ note slices as changed since the last save (all if None);
+            call this after writing to DataVolume directly """
+        if sliceIndices is None:
+            self.allDirty = True
+        else:
+            self.dirtySlices.update(int(z) for z in sliceIndices)
+        self.version += 1
+
+    def mark_clean(self):
+        """ the mask now matches what's on file """
+        self.dirtySlices = set()
+        self.allDirty = False
+
+    def isDirty(self):
+        return self.allDirty or bool(self.dirtySlices)
 
     def makePlottable(self):
         plottable = pg.PlotDataItem(antialias=True,
@@ -131,6 +319,102 @@ def mkNewContour(ContourData, contourNumber=1):
     return contour
 
 
+def rasterize_ROIs(ROIs, executor=None):
+    """ Fill each ROI's DataVolume from its sliceContours, which are then
+        dropped (a lazy ROI's mask keeps its own copy). With an executor
+        (e.g. Executors.get_executor()), every slice of every ROI is a
+        separate task; cv2 drops the GIL while it draws. """
+    tasks = []
+    for ROI in ROIs:
+        if isinstance(ROI.DataVolume, LazyContourMask):
+            continue  # fills its slices itself, as they're read
+        lock = threading.Lock()
+        for sliceIndex, CVContours in ROI.sliceContours.items():
+            tasks.append((ROI, sliceIndex, CVContours, lock))
+
+    def run(task):
+        ROI, sliceIndex, CVContours, lock = task
+        ROI.rasterize_slice(sliceIndex, CVContours, lock)
+
+    if executor is None:
+        for task in tasks:
+            run(task)
+    else:
+        list(executor.map(run, tasks))
+
+    for ROI in ROIs:
+        if isinstance(ROI.DataVolume, CroppedMask):
+            ROI.DataVolume.crop()  # drop the growth margins
+        if not isinstance(ROI.DataVolume, LazyContourMask):
+            ROI.sliceContours = {}  # the mask holds them now
+        ROI.version += 1  # new contents, though not an edit to save
+
+
+def ContourSequence2SliceIndices(contourSequence, pat2pix):
+    """ Image slice each contour of a ContourSequence lies on
+    input: a ContourSequence right from a dicom file, Pat2Pix transform
+    output: list of slice indices (None for a contour with no points)
+    """
+    points, offsets = ContourSequence2PatientArray(contourSequence)
+    hasPoints = offsets[1:] > offsets[:-1]
+    firstPoints = points[offsets[:-1][hasPoints]]
+    PA = np.vstack((firstPoints.T, np.ones((1, len(firstPoints)))))
+    zIndices = iter(np.around(Patient2VectorArray(PA, pat2pix)[2, :]))
+    return [int(next(zIndices)) if has else None for has in hasPoints]
+
+
+def ContourSequence2SliceContours(contourSequence, pat2pix):
+    """ Contours of an ROI in pixel space, grouped by slice
+    input: a ContourSequence right from a dicom file, Pat2Pix transform
+    output: {sliceIndex: [OpenCV contours]}
+    """
+    # every point of the ROI, mapped to pixels in one go
+    points, offsets = ContourSequence2PatientArray(contourSequence)
+    PA = np.vstack((points.T, np.ones((1, len(points)))))
+    allVA = Patient2VectorArray(PA, pat2pix)
+
+    sliceContours = {}
+    for index in range(len(offsets) - 1):
+        VA = allVA[:, offsets[index]:offsets[index + 1]]
+        sliceIndex = int(np.around(VA[2, 0]))
+        sliceContours.setdefault(sliceIndex, []).append(
+            VectorArray2CVContour(VA))
+    return sliceContours
+
+
+def ContourSequence2PatientArray(contourSequence):
+    """ Parses every contour of an ROI at once
+    input: a ContourSequence right from a dicom file
+    output: (Nx3 numpy array of all points in patient coordinates,
+             offsets: contour i is points[offsets[i]:offsets[i + 1]])
+    The DS text of all contours is joined and converted in one numpy call,
+    skipping pydicom's per-value conversion where the data is still raw.
+    """
+    raws = [_raw_contour_data(contour) for contour in contourSequence]
+    try:
+        counts = [raw.count(b'\\') + 1 for raw in raws]
+        values = b'\\'.join(raws).split(b'\\')
+        flatArray = np.array(values).astype(np.float64)
+    except (AttributeError, ValueError):  # not raw bytes: convert each
+        arrays = [np.asarray(contour.ContourData, dtype=np.float64)
+                  for contour in contourSequence]
+        counts = [len(array) for array in arrays]
+        flatArray = np.concatenate(arrays) if arrays else np.zeros(0)
+
+    offsets = np.concatenate([[0], np.cumsum(counts) // 3]).astype(int)
+    return flatArray.reshape((-1, 3)), offsets
+
+
+def _raw_contour_data(contour):
+    """ the undecoded bytes of ContourData, or None once pydicom has
+        converted it """
+    try:
+        value = contour.get_item('ContourData').value
+    except (AttributeError, KeyError):
+        return None
+    return value if isinstance(value, bytes) else None
+
+
 def ContourData2PatientArray(contourData):
     """ Transforms data found in DICOM file into usable vector array
     input: a contour sequence right from a dicom file
@@ -153,10 +437,15 @@ def PatientArray2ContourData(VectorArray):
             Save as list of strings
     input: 4xN 2-D numpy array <X..; Y..; Z..; 1..>
     output: 1-D list of strings ['x','y','z','x','y','z'...]
+    Formatted in one go, to 6 decimals (under 1e-6 mm off), which fits
+    the 16 characters of a DICOM DS value for any |x| < 1e8 mm.
     """
     rows, cols = VectorArray.shape
     flatArray = VectorArray[0:3, :].flatten(order='F')
-    return [str(x) for x in flatArray]
+    if not len(flatArray):
+        return []
+    formatString = '\\'.join(['%.6f'] * len(flatArray))
+    return (formatString % tuple(flatArray.tolist())).split('\\')
 
 # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 
@@ -221,10 +510,13 @@ def CVContour2VectorArray(CVContour, sliceZ):
 # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 
 
-def CVContour2ImageArray(CVContour, rows, cols):
+def CVContour2ImageArray(CVContour, rows, cols, offset=(0, 0)):
     """ Transforms vector sequence to binary image
     input: List of contours points (as opencv likes them)
-    output: binary image
+           offset: (x, y) added to every point, to draw into a sub-image
+    output: binary image; the contours are filled together, even-odd, so
+            one inside another (as ImageArray2CVContour gives for a ring)
+            is a hole
     """
 
     assert(type(CVContour) == list)
@@ -233,12 +525,13 @@ def CVContour2ImageArray(CVContour, rows, cols):
 
     contourImageOut = np.zeros((rows, cols))  # , dtype=np.uint8)
 
-    contourImageOut = cv2.drawContours(image=contourImageOut.copy(),
+    contourImageOut = cv2.drawContours(image=contourImageOut,
                                        contours=CVContour,
                                        contourIdx=-1,
                                        color=(255, 255, 255),
                                        thickness=-1,
-                                       lineType=cv2.LINE_AA).astype(np.uint8)
+                                       lineType=cv2.LINE_AA,
+                                       offset=offset).astype(np.uint8)
 
     return contourImageOut.T
 
@@ -248,10 +541,12 @@ def ImageArray2CVContour(ImageArray, compression=0):
     input: ImageArray must be a binary image/raster of the contour object
     output: vector list of contours
     """
-    _imageArray = ImageArray.copy().astype(np.uint8)
-    im, contours, hierarchy = cv2.findContours(_imageArray,
-                                               cv2.RETR_TREE,
-                                               cv2.CHAIN_APPROX_SIMPLE)
+    _imageArray = np.array(ImageArray, dtype=np.uint8, order='C')
+    # last two outputs: OpenCV 3 returns 3 values, OpenCV 4 returns 2
+    contours, hierarchy = cv2.findContours(_imageArray,
+                                           cv2.RETR_TREE,
+                                           cv2.CHAIN_APPROX_SIMPLE)[-2:]
+    contours = list(contours)
 
     if not compression == 0:
         # compression = int(compression)
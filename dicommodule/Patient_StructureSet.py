@@ -5,6 +5,7 @@
 import os
 
 # Third-Party Modules
+import numpy as np
 
 try:
     import dicom as dicom
@@ -16,22 +17,35 @@ from dicommodule.Patient_ROI import (Patient_ROI_Obj, mkNewROIObs_dataset,
                                      PatientArray2ContourData,
                                      Vector2PatientArray,
                                      CVContour2VectorArray,
-                                     ImageArray2CVContour)
+                                     ImageArray2CVContour,
+                                     ContourSequence2SliceIndices,
+                                     rasterize_ROIs)
+from dicommodule.Executors import get_executor
 
 
-from dicommodule.ROI_Manipulations import (mirror_ROI_about_centroid_of_other,)
+from dicommodule.ROI_Masks import RLEMask, occupied_slices
+from dicommodule.ROI_Manipulations import (mirror_ROI_about_centroid_of_other,
+                                            margin_mask)
+from dicommodule.ROI_Boolean import combine_masks
 # from dicommodule.Patient_Catheter import CatheterObj
 
 
 class Patient_StructureSet(object):
 
     def __init__(self, file=None, dcm=None, imageInfo={}, linewidth=1,
-                 *args, **kwargs):
+                 maskStorage='uint8', *args, **kwargs):
+        """ maskStorage: 'uint8', 'bool', 'packed', 'cropped', 'rle' or
+            'lazy'; how each ROI's DataVolume is kept (see ROI_Masks.py).
+            With 'lazy', loading only parses contours; a slice is filled
+            the first time it's read. """
         super().__init__(*args, **kwargs)
 
         self.ROI_List = []
         self.ROI_byName = {}
+        self.filePath = None
+        self._di = None
         self.lineWidth = linewidth
+        self.maskStorage = maskStorage
         self.setImageInfo(imageInfo)
         self.activeROI = None
 
@@ -45,6 +59,18 @@ class Patient_StructureSet(object):
     def __str__(self):
         return "Contour Structure Set"
 
+    @property
+    def di(self):
+        """ the RTSTRUCT dataset; re-read from filePath when first needed
+            (e.g. a patient restored from PatientCache.py) """
+        if self._di is None and self.filePath is not None:
+            self._di = dicom.read_file(self.filePath, force=True)
+        return self._di
+
+    @di.setter
+    def di(self, dataset):
+        self._di = dataset
+
     def makePlottable(self):
         for ROI in self.ROI_List:
             ROI.makePlottable()
@@ -71,17 +97,24 @@ class Patient_StructureSet(object):
         if bool(imageInfo):
             self.setImageInfo(imageInfo)
 
+        self.filePath = filePath
         self.di = di = dicom.read_file(filePath, force=True)
         (self.fileroot, self.SSFile) = os.path.split(filePath)
 
+        newROIs = []
         for index, contour in enumerate(di.ROIContourSequence):
             try:
                 structure = di.StructureSetROISequence[index]
                 self.FrameRef_UID = structure.ReferencedFrameOfReferenceUID
             except AttributeError as ae:
                 structure = 0
-            self.add_ROI(structure=structure, contour=contour,
-                         imageInfo=self.imageInfo)
+            newROIs.append(self.add_ROI(structure=structure, contour=contour,
+                                        imageInfo=self.imageInfo,
+                                        storage=self.maskStorage,
+                                        rasterize=False))
+
+        # every slice of every ROI at once, on the shared thread pool
+        rasterize_ROIs(newROIs, get_executor())
 
         return True
 
@@ -93,18 +126,21 @@ class Patient_StructureSet(object):
         pass
 
         if roi_name in self.ROI_byName:
-            ROIDATA = self.ROI_byName[roi_name].DataVolume
+            goROI = self.ROI_byName[roi_name]
         else:
             raise NameError
 
         if mirror_name in self.ROI_byName:
-            mirrorDATA = self.ROI_byName[mirror_name].DataVolume
+            refROI = self.ROI_byName[mirror_name]
         else:
             raise NameError
 
-        outROI = mirror_ROI_about_centroid_of_other(ROI_to_go=ROIDATA,
-                                                    Ref_ROI=mirrorDATA,
-                                                    ax=0)
+        outROI = mirror_ROI_about_centroid_of_other(
+            ROI_to_go=np.asarray(goROI.DataVolume),
+            Ref_ROI=np.asarray(refROI.DataVolume),
+            ax=0,
+            goStats=goROI.stats,
+            refStats=refROI.stats)
 
         if save_as is None:
             save_as = 'mirrored_{}'.format(roi_name)
@@ -112,8 +148,86 @@ class Patient_StructureSet(object):
         self.add_ROI(name=save_as,
                      dataVolume=outROI,
                      enablePlotting=False,
-                     imageInfo=self.imageInfo)
+                     imageInfo=self.imageInfo,
+                     storage=self.maskStorage)
+
+
+    def combine_ROIs(self, roi_names, operation, save_as=None, **kwargs):
+        """ New ROI from set algebra on existing ones (see ROI_Boolean.py)
+
+            ~~ INPUTS ~~
+            - roi_names (list of strs): ROIs to combine, left to right
+            - operation (str): 'union', 'intersection', 'difference' (the
+              first minus the rest) or 'xor'
+            - save_as (str): name of the new ROI
+            - kwargs: passed on to the new ROI, e.g. color
+        """
+        ROIs = [self.get_ROI(name) for name in roi_names]
+
+        outROI = combine_masks([ROI.DataVolume for ROI in ROIs], operation,
+                               storage=self.maskStorage,
+                               bboxes=[ROI.stats.bbox for ROI in ROIs])
 
+        if save_as is None:
+            save_as = '{}_{}'.format(operation, '_'.join(roi_names))
+
+        return self.add_ROI(name=save_as,
+                            dataVolume=outROI,
+                            imageInfo=self.imageInfo,
+                            storage=self.maskStorage,
+                            **kwargs)
+
+    def union_ROIs(self, roi_names, save_as=None, **kwargs):
+        return self.combine_ROIs(roi_names, 'union', save_as, **kwargs)
+
+    def intersect_ROIs(self, roi_names, save_as=None, **kwargs):
+        return self.combine_ROIs(roi_names, 'intersection', save_as,
+                                 **kwargs)
+
+    def subtract_ROIs(self, roi_name, subtract_names, save_as=None,
+                      **kwargs):
+        """ roi_name with every ROI in subtract_names taken out """
+        return self.combine_ROIs([roi_name] + list(subtract_names),
+                                 'difference', save_as, **kwargs)
+
+    def xor_ROIs(self, roi_names, save_as=None, **kwargs):
+        return self.combine_ROIs(roi_names, 'xor', save_as, **kwargs)
+
+    def margin_ROI(self, roi_name, margin, save_as=None, **kwargs):
+        """ New ROI grown (margin > 0) or shrunk (margin < 0) by margin
+            mm in 3D, honouring pixel and slice spacing; margin may be
+            [x, y, z] to differ per axis. See ROI_Manipulations.margin_mask
+        """
+        ROI = self.get_ROI(roi_name)
+        outROI = margin_mask(ROI.DataVolume, margin, ROI.stats.spacing,
+                             bbox=ROI.stats.bbox, storage=self.maskStorage)
+
+        if save_as is None:
+            save_as = '{}_margin'.format(ROI.Name)
+
+        return self.add_ROI(name=save_as,
+                            dataVolume=outROI,
+                            imageInfo=self.imageInfo,
+                            storage=self.maskStorage,
+                            **kwargs)
+
+    def compute_DVHs(self, dose, roi_names=None, **kwargs):
+        """ {name: DVH} in dose (a Patient_Dose) of the named ROIs, or of
+            every ROI; see Patient_ROI_Obj.dvh """
+        if roi_names is None:
+            ROIs = self.ROI_List
+        else:
+            ROIs = [self.get_ROI(name) for name in roi_names]
+        return {ROI.Name: ROI.dvh(dose, **kwargs) for ROI in ROIs}
+
+    def get_ROI(self, name):
+        """ ROI by name; an exact match first, then ignoring case """
+        if name in self.ROI_byName:
+            return self.ROI_byName[name]
+        for key, ROI in self.ROI_byName.items():
+            if key.lower() == name.lower():
+                return ROI
+        raise NameError("No ROI named {}".format(name))
 
     def get_similar_ROI(self, targetName):
         myROI = None
@@ -191,19 +305,35 @@ class Patient_StructureSet(object):
             ROIContour = mkNewROIContour_dataset(thisROI)
             self.di.ROIContourSequence.append(ROIContour)
 
+        # contours of every changed slice found at once, on the shared pool
+        allContours = extract_ROI_contours(self.ROI_List, get_executor(),
+                                           dirtyOnly=True)
+
         for index, SS in enumerate(self.di.StructureSetROISequence):
 
             thisROI = self.ROI_byName[SS.ROIName.lower()]
+            if not thisROI.isDirty():
+                continue  # its contours on file are left exactly as they are
 
-            ContourSequence = mkNewContour_Sequence(thisROI, ind2loc, pix2pat)
+            ROIContour = self.di.ROIContourSequence[index]
+            sliceContours = allContours[thisROI.Name]
 
-            self.di.ROIContourSequence[index].ContourSequence = ContourSequence
+            if thisROI.allDirty or 'ContourSequence' not in ROIContour:
+                ROIContour.ContourSequence = mkNewContour_Sequence(
+                    thisROI, ind2loc, pix2pat, sliceContours)
+            else:
+                ROIContour.ContourSequence = splice_Contour_Sequence(
+                    thisROI, ROIContour.ContourSequence, pix2pat,
+                    self.imageInfo['Pat2Pix'], sliceContours)
 
         outFile = self.SSFile
         outpath = os.path.join(outputDir, outFile)
         print('saving to {}'.format(outpath))
         dicom.write_file(outpath, self.di)
 
+        for ROI in self.ROI_List:
+            ROI.mark_clean()
+
 
 def mkNewROIContour_dataset(ROI):
     # Create a new DataSet for the RT ROI OBSERVATIONS SEQUENCE
@@ -228,42 +358,121 @@ def mkNewStructureSetROI_dataset(ROI, FrameOfRefUID):
     return SSROI
 
 
-def mkNewContour_Sequence(ROI, index2location, pix2patTForm):
+def extract_slice_contours(ROI, sliceIndex):
+    """ OpenCV contours of one slice of an ROI's mask """
+    compression = ROI.polyCompression
+    if isinstance(ROI.DataVolume, RLEMask):
+        return ROI.DataVolume.cv_contours(sliceIndex, compression)
+    return ImageArray2CVContour(ROI.DataVolume[:, :, sliceIndex].T,
+                                compression)
+
+
+def extract_ROI_contours(ROIs, executor=None, dirtyOnly=False):
+    """ {ROI.Name: {sliceIndex: [OpenCV contours]}} for each ROI
+        Only slices that hold something are looked at; with dirtyOnly,
+        only those changed since the last save. With an executor, every
+        (ROI, slice) is a separate task; cv2 drops the GIL while it
+        traces. """
+    tasks = []
+    for ROI in ROIs:
+        sliceIndices = occupied_slices(ROI.DataVolume)
+        if dirtyOnly and not ROI.allDirty:
+            sliceIndices = [z for z in sliceIndices if z in ROI.dirtySlices]
+        tasks.extend((ROI, sliceIndex) for sliceIndex in sliceIndices)
+
+    def run(task):
+        return extract_slice_contours(*task)
+
+    if executor is None:
+        results = [run(task) for task in tasks]
+    else:
+        results = list(executor.map(run, tasks))
+
+    allContours = {ROI.Name: {} for ROI in ROIs}
+    for (ROI, sliceIndex), CvContour in zip(tasks, results):
+        allContours[ROI.Name][sliceIndex] = CvContour
+    return allContours
+
+
+def mkNewContour_Sequence(ROI, index2location, pix2patTForm,
+                          sliceContours=None):
+    """ ContourSequence for an ROI; sliceContours ({sliceIndex: [OpenCV
+        contours]}, see extract_ROI_contours) are traced here if not given
+    """
+    if sliceContours is None:
+        sliceContours = extract_ROI_contours([ROI])[ROI.Name]
 
-    # ROI['DataVolume']
     contourSequence = dicom.sequence.Sequence()
     contourCount = 0
 
-    # iterate through slices of image volume
-    for sliceIndex in range(0, ROI.DataVolume.shape[2]):
-
-        compression = ROI.polyCompression
-        # else:
-        #     compression = 0
-
-        CvContour = ImageArray2CVContour(ROI.DataVolume[:, :, sliceIndex].T,
-                                         compression)
+    # iterate through the occupied slices of the image volume
+    for sliceIndex in sorted(sliceContours):
 
-        if not bool(CvContour):
-            # print("no contours on slice {}".format(sliceIndex))
-            continue
+        DCMContours = mkSliceContours(sliceContours[sliceIndex], sliceIndex,
+                                      pix2patTForm, contourCount + 1)
+        contourCount += len(DCMContours)
+        contourSequence.extend(DCMContours)
 
-        # thisLocation = index2location[sliceIndex]
-
-        # ** how to do multiple contours????
-        for thisContour in CvContour:
-
-            VectorArray = CVContour2VectorArray(thisContour, sliceIndex)
-            PatientArray = Vector2PatientArray(VectorArray, pix2patTForm)
-            ContourData = PatientArray2ContourData(PatientArray)
-            contourCount += 1
-            DCMContour = mkNewContour(ContourData, contourCount)
-
-            contourSequence.append(DCMContour)
+    return contourSequence
 
-        # print(Contour)
 
-    return contourSequence
+def mkSliceContours(CvContour, sliceIndex, pix2patTForm, firstNumber=1):
+    """ Contour datasets for the OpenCV contours of one slice, numbered
+        from firstNumber """
+    DCMContours = []
+    for thisContour in CvContour:
+
+        VectorArray = CVContour2VectorArray(thisContour, sliceIndex)
+        PatientArray = Vector2PatientArray(VectorArray, pix2patTForm)
+        ContourData = PatientArray2ContourData(PatientArray)
+        DCMContours.append(mkNewContour(ContourData,
+                                        firstNumber + len(DCMContours)))
+
+    return DCMContours
+
+
+def splice_Contour_Sequence(ROI, contourSequence, pix2patTForm, pat2pixTForm,
+                            sliceContours):
+    """ contourSequence (as on file) with the contours of ROI's dirty
+        slices swapped for sliceContours ({sliceIndex: [OpenCV contours]}).
+        Contours on clean slices are kept as the same dataset objects, so
+        they're written back byte for byte; new ones go where the slice's
+        old ones were, or at the end.
+    """
+    oldSlices = ContourSequence2SliceIndices(contourSequence, pat2pixTForm)
+    contourCount = max([_contour_number(item) for item in contourSequence],
+                       default=0)
+
+    def newContours(sliceIndex):
+        nonlocal contourCount
+        DCMContours = mkSliceContours(sliceContours.get(sliceIndex, []),
+                                      sliceIndex, pix2patTForm,
+                                      contourCount + 1)
+        contourCount += len(DCMContours)
+        return DCMContours
+
+    spliced = dicom.sequence.Sequence()
+    done = set()
+    for item, sliceIndex in zip(contourSequence, oldSlices):
+        if sliceIndex not in ROI.dirtySlices:
+            spliced.append(item)
+        elif sliceIndex not in done:
+            spliced.extend(newContours(sliceIndex))
+            done.add(sliceIndex)
+
+    for sliceIndex in sorted(ROI.dirtySlices - done):
+        spliced.extend(newContours(sliceIndex))
+
+    return spliced
+
+
+def _contour_number(contour):
+    """ ContourNumber of a contour dataset, read without converting it """
+    try:
+        value = contour.get_item('ContourNumber').value
+        return int(value.decode() if isinstance(value, bytes) else value)
+    except (AttributeError, KeyError, TypeError, ValueError):
+        return 0
 
 
 if __name__ == "__main__":
@@ -0,0 +1,119 @@
+# ROI_Boolean.py
+"""
+    ROI set algebra
+    Union, intersection, difference and XOR of whole mask volumes. Only
+    the box the result can lie in is visited (from the ROIs' bounding
+    boxes), a chunk of slices at a time, so memory stays bounded however
+    many ROIs are combined. RLE masks are combined run by run without
+    being decoded.
+"""
+
+# Third-Party Modules
+import numpy as np
+
+# Locals
+from dicommodule.ROI_Masks import (CroppedMask, RLEMask, new_mask,
+                                   as_mask, read_box, write_box, runs_union,
+                                   runs_intersection, runs_difference,
+                                   runs_xor)
+from dicommodule.ROI_Stats import ROIStats
+
+
+OPERATIONS = ('union', 'intersection', 'difference', 'xor')
+CHUNK_SLICES = 16  # slices read at once
+
+
+def _difference(one, two):
+    return np.logical_and(one, np.logical_not(two))
+
+
+_ARRAY_OPS = {'union': np.logical_or,
+              'intersection': np.logical_and,
+              'difference': _difference,
+              'xor': np.logical_xor}
+
+_RUNS_OPS = {'union': runs_union,
+             'intersection': runs_intersection,
+             'difference': runs_difference,
+             'xor': runs_xor}
+
+
+def combine_masks(volumes, operation, storage='uint8', bboxes=None,
+                  chunkSlices=CHUNK_SLICES):
+    """ One mask from operation applied across volumes, left to right
+        ('difference' is the first minus all the rest)
+
+        ~~ INPUTS ~~
+        - volumes (list): same-shape (Cols, Rows, NSlices) masks; ndarrays
+          or ROI_Masks types
+        - operation (str): 'union', 'intersection', 'difference' or 'xor'
+        - storage (str): storage of the result (see ROI_Masks.py)
+        - bboxes (list): each volume's bounding box, as ROIStats.bbox, if
+          already at hand
+        - chunkSlices (int): slices processed at once
+    """
+    if operation not in OPERATIONS:
+        raise ValueError("Unknown operation {}".format(operation))
+    if not bool(volumes):
+        raise ValueError("Nothing to combine")
+    shape = tuple(volumes[0].shape)
+    for volume in volumes[1:]:
+        if tuple(volume.shape) != shape:
+            raise ValueError("Masks differ in shape: {} and {}".format(
+                shape, tuple(volume.shape)))
+
+    if all(isinstance(volume, RLEMask) for volume in volumes):
+        return as_mask(_combine_runs(volumes, operation), storage)
+
+    result = new_mask(shape, storage)
+    if bboxes is None:
+        bboxes = [ROIStats(volume).bbox for volume in volumes]
+    box = _result_box(bboxes, operation)
+    if box is None:
+        return result
+
+    arrayOp = _ARRAY_OPS[operation]
+    (x0, y0, z0), (x1, y1, z1) = box
+    for start in range(z0, z1, chunkSlices):
+        stop = min(start + chunkSlices, z1)
+        chunk = read_box(volumes[0], box, start, stop)
+        for volume in volumes[1:]:
+            chunk = arrayOp(chunk, read_box(volume, box, start, stop))
+        write_box(result, box, start, stop, chunk)
+
+    if isinstance(result, CroppedMask):
+        result.crop()
+    return result
+
+
+def _combine_runs(volumes, operation):
+    runsOp = _RUNS_OPS[operation]
+    result = RLEMask(volumes[0].shape)
+    cols = result.shape[0]
+    for z in range(result.shape[2]):
+        runs = volumes[0].runs[z]
+        for volume in volumes[1:]:
+            runs = runsOp(runs, volume.runs[z], cols)
+        result.runs[z] = runs
+    return result
+
+
+def _result_box(bboxes, operation):
+    """ [[x0, y0, z0], [x1, y1, z1]] the result must lie within, or None
+        if it's empty """
+    if operation == 'difference':
+        return bboxes[0]
+    if operation == 'intersection':
+        if any(bbox is None for bbox in bboxes):
+            return None
+        low = np.max([bbox[0] for bbox in bboxes], axis=0)
+        high = np.min([bbox[1] for bbox in bboxes], axis=0)
+        if np.any(high <= low):
+            return None
+        return np.array([low, high])
+    # union, xor: anywhere any of them is
+    bboxes = [bbox for bbox in bboxes if bbox is not None]
+    if not bool(bboxes):
+        return None
+    return np.array([np.min([bbox[0] for bbox in bboxes], axis=0),
+                     np.max([bbox[1] for bbox in bboxes], axis=0)])
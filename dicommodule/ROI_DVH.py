@@ -0,0 +1,145 @@
+# ROI_DVH.py
+"""
+    Dose-volume histograms
+    The dose at each voxel of an ROI's mask (trilinear in the dose grid, at
+    the voxel's patient-space centre) binned with np.bincount. The dose is
+    resampled onto the ROI's bounding box only, by Patient_Dose.resample,
+    which keeps it for the next ROI or viewer that needs it; the mask is
+    read a chunk of slices at a time.
+    Patient_ROI_Obj.dvh keeps one of these per dose until the ROI changes.
+"""
+
+# Third-Party Modules
+import numpy as np
+
+# Locals
+from dicommodule.ROI_Masks import read_box
+from dicommodule.ROI_Stats import ROIStats
+
+
+DEFAULT_BIN_WIDTH = 0.01  # in the dose's units (Gy)
+CHUNK_SLICES = 16  # slices read at once
+
+
+class DVH(object):
+    """ Dose-volume histogram of one ROI
+
+        ~~ INPUTS ~~
+        - counts (array): voxels in each dose bin; bin i holds doses in
+          [i * binWidth, (i + 1) * binWidth)
+        - binWidth (float): in the dose's units
+        - voxelVolume (float): cc
+        - minDose, maxDose, meanDose (float): exact, not binned
+        - name (str), units (str)
+    """
+
+    def __init__(self, counts, binWidth, voxelVolume, minDose=0.0,
+                 maxDose=0.0, meanDose=0.0, name='', units='GY'):
+        super().__init__()
+        self.counts = np.asarray(counts, dtype=np.int64)
+        self.binWidth = float(binWidth)
+        self.voxelVolume = float(voxelVolume)
+        self.Dmin = minDose
+        self.Dmax = maxDose
+        self.Dmean = meanDose
+        self.name = name
+        self.units = units
+
+    def __str__(self):
+        return "DVH {}: {:.2f} cc, Dmax {:.2f} {}".format(
+            self.name, self.volume, self.Dmax, self.units)
+
+    @property
+    def doses(self):
+        """ lower edge of each bin """
+        return np.arange(len(self.counts)) * self.binWidth
+
+    @property
+    def differential(self):
+        """ cc in each bin """
+        return self.counts * self.voxelVolume
+
+    @property
+    def cumulative(self):
+        """ cc receiving at least each bin's lower edge """
+        return np.cumsum(self.counts[::-1])[::-1] * self.voxelVolume
+
+    @property
+    def volume(self):
+        """ in cc """
+        return int(self.counts.sum()) * self.voxelVolume
+
+    def D(self, percent):
+        """ least dose received by the hottest percent of the volume """
+        total = self.counts.sum()
+        if not total:
+            return 0.0
+        atLeast = np.cumsum(self.counts[::-1])[::-1]
+        covering = np.flatnonzero(atLeast >= total * percent / 100.0)
+        return float(covering[-1] * self.binWidth)
+
+    def V(self, dose):
+        """ percent of the volume receiving at least dose """
+        total = self.counts.sum()
+        if not total:
+            return 0.0
+        first = int(np.ceil(dose / self.binWidth - 1e-9))
+        return 100.0 * self.counts[max(first, 0):].sum() / total
+
+    def metrics(self, prescription):
+        """ {'D90': dose, 'V100', 'V150', 'V200': percent of volume,
+            'Dmax': dose} for a prescription dose """
+        return {'D90': self.D(90),
+                'V100': self.V(prescription),
+                'V150': self.V(1.5 * prescription),
+                'V200': self.V(2.0 * prescription),
+                'Dmax': self.Dmax}
+
+
+def compute_dvh(volume, imageInfo, dose, bbox=None,
+                binWidth=DEFAULT_BIN_WIDTH, name='',
+                chunkSlices=CHUNK_SLICES, executor=None):
+    """ DVH of a mask volume
+
+        ~~ INPUTS ~~
+        - volume: (Cols, Rows, NSlices) mask; ndarray or ROI_Masks type
+        - imageInfo (dict): the mask's image info (Pix2Pat, PixelSpacing,
+          SliceSpacing)
+        - dose (Patient_Dose)
+        - bbox: volume's bounding box (ROIStats.bbox), if at hand
+        - binWidth (float): histogram bin, in the dose's units
+        - executor: passed on to Patient_Dose.resample
+    """
+    if bbox is None:
+        bbox = ROIStats(volume).bbox
+    rowSpacing, colSpacing = imageInfo['PixelSpacing'][0:2]
+    voxelVolume = rowSpacing * colSpacing * imageInfo['SliceSpacing'] / 1000.0
+    units = dose.info.get('DoseUnits', 'GY')
+    nBins = int(dose.maxDose // binWidth) + 2
+    counts = np.zeros(nBins, dtype=np.int64)
+    if bbox is None:
+        return DVH(counts, binWidth, voxelVolume, name=name, units=units)
+
+    boxDoses = dose.resample(imageInfo, bbox, executor=executor)
+    z0, z1 = bbox[0][2], bbox[1][2]
+    minDose, maxDose, total, nVoxels = np.inf, 0.0, 0.0, 0
+    for start in range(z0, z1, chunkSlices):
+        stop = min(start + chunkSlices, z1)
+        block = read_box(volume, bbox, start, stop)
+        if not block.any():
+            continue
+        doses = boxDoses[:, :, start - z0:stop - z0][block].astype(float)
+
+        bins = np.minimum((doses / binWidth).astype(np.int64), nBins - 1)
+        counts += np.bincount(bins, minlength=nBins)
+        minDose = min(minDose, doses.min())
+        maxDose = max(maxDose, doses.max())
+        total += doses.sum()
+        nVoxels += len(doses)
+
+    if not nVoxels:  # a box the mask doesn't reach into
+        return DVH(counts, binWidth, voxelVolume, name=name, units=units)
+    return DVH(counts, binWidth, voxelVolume, minDose=float(minDose),
+               maxDose=float(maxDose), meanDose=total / nVoxels,
+               name=name, units=units)
+
@@ -0,0 +1,163 @@
+# ROI_Distance.py
+"""
+    Signed distance field of an ROI
+    Distance in mm from each voxel to the ROI's surface: negative inside,
+    positive outside, as float32. Values are exact up to a band (in mm)
+    either side of the surface and clamped to +/- band beyond it, so only
+    the bounding box padded by the band is stored, and an edit only needs
+    the voxels within the band of it redone.
+    Queries at any point are trilinear; see Patient_ROI_Obj.distance_field.
+"""
+
+# Third-Party Modules
+import numpy as np
+import scipy.ndimage as spnd
+
+# Locals
+from dicommodule.ROI_Masks import read_box
+from dicommodule.ROI_Stats import ROIStats
+
+
+DEFAULT_BAND = 10.0  # mm
+
+
+class SignedDistanceField(object):
+    """ Truncated signed distance field of a mask volume
+
+        ~~ INPUTS ~~
+        - volume: (Cols, Rows, NSlices) mask; ndarray or ROI_Masks type
+        - spacing ([x, y, z]): voxel size in mm
+        - band (float): mm either side of the surface kept exact
+        - bbox: volume's bounding box (ROIStats.bbox), if at hand
+        - pat2pix (4x4 array): patient mm to voxel index, for distance()
+
+        field[i, j, k] is the distance at voxel origin + [i, j, k], to the
+        surface of the voxelized ROI: each voxel is a box (its centre +/-
+        half the spacing), so the surface lies halfway between inside and
+        outside voxel centres, and the voxels either side of a face are
+        -/+ half a voxel from it.
+    """
+
+    def __init__(self, volume, spacing, band=DEFAULT_BAND, bbox=None,
+                 pat2pix=None):
+        super().__init__()
+        self.shape = tuple(int(x) for x in volume.shape)
+        self.spacing = np.asarray(spacing, dtype=float)
+        self.band = float(band)
+        self.pat2pix = pat2pix
+        # voxels beyond this from the ROI's box are a full band away
+        self.reach = np.ceil(self.band / self.spacing).astype(int) + 1
+        self.origin = None
+        self.field = None
+        self.rebuild(volume, bbox)
+
+    def __str__(self):
+        if self.field is None:
+            return "Signed Distance Field (empty)"
+        return "Signed Distance Field {} at {}".format(self.field.shape,
+                                                       self.origin)
+
+    @property
+    def nbytes(self):
+        return 0 if self.field is None else self.field.nbytes
+
+    def rebuild(self, volume, bbox=None):
+        """ work the whole field out again """
+        if bbox is None:
+            bbox = ROIStats(volume).bbox
+        if bbox is None:  # empty ROI
+            self.origin, self.field = None, None
+            return
+        low = np.maximum(bbox[0] - self.reach, 0)
+        high = np.minimum(bbox[1] + self.reach, self.shape)
+        self.origin = low
+        block = read_box(volume, np.array([low, high]), low[2], high[2])
+        self.field = self._distances(block)
+
+    def update(self, volume, changeBox, bbox=None):
+        """ redo the field near an edit only; the whole field if the ROI
+            has grown out of the stored box
+            - changeBox: [[x0, y0, z0], [x1, y1, z1]] holding every voxel
+              changed since the field was worked out """
+        if bbox is None:
+            bbox = ROIStats(volume).bbox
+        if self.field is None or bbox is None or not self._covers(bbox):
+            self.rebuild(volume, bbox)
+            return
+
+        low, high = self.origin, self.origin + self.field.shape
+        # voxels whose distances can have changed...
+        writeLow = np.maximum(changeBox[0] - self.reach, low)
+        writeHigh = np.minimum(changeBox[1] + self.reach, high)
+        if np.any(writeHigh <= writeLow):
+            return
+        # ... and, around them, every voxel their distances depend on
+        readLow = np.maximum(writeLow - self.reach, low)
+        readHigh = np.minimum(writeHigh + self.reach, high)
+        block = read_box(volume, np.array([readLow, readHigh]), readLow[2],
+                         readHigh[2])
+        distances = self._distances(block)
+        into = tuple(slice(lo, hi) for lo, hi in zip(writeLow - low,
+                                                       writeHigh - low))
+        outOf = tuple(slice(lo, hi) for lo, hi in zip(writeLow - readLow,
+                                                        writeHigh - readLow))
+        self.field[into] = distances[outOf]
+
+    def _covers(self, bbox):
+        """ whether the stored box still holds bbox padded by the band """
+        low = np.maximum(bbox[0] - self.reach, 0)
+        high = np.minimum(bbox[1] + self.reach, self.shape)
+        return (np.all(low >= self.origin) and
+                np.all(high <= self.origin + self.field.shape))
+
+    def _distances(self, block):
+        """ clamped signed distances over a bool block """
+        if not block.any():
+            return np.full(block.shape, self.band, dtype=np.float32)
+        if block.all():  # no surface in sight: deep inside
+            return np.full(block.shape, -self.band, dtype=np.float32)
+        outside = self._to_boxes(block)
+        inside = self._to_boxes(np.logical_not(block))
+        distances = np.clip(outside - inside, -self.band, self.band)
+        return distances.astype(np.float32)
+
+    def _to_boxes(self, target):
+        """ mm from each voxel centre to the box of the nearest target
+            voxel (0 on target); the EDT alone would run to its centre.
+            Exact straight out of a face; with uneven spacing, the box of
+            the nearest centre can be a little further than the nearest
+            box (by under half the difference in spacing) """
+        nearest = spnd.distance_transform_edt(np.logical_not(target),
+                                              sampling=self.spacing,
+                                              return_distances=False,
+                                              return_indices=True)
+        squares = np.zeros(target.shape)
+        for axis, spacing in enumerate(self.spacing):
+            shape = [1, 1, 1]
+            shape[axis] = target.shape[axis]
+            steps = nearest[axis] - np.arange(target.shape[axis]).reshape(
+                shape)
+            gaps = np.maximum(np.abs(steps) * spacing - 0.5 * spacing, 0)
+            squares += gaps ** 2
+        return np.sqrt(squares)
+
+    def sample(self, voxelPoints):
+        """ distances at (N, 3) [x, y, z] voxel-index points (trilinear);
+            +band anywhere outside the stored box """
+        voxelPoints = np.atleast_2d(np.asarray(voxelPoints, dtype=float))
+        if self.field is None:
+            return np.full(len(voxelPoints), self.band)
+        coords = (voxelPoints - self.origin).T
+        return spnd.map_coordinates(self.field, coords, order=1,
+                                    mode='constant', cval=self.band,
+                                    output=np.float64)
+
+    def distance(self, patientPoints):
+        """ distances at (N, 3) points in patient mm """
+        patientPoints = np.atleast_2d(np.asarray(patientPoints, dtype=float))
+        PA = np.vstack((patientPoints.T, np.ones((1, len(patientPoints)))))
+        return self.sample(self.pat2pix.dot(PA)[0:3, :].T)
+
+    def contains(self, patientPoints):
+        """ whether each point is inside the ROI """
+        return self.distance(patientPoints) < 0
@@ -8,19 +8,32 @@ from cv2 import (resize, INTER_LINEAR, GaussianBlur, findContours,
 import cv2
 import nrrd
 
+from dicommodule.ROI_Stats import ROIStats
+from dicommodule.ROI_Masks import (CroppedMask, new_mask, read_box,
+                                   write_box)
 
-def mirror_ROI_about_centroid_of_other(ROI_to_go, Ref_ROI, ax):
+
+# distances within this of the margin count as on it
+MARGIN_TOLERANCE = 1e-6
+
+
+def mirror_ROI_about_centroid_of_other(ROI_to_go, Ref_ROI, ax,
+                                       goStats=None, refStats=None):
     """ NP Arrays must be same size
     find centroid of ref roi (eg. prostate)
     find bounding box of roi to go (eg. dil)
     mirror bounding box about an axis
     Flip ROI to go, place into new space
     return NP Array
+    goStats, refStats: ROIStats of the two, if already at hand
     """
 
+    if refStats is None:
+        refStats = ROIStats(Ref_ROI)
+
     mirroredROI = np.zeros(ROI_to_go.shape)
-    ref_centroid = get_centroid(Ref_ROI)
-    bb, rect_size = findBoundingCuboid(ROI_to_go)
+    ref_centroid = refStats.centroid
+    bb, rect_size = findBoundingCuboid(ROI_to_go, goStats)
 
     littleROI = ROI_to_go[bb[0, 0]:bb[1, 0],
                           bb[0, 1]:bb[1, 1],
@@ -43,6 +56,63 @@ def mirror_ROI_about_centroid_of_other(ROI_to_go, Ref_ROI, ax):
     return mirroredROI
 
 
+def margin_mask(volume, margin, spacing, bbox=None, storage='uint8'):
+    """ Grow or shrink a mask by a margin in mm, in 3D
+
+        ~~ INPUTS ~~
+        - volume: (Cols, Rows, NSlices) mask; ndarray or ROI_Masks type
+        - margin (float or [x, y, z]): mm to grow by (negative: shrink
+          by); each axis may differ, and may have its own sign
+        - spacing ([x, y, z]): voxel size in mm (ROIStats.spacing)
+        - bbox: volume's bounding box (ROIStats.bbox), if at hand
+        - storage (str): storage of the result (see ROI_Masks.py)
+
+        A voxel is in the grown mask if the ellipsoid of the margin's radii
+        around it reaches the mask, and stays in the shrunk mask if that
+        ellipsoid fits inside it. Only the bounding box, padded by the
+        margin, is worked on; Euclidean distance transforms take linear
+        time in its size. The image edge doesn't count as outside.
+    """
+    margin = np.broadcast_to(np.asarray(margin, dtype=float), (3,))
+    spacing = np.asarray(spacing, dtype=float)
+    result = new_mask(volume.shape, storage)
+    if bbox is None:
+        bbox = ROIStats(volume).bbox
+    if bbox is None:
+        return result
+
+    grow = np.maximum(margin, 0)
+    shrink = np.maximum(-margin, 0)
+    pad = np.ceil(grow / spacing).astype(int) + 1
+    low = np.maximum(bbox[0] - pad, 0)
+    high = np.minimum(bbox[1] + pad, volume.shape)
+    box = np.array([low, high])
+
+    block = read_box(volume, box, low[2], high[2])
+    if grow.any():
+        distance = spnd.distance_transform_edt(
+            np.logical_not(block), sampling=_margin_sampling(grow, spacing))
+        block = distance <= 1 + MARGIN_TOLERANCE
+    if shrink.any() and not block.all():
+        distance = spnd.distance_transform_edt(
+            block, sampling=_margin_sampling(shrink, spacing))
+        block = distance > 1 + MARGIN_TOLERANCE
+    write_box(result, box, low[2], high[2], block)
+
+    if isinstance(result, CroppedMask):
+        result.crop()
+    return result
+
+
+def _margin_sampling(margin, spacing):
+    """ voxel size in units of the margin along each axis, so the margin
+        is distance 1; an axis with no margin is never reached along """
+    sampling = np.full(3, 1e12)
+    hasMargin = margin > 0
+    sampling[hasMargin] = spacing[hasMargin] / margin[hasMargin]
+    return sampling
+
+
 def get_centroid(imVol):
     return np.asarray(spnd.measurements.center_of_mass(imVol))
 
@@ -86,30 +156,28 @@ def get_centroid(imVol):
 #     return bounds, rectSize
 
 
-def findBoundingCuboid(imVol):
-    rows, cols, slices = imVol.shape
-    imVol = np.swapaxes(imVol, 0, 2)
-    x, y, w, h = (imVol.shape[1], imVol.shape[2], 0, 0)
-    # start, end = (0, slices - 1)
-    # lastSliceEmpty = True
-
-    start = find_first_occupied_slice(imVol)
-    end = slices - find_first_occupied_slice(np.flip(imVol, axis=0)) + 1
-    lilImVol = imVol[start:end, :, :]
-
-    for index, thisSlice in enumerate(lilImVol):
-
-        im = thisSlice.astype(np.uint8).copy()
-        outim, contours, hierarcy = findContours(im, RETR_LIST,
-                                                 CHAIN_APPROX_SIMPLE)
-
-        for cnt in contours:
-            # lastSliceEmpty = False
-            x0, y0, w0, h0 = boundingRect(cnt)
-            x = x0 if (x0 < x) else x
-            y = y0 if (y0 < y) else y
-            w = (x0 + w0) if ((x0 + w0) > w) else w
-            h = (y0 + h0) if ((y0 + h0) > h) else h
+def findBoundingCuboid(imVol, stats=None):
+    """ bounds: [[x0, y0, z0],
+                 [x1 + 2, y1 + 2, z1 + 3]]
+        from first occupied x0, y0, z0 and last occupied x1, y1, z1; i.e.
+        one past the exclusive bbox in x and y, two past it in z (kept as
+        the drawer has always used it). rectSize: bounds[1] - bounds[0],
+        less one in x, y and z.
+        x0 and y0 are capped at the other axis' size (imVol.shape[1] and
+        imVol.shape[0]); an empty volume gives
+        [[shape[1], shape[0], 0], [1, 1, shape[2] + 2]].
+        stats: ROIStats of imVol, if already at hand """
+    if stats is None:
+        stats = ROIStats(imVol)
+    rows, cols, slices = stats.shape
+    x, y, w, h = (cols, rows, 0, 0)
+    start, end = (0, slices + 1)
+
+    if not stats.isEmpty():
+        (x0, y0, start), (w, h, end) = stats.bbox
+        # as ever, x and y start from the other axis' size
+        x, y = min(x0, x), min(y0, y)
+        end += 1
 
     bounds = np.array([[x, y, start], [w + 1, h + 1, end + 1]])
     rectSize = np.array([w - x, h - y, end - start])
@@ -122,14 +190,10 @@ def find_first_occupied_slice(imVol):
     # assuming to search along first dimension
     # return index of first slice with stuff on it
 
-    for index, thisSlice in enumerate(imVol):
-
-        im = thisSlice.astype(np.uint8).copy()
-        outim, contours, hierarchy = findContours(im, RETR_LIST,
-                                                  CHAIN_APPROX_SIMPLE)
-
-        if len(contours) > 0:
-            return index
+    imVol = np.asarray(imVol)
+    occupied = np.flatnonzero(imVol.reshape(len(imVol), -1).any(axis=1))
+    if len(occupied) > 0:
+        return int(occupied[0])
 
     return 0  # ??
     # return False
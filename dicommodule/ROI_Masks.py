@@ -0,0 +1,751 @@
+# ROI_Masks.py
+"""
+    ROI mask storage
+    Binary ROI masks are (Cols, Rows, NSlices) volumes indexed [x, y, z],
+    read and written a slice at a time by the viewer, the drawer and the
+    RTSTRUCT writer. By default a mask is a plain uint8 numpy array (0/1);
+    'packed' storage keeps 8 voxels per byte with np.packbits, and is still
+    indexed like a numpy array. 'cropped' storage keeps only the voxels
+    inside the ROI's bounding box, growing the box as the ROI is drawn.
+    'rle' storage keeps each slice as runs along image rows, and decodes a
+    slice only when it is asked for. 'lazy' storage keeps the contours the
+    ROI was loaded from, and fills a slice the first time it is read.
+"""
+
+# Third-Party Modules
+import numpy as np
+import cv2
+
+
+MASK_DTYPE = np.uint8
+STORAGE_TYPES = ('uint8', 'bool', 'packed', 'cropped', 'rle', 'lazy')
+
+# in-plane slack added when a cropped mask grows, so a brush stroke that
+# creeps past the box edge doesn't reallocate on every step
+GROW_MARGIN = 8
+
+
+def new_mask(volSize, storage='uint8'):
+    """ empty mask volume of shape volSize in the given storage """
+    if storage == 'uint8':
+        return np.zeros(volSize, dtype=MASK_DTYPE)
+    if storage == 'bool':
+        return np.zeros(volSize, dtype=bool)
+    if storage == 'packed':
+        return PackedMask(volSize)
+    if storage == 'cropped':
+        return CroppedMask(volSize)
+    if storage == 'rle':
+        return RLEMask(volSize)
+    if storage == 'lazy':
+        return LazyContourMask(volSize)
+    raise ValueError("Unknown mask storage {}".format(storage))
+
+
+def mask_from_arrays(storage, shape, arrays):
+    """ a 'packed', 'cropped', 'rle' or 'lazy' mask from the arrays its
+        to_arrays() gave """
+    classes = {'packed': PackedMask, 'cropped': CroppedMask,
+               'rle': RLEMask, 'lazy': LazyContourMask}
+    if storage not in classes:
+        raise ValueError("No array form for mask storage {}".format(storage))
+    return classes[storage].from_arrays(shape, arrays)
+
+
+def as_mask(volume, storage='uint8'):
+    """ volume as a binary mask in the given storage; binary numpy arrays
+        (and mask objects) of the right kind are returned as they are """
+    if storage == 'packed' and isinstance(volume, PackedMask):
+        return volume
+    if storage == 'rle' and isinstance(volume, RLEMask):
+        return volume
+    if storage == 'lazy' and isinstance(volume, LazyContourMask):
+        return volume
+    if storage == 'cropped':
+        if isinstance(volume, CroppedMask):
+            return volume
+        origin, subVolume = crop_to_bbox(np.asarray(volume) > 0)
+        return CroppedMask(volume.shape, origin, subVolume)
+    volume = np.asarray(volume)
+    if storage == 'uint8' and volume.dtype == MASK_DTYPE:
+        return volume
+    if storage == 'bool' and volume.dtype == bool:
+        return volume
+    mask = new_mask(volume.shape, storage)
+    mask[...] = np.asarray(volume) > 0
+    return mask
+
+
+def fill_contours(CVContours, cols, rows):
+    """ Filled OpenCV contours (pixel coordinates) on a (cols, rows) grid,
+        drawn only within their bounding box
+        output: (x0, y0, patch), patch a (Cols, Rows)-ordered uint8 array
+        whose [0, 0] is grid [x0, y0]; None if they're all off the grid
+    """
+    from dicommodule.Patient_ROI import CVContour2ImageArray  # circular
+
+    # a few pixels of margin for the anti-aliased edge
+    points = np.concatenate(CVContours).reshape((-1, 2))
+    x0, y0 = np.maximum(points.min(axis=0) - 3, 0)
+    x1, y1 = np.minimum(points.max(axis=0) + 4, [cols, rows])
+    if x1 <= x0 or y1 <= y0:
+        return None
+
+    patch = CVContour2ImageArray(CVContours, int(y1 - y0), int(x1 - x0),
+                                 offset=(-int(x0), -int(y0)))
+    return int(x0), int(y0), patch
+
+
+def crop_to_bbox(volume):
+    """ (origin, subVolume): the smallest box holding every nonzero voxel,
+        with origin its [x, y, z] index in the full grid. For a cropped
+        mask only its sub-volume is searched. An empty volume gives a
+        (0, 0, 0) sub-volume. """
+    if isinstance(volume, CroppedMask):
+        origin, volume = volume.origin, volume.sub
+    else:
+        origin, volume = np.zeros(3, dtype=int), np.asarray(volume)
+
+    occupied = [np.flatnonzero(volume.any(axis=axes))
+                for axes in ((1, 2), (0, 2), (0, 1))]
+    if any(inds.size == 0 for inds in occupied):
+        return np.zeros(3, dtype=int), np.zeros((0, 0, 0), dtype=MASK_DTYPE)
+
+    lo = [inds[0] for inds in occupied]
+    hi = [inds[-1] + 1 for inds in occupied]
+    subVolume = volume[lo[0]:hi[0], lo[1]:hi[1], lo[2]:hi[2]]
+    return origin + lo, subVolume.astype(MASK_DTYPE)
+
+
+def occupied_slices(volume):
+    """ indices of the slices of a mask that hold anything; mask types
+        answer from their own storage, without filling slices """
+    if isinstance(volume, MaskVolume):
+        return volume.occupied_slices()
+    return np.flatnonzero(np.asarray(volume).any(axis=(0, 1))).tolist()
+
+
+def read_box(volume, box, start, stop):
+    """ bool (x, y, z) block of volume within box ([[x0, y0, z0],
+        [x1, y1, z1]]), slices start:stop """
+    (x0, y0, z0), (x1, y1, z1) = box
+    if isinstance(volume, CroppedMask):
+        # straight from the stored box, where the two boxes overlap
+        block = np.zeros((x1 - x0, y1 - y0, stop - start), dtype=bool)
+        if volume.isEmpty():
+            return block
+        low = np.maximum([x0, y0, start], volume.origin)
+        high = np.minimum([x1, y1, stop], volume.origin + volume.sub.shape)
+        if np.any(high <= low):
+            return block
+        into = tuple(slice(lo - base, hi - base) for lo, hi, base
+                     in zip(low, high, (x0, y0, start)))
+        outOf = tuple(slice(lo - base, hi - base) for lo, hi, base
+                      in zip(low, high, volume.origin))
+        block[into] = volume.sub[outOf] > 0
+        return block
+    if isinstance(volume, MaskVolume):
+        block = np.stack([volume[:, :, z][x0:x1, y0:y1]
+                          for z in range(start, stop)], axis=-1)
+    else:
+        block = np.asarray(volume[x0:x1, y0:y1, start:stop])
+    return block > 0
+
+
+def write_box(result, box, start, stop, block):
+    """ put a (x, y, z) block into result within box, slices start:stop;
+        result should be empty there """
+    (x0, y0, z0), (x1, y1, z1) = box
+    if not isinstance(result, MaskVolume):
+        result[x0:x1, y0:y1, start:stop] = block
+        return
+    for index, z in enumerate(range(start, stop)):
+        if not block[:, :, index].any():
+            continue  # new masks are empty already
+        ImSlice = np.zeros(result.shape[:2], dtype=np.uint8)
+        ImSlice[x0:x1, y0:y1] = block[:, :, index]
+        result[:, :, z] = ImSlice
+
+
+def get_view_slice(volume, planeInd, index):
+    """ 2D slice of a mask (or image) volume through axis planeInd, laid
+        out as np.swapaxes(volume, planeInd, 2)[:, :, index] would be """
+    if planeInd == 2:
+        return np.asarray(volume[:, :, index])
+    key = [slice(None)] * 3
+    key[planeInd] = index
+    view = np.asarray(volume[tuple(key)])
+    # swapping planeInd with 2 leaves the other two axes transposed
+    return view.T if planeInd == 0 else view
+
+
+class MaskVolume(object):
+    """ Base for array-like mask volumes that store slices their own way
+
+        Subclasses implement _get_slice(z) -> (Cols, Rows) uint8 array and
+        _set_slice(z, array). Indexing a whole slice ([:, :, z]) goes
+        through those; any other index is served from the dense array.
+        to_arrays() / from_arrays() give the storage as plain arrays (for
+        np.savez), without filling the volume.
+    """
+
+    ndim = 3
+    dtype = np.dtype(MASK_DTYPE)
+
+    def __init__(self, shape):
+        super().__init__()
+        self.shape = tuple(int(x) for x in shape)
+
+    def __len__(self):
+        return self.shape[0]
+
+    @property
+    def size(self):
+        return int(np.prod(self.shape))
+
+    def _get_slice(self, z):
+        raise NotImplementedError
+
+    def _set_slice(self, z, array):
+        raise NotImplementedError
+
+    def peek_slice(self, z):
+        """ slice z for a one-off look (e.g. ROIStats): unlike get_slice,
+            nothing worked out to answer is kept """
+        return self.get_slice(z)
+
+    def _slice_number(self, z):
+        """ z as an index in 0..NSlices-1; negative counts from the end """
+        z, nSlices = int(z), self.shape[2]
+        if not -nSlices <= z < nSlices:
+            raise IndexError("slice {} is out of bounds for {} slices".format(
+                z, nSlices))
+        return z % nSlices
+
+    def get_slice(self, z):
+        return self._get_slice(self._slice_number(z))
+
+    def set_slice(self, z, array):
+        array = np.broadcast_to(np.asarray(array), self.shape[:2])
+        array = (array > 0).astype(MASK_DTYPE)
+        self._set_slice(self._slice_number(z), array)
+
+    def __getitem__(self, key):
+        z = _whole_slice_index(key)
+        if z is not None:
+            return self.get_slice(z)
+        sliceNumbers, subKey = _slices_of_key(key, self.shape)
+        return self._read_slices(sliceNumbers)[subKey]
+
+    def __setitem__(self, key, value):
+        z = _whole_slice_index(key)
+        if z is not None:
+            self.set_slice(z, value)
+            return
+        # only the slices the key reaches are read and written back
+        sliceNumbers, subKey = _slices_of_key(key, self.shape)
+        block = self._read_slices(sliceNumbers)
+        block[subKey] = value
+        for k, z in enumerate(sliceNumbers):
+            self.set_slice(z, block[:, :, k])
+
+    def _read_slices(self, sliceNumbers):
+        block = np.empty(self.shape[:2] + (len(sliceNumbers),),
+                         dtype=MASK_DTYPE)
+        for k, z in enumerate(sliceNumbers):
+            block[:, :, k] = self._get_slice(z)
+        return block
+
+    def __array__(self, dtype=None, copy=None):
+        dense = np.empty(self.shape, dtype=MASK_DTYPE)
+        for z in range(self.shape[2]):
+            dense[:, :, z] = self._get_slice(z)
+        if dtype is not None:
+            dense = dense.astype(dtype)
+        return dense
+
+    def copy(self):
+        return np.array(self)
+
+    def occupied_slices(self):
+        return [z for z in range(self.shape[2]) if self._get_slice(z).any()]
+
+
+class PackedMask(MaskVolume):
+    """ Bit-packed mask: each (Cols, Rows) slice is stored with
+        np.packbits along its Rows axis, 1 bit per voxel """
+
+    def __init__(self, shape):
+        super().__init__(shape)
+        cols, rows, slices = self.shape
+        self.bits = np.zeros((cols, (rows + 7) // 8, slices), dtype=np.uint8)
+
+    def __str__(self):
+        return "Packed Mask {}".format(self.shape)
+
+    @property
+    def nbytes(self):
+        return self.bits.nbytes
+
+    def _get_slice(self, z):
+        return np.unpackbits(self.bits[:, :, z], axis=1,
+                             count=self.shape[1])
+
+    def _set_slice(self, z, array):
+        self.bits[:, :, z] = np.packbits(array, axis=1)
+
+    def to_arrays(self):
+        return {'bits': self.bits}
+
+    @classmethod
+    def from_arrays(cls, shape, arrays):
+        mask = cls(shape)
+        mask.bits = np.asarray(arrays['bits'], dtype=np.uint8)
+        return mask
+
+    def occupied_slices(self):
+        return np.flatnonzero(self.bits.any(axis=(0, 1))).tolist()
+
+
+class CroppedMask(MaskVolume):
+    """ Mask kept as the sub-volume inside its bounding box
+
+        ~~ INPUTS ~~
+        - shape (tuple): (Cols, Rows, NSlices) of the full grid
+        - origin ([x, y, z]): full-grid index of subVolume[0, 0, 0]
+        - subVolume (ndarray): the mask inside the box
+
+        Writing a slice that reaches outside the box grows it; crop()
+        shrinks it back to the tightest fit. np.asarray() gives the full
+        grid.
+    """
+
+    def __init__(self, shape, origin=(0, 0, 0), subVolume=None):
+        super().__init__(shape)
+        self.origin = np.array(origin, dtype=int)
+        if subVolume is None:
+            subVolume = np.zeros((0, 0, 0), dtype=MASK_DTYPE)
+        self.sub = np.asarray(subVolume, dtype=MASK_DTYPE)
+
+    def __str__(self):
+        return "Cropped Mask {} in {}".format(self.sub.shape, self.shape)
+
+    @property
+    def nbytes(self):
+        return self.sub.nbytes
+
+    @property
+    def bbox(self):
+        """ [[x0, y0, z0], [x1, y1, z1]] of the stored box, ends exclusive """
+        return np.array([self.origin, self.origin + self.sub.shape])
+
+    def isEmpty(self):
+        return min(self.sub.shape) == 0
+
+    def crop(self):
+        """ shrink the stored box to the ROI's tight bounding box """
+        self.origin, self.sub = crop_to_bbox(self)
+
+    def to_arrays(self):
+        return {'origin': self.origin, 'sub': self.sub}
+
+    @classmethod
+    def from_arrays(cls, shape, arrays):
+        return cls(shape, arrays['origin'], arrays['sub'])
+
+    def occupied_slices(self):
+        if self.isEmpty():
+            return []
+        occupied = np.flatnonzero(self.sub.any(axis=(0, 1)))
+        return (occupied + self.origin[2]).tolist()
+
+    def _get_slice(self, z):
+        out = np.zeros(self.shape[:2], dtype=MASK_DTYPE)
+        dz = z - self.origin[2]
+        if not self.isEmpty() and 0 <= dz < self.sub.shape[2]:
+            (x0, y0), (x1, y1) = self.bbox[:, :2]
+            out[x0:x1, y0:y1] = self.sub[:, :, dz]
+        return out
+
+    def _set_slice(self, z, array):
+        xs = np.flatnonzero(array.any(axis=1))
+        if xs.size:
+            ys = np.flatnonzero(array.any(axis=0))
+            self._include([xs[0], ys[0], z], [xs[-1] + 1, ys[-1] + 1, z + 1])
+
+        dz = z - self.origin[2]
+        if not self.isEmpty() and 0 <= dz < self.sub.shape[2]:
+            (x0, y0), (x1, y1) = self.bbox[:, :2]
+            self.sub[:, :, dz] = array[x0:x1, y0:y1]
+
+    def _include(self, lo, hi):
+        """ grow the stored box to cover [lo, hi) """
+        lo, hi = np.asarray(lo), np.asarray(hi)
+        if not self.isEmpty():
+            oldLo, oldHi = self.bbox
+            if np.all(lo >= oldLo) and np.all(hi <= oldHi):
+                return
+
+        margin = np.array([GROW_MARGIN, GROW_MARGIN, 0])
+        newLo = np.maximum(lo - margin, 0)
+        newHi = np.minimum(hi + margin, self.shape)
+        if not self.isEmpty():
+            newLo = np.minimum(newLo, oldLo)
+            newHi = np.maximum(newHi, oldHi)
+
+        newSub = np.zeros(newHi - newLo, dtype=MASK_DTYPE)
+        if not self.isEmpty():
+            (x0, y0, z0), (x1, y1, z1) = oldLo - newLo, oldHi - newLo
+            newSub[x0:x1, y0:y1, z0:z1] = self.sub
+        self.origin, self.sub = newLo, newSub
+
+    def __array__(self, dtype=None, copy=None):
+        dense = np.zeros(self.shape, dtype=MASK_DTYPE)
+        if not self.isEmpty():
+            (x0, y0, z0), (x1, y1, z1) = self.bbox
+            dense[x0:x1, y0:y1, z0:z1] = self.sub
+        if dtype is not None:
+            dense = dense.astype(dtype)
+        return dense
+
+
+class RLEMask(MaskVolume):
+    """ Run-length encoded mask: each slice is an (N, 3) int32 array of
+        runs (row, firstCol, endCol) along the rows of the image, i.e. of
+        DataVolume[:, :, z].T (see encode_runs). Area, union and
+        intersection work on the runs without decoding.
+    """
+
+    def __init__(self, shape):
+        super().__init__(shape)
+        self.runs = [_NO_RUNS] * self.shape[2]
+
+    def __str__(self):
+        return "RLE Mask {} ({} runs)".format(self.shape, self.nRuns)
+
+    @property
+    def nbytes(self):
+        return sum(runs.nbytes for runs in self.runs)
+
+    @property
+    def nRuns(self):
+        return sum(len(runs) for runs in self.runs)
+
+    def occupied_slices(self):
+        return [z for z, runs in enumerate(self.runs) if len(runs)]
+
+    def _get_slice(self, z):
+        return decode_runs(self.runs[z], self.shape[1], self.shape[0]).T
+
+    def _set_slice(self, z, array):
+        self.runs[z] = encode_runs(array.T)
+
+    def to_arrays(self):
+        return {'runs': np.concatenate(self.runs),
+                'counts': np.array([len(runs) for runs in self.runs])}
+
+    @classmethod
+    def from_arrays(cls, shape, arrays):
+        mask = cls(shape)
+        runs = np.asarray(arrays['runs'], dtype=np.int32)
+        mask.runs = np.split(runs, np.cumsum(arrays['counts'])[:-1])
+        return mask
+
+    def area(self, z=None):
+        """ voxels in slice z, or in the whole volume """
+        if z is not None:
+            return runs_area(self.runs[z])
+        return sum(runs_area(runs) for runs in self.runs)
+
+    def union(self, other):
+        return self._combine(other, runs_union)
+
+    def intersection(self, other):
+        return self._combine(other, runs_intersection)
+
+    def _combine(self, other, operation):
+        other = as_mask(other, 'rle')
+        if other.shape != self.shape:
+            raise ValueError("Masks differ in shape: {} and {}".format(
+                self.shape, other.shape))
+        result = RLEMask(self.shape)
+        result.runs = [operation(a, b, self.shape[0])
+                       for a, b in zip(self.runs, other.runs)]
+        return result
+
+    def cv_contours(self, z, compression=0):
+        """ same contours as ImageArray2CVContour(self[:, :, z].T), but
+            only the runs' bounding rectangle is decoded """
+        runs = self.runs[z]
+        if not len(runs):
+            return []
+        y0, y1 = runs[:, 0].min(), runs[:, 0].max() + 1
+        x0, x1 = runs[:, 1].min(), runs[:, 2].max()
+        local = runs - [y0, x0, x0]
+        # one pixel of zeros all round, so edge contours trace as in full
+        image = np.zeros((y1 - y0 + 2, x1 - x0 + 2), dtype=MASK_DTYPE)
+        image[1:-1, 1:-1] = decode_runs(local, y1 - y0, x1 - x0)
+        contours = cv2.findContours(image, cv2.RETR_TREE,
+                                    cv2.CHAIN_APPROX_SIMPLE,
+                                    offset=(int(x0) - 1, int(y0) - 1))[-2]
+        contours = list(contours)
+        if not compression == 0:
+            for ind, contour in enumerate(contours):
+                contours[ind] = cv2.approxPolyDP(contour, compression, True)
+        return contours
+
+
+_NO_RUNS = np.zeros((0, 3), dtype=np.int32)
+
+
+class LazyContourMask(MaskVolume):
+    """ Mask whose source of truth is a set of contours
+        sliceContours: {z: [OpenCV contours in pixel coordinates]}
+
+        A slice is filled from its contours the first time it is read and
+        kept. Writing a slice stores the written mask in place of that
+        slice's contours; set_contours() replaces contours and drops any
+        filled slices they cover.
+    """
+
+    def __init__(self, shape, sliceContours=None):
+        super().__init__(shape)
+        self.sliceContours = {}
+        self.slices = {}  # filled or edited slices
+        if sliceContours is not None:
+            self.set_contours(sliceContours)
+
+    def __str__(self):
+        return "Lazy Contour Mask {} ({} of {} slices filled)".format(
+            self.shape, len(self.slices), len(self.occupied_slices()))
+
+    @property
+    def nbytes(self):
+        return (sum(ImSlice.nbytes for ImSlice in self.slices.values()) +
+                sum(contour.nbytes for contours in self.sliceContours.values()
+                    for contour in contours))
+
+    def set_contours(self, sliceContours):
+        """ {z: contours}: replace the contours of these slices """
+        for z, contours in sliceContours.items():
+            self.slices.pop(z, None)
+            if bool(contours):
+                self.sliceContours[z] = contours
+            else:
+                self.sliceContours.pop(z, None)
+
+    def occupied_slices(self):
+        """ indices of slices that may hold something, without filling """
+        return sorted(z for z in set(self.sliceContours) | set(self.slices)
+                      if 0 <= z < self.shape[2])
+
+    def _fill(self, z):
+        ImSlice = np.zeros(self.shape[:2], dtype=MASK_DTYPE)
+        filled = fill_contours(self.sliceContours[z], *self.shape[:2])
+        if filled is not None:
+            x0, y0, patch = filled
+            region = ImSlice[x0:x0 + patch.shape[0], y0:y0 + patch.shape[1]]
+            region[patch > 0] = 1
+        return ImSlice
+
+    def _get_slice(self, z):
+        if z not in self.slices:
+            if z not in self.sliceContours:
+                return np.zeros(self.shape[:2], dtype=MASK_DTYPE)
+            self.slices[z] = self._fill(z)
+        return self.slices[z].copy()
+
+    def peek_slice(self, z):
+        z = self._slice_number(z)
+        if z in self.slices:
+            return self.slices[z].copy()
+        if z in self.sliceContours:
+            return self._fill(z)
+        return np.zeros(self.shape[:2], dtype=MASK_DTYPE)
+
+    def _set_slice(self, z, array):
+        self.sliceContours.pop(z, None)
+        if array.any():
+            self.slices[z] = array
+        else:
+            self.slices.pop(z, None)
+
+    def to_arrays(self):
+        """ the contours, and the slices written since (filled ones are
+            left out: they come back from the contours) """
+        contourSlices, lengths, points = [], [], []
+        for z, contours in sorted(self.sliceContours.items()):
+            for contour in contours:
+                contourSlices.append(z)
+                lengths.append(len(contour))
+                points.append(np.reshape(contour, (-1, 2)))
+        written = sorted(set(self.slices) - set(self.sliceContours))
+        slices = np.zeros(self.shape[:2] + (len(written),), dtype=MASK_DTYPE)
+        for k, z in enumerate(written):
+            slices[:, :, k] = self.slices[z]
+        return {'contourSlices': np.array(contourSlices, dtype=int),
+                'lengths': np.array(lengths, dtype=int),
+                'points': (np.concatenate(points) if points else
+                           np.zeros((0, 2))).astype(np.int32),
+                'writtenSlices': np.array(written, dtype=int),
+                'slices': slices}
+
+    @classmethod
+    def from_arrays(cls, shape, arrays):
+        mask = cls(shape)
+        points = np.split(np.asarray(arrays['points'], dtype=np.int32),
+                          np.cumsum(arrays['lengths'])[:-1])
+        for z, contour in zip(arrays['contourSlices'], points):
+            mask.sliceContours.setdefault(int(z), []).append(
+                contour.reshape((-1, 1, 2)))
+        for k, z in enumerate(arrays['writtenSlices']):
+            mask.slices[int(z)] = np.array(arrays['slices'][:, :, k])
+        return mask
+
+    def __array__(self, dtype=None, copy=None):
+        # fills without keeping, so a dense copy doesn't double the memory
+        dense = np.zeros(self.shape, dtype=MASK_DTYPE)
+        for z in self.occupied_slices():
+            if z in self.slices:
+                dense[:, :, z] = self.slices[z]
+            else:
+                dense[:, :, z] = self._fill(z)
+        if dtype is not None:
+            dense = dense.astype(dtype)
+        return dense
+
+
+def encode_runs(image):
+    """ (N, 3) runs (row, firstCol, endCol) of the nonzero pixels of a
+        2D image, endCol exclusive, in raster order """
+    image = np.asarray(image) > 0
+    padded = np.zeros((image.shape[0], image.shape[1] + 2), dtype=np.int8)
+    padded[:, 1:-1] = image
+    edges = np.diff(padded, axis=1)
+    rows, starts = np.nonzero(edges == 1)
+    ends = np.nonzero(edges == -1)[1]
+    return np.stack([rows, starts, ends], axis=1).astype(np.int32)
+
+
+def decode_runs(runs, rows, cols):
+    """ (rows, cols) uint8 image of a run array """
+    edges = np.zeros((rows, cols + 1), dtype=np.int32)
+    np.add.at(edges, (runs[:, 0], runs[:, 1]), 1)
+    np.add.at(edges, (runs[:, 0], runs[:, 2]), -1)
+    return (np.cumsum(edges[:, :cols], axis=1) > 0).astype(MASK_DTYPE)
+
+
+def runs_area(runs):
+    return int(np.sum(runs[:, 2] - runs[:, 1]))
+
+
+def runs_union(runsA, runsB, cols):
+    return _sweep_runs(runsA, runsB, cols, (1, 2, 3))
+
+
+def runs_intersection(runsA, runsB, cols):
+    return _sweep_runs(runsA, runsB, cols, (3,))
+
+
+def runs_difference(runsA, runsB, cols):
+    """ runs in A but not in B """
+    return _sweep_runs(runsA, runsB, cols, (1,))
+
+
+def runs_xor(runsA, runsB, cols):
+    return _sweep_runs(runsA, runsB, cols, (1, 2))
+
+
+def _sweep_runs(runsA, runsB, cols, keep):
+    """ Combine two run arrays of one slice in O(runs log runs)
+        Every run is put on one line (row * (cols + 1) + col, the gap
+        stopping runs from joining across rows) as +weight at its start
+        and -weight at its end, A weighing 1 and B 2. After a cumulative
+        sum the coverage is 1 in A only, 2 in B only and 3 in both, and
+        the output is wherever the coverage is in keep.
+    """
+    width = cols + 1
+    positions, weights = [], []
+    for runs, weight in ((runsA, 1), (runsB, 2)):
+        line = runs[:, 0].astype(np.int64) * width
+        positions += [line + runs[:, 1], line + runs[:, 2]]
+        weights += [np.full(len(runs), weight), np.full(len(runs), -weight)]
+    positions = np.concatenate(positions)
+    if not len(positions):
+        return _NO_RUNS
+    weights = np.concatenate(weights)
+
+    order = np.argsort(positions, kind='stable')
+    positions = positions[order]
+    coverage = np.cumsum(weights[order])
+    # only the coverage after the last event at each position matters
+    last = np.append(positions[1:] != positions[:-1], True)
+    positions, coverage = positions[last], coverage[last]
+
+    inside = np.isin(coverage, keep).astype(np.int8)
+    change = np.diff(np.concatenate([[0], inside]))
+    starts = positions[change == 1]
+    ends = positions[change == -1]
+    rows = starts // width
+    return np.stack([rows, starts - rows * width, ends - rows * width],
+                    axis=1).astype(np.int32)
+
+
+def _slices_of_key(key, shape):
+    """ (slice numbers, key into just those slices) for any numpy key into
+        a (Cols, Rows, NSlices) volume; slice numbers are sorted, unique
+        and in range, and the new key picks out from the stack of them
+        exactly what key picks from the whole volume """
+    nSlices = shape[2]
+    allSlices = np.arange(nSlices)
+    if isinstance(key, np.ndarray) and key.dtype == bool and key.ndim == 3:
+        # voxel mask: only the slices it has anything on
+        sliceNumbers = np.flatnonzero(key.any(axis=(0, 1)))
+        return sliceNumbers, key[:, :, sliceNumbers]
+
+    if not isinstance(key, tuple):
+        key = (key,)
+    if any(k is None for k in key):
+        raise IndexError("new axes are not supported by mask volumes")
+    ellipses = [i for i, k in enumerate(key) if k is Ellipsis]
+    if len(ellipses) > 1:
+        raise IndexError("an index can only have a single ellipsis")
+    if ellipses:
+        at = ellipses[0]
+        fill = (slice(None),) * (3 - len(key) + 1)
+        key = key[:at] + fill + key[at + 1:]
+    if len(key) > 3:
+        raise IndexError("too many indices for a 3D mask volume")
+    key = key + (slice(None),) * (3 - len(key))
+
+    zKey = key[2]
+    if isinstance(zKey, slice):
+        sliceNumbers = allSlices[zKey]
+        if zKey.step is not None and zKey.step < 0:
+            return sliceNumbers[::-1], key[0:2] + (slice(None, None, -1),)
+        return sliceNumbers, key[0:2] + (slice(None),)
+    if isinstance(zKey, (int, np.integer)):
+        if not -nSlices <= zKey < nSlices:
+            raise IndexError("slice {} is out of bounds for {} "
+                             "slices".format(zKey, nSlices))
+        return np.array([zKey % nSlices]), key[0:2] + (0,)
+
+    zKey = np.asarray(zKey)
+    if zKey.dtype == bool:
+        zKey = np.flatnonzero(zKey)
+    wanted = allSlices[zKey]  # raises IndexError if out of range
+    sliceNumbers = np.unique(wanted)
+    return sliceNumbers, key[0:2] + (np.searchsorted(sliceNumbers, wanted),)
+
+
+def _whole_slice_index(key):
+    """ z if key is [:, :, z] (or [..., z]), else None """
+    if not isinstance(key, tuple):
+        return None
+    if len(key) == 2 and key[0] is Ellipsis:
+        key = (slice(None), slice(None), key[1])
+    if len(key) != 3 or not isinstance(key[2], (int, np.integer)):
+        return None
+    if not all(isinstance(k, slice) and k == slice(None) for k in key[0:2]):
+        return None
+    return key[2]
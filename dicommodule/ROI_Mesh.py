@@ -0,0 +1,192 @@
+# ROI_Mesh.py
+"""
+    ROI surface meshes
+    Marching-cubes triangle mesh of a binary mask, run over the ROI's
+    bounding box only and placed in patient coordinates (mm) with the
+    image's Pix2Pat transform, so anisotropic voxels come out right.
+    Meshes can be thinned by vertex clustering and written as binary STL
+    or PLY. scikit-image does the marching cubes when it's installed;
+    otherwise pyqtgraph's isosurface is used.
+"""
+
+# Built-In Modules
+import os
+
+# Third-Party Modules
+import numpy as np
+import pyqtgraph as pg
+
+try:
+    from skimage.measure import marching_cubes
+except ImportError:
+    marching_cubes = None
+
+# Locals
+from dicommodule.ROI_Masks import read_box
+from dicommodule.ROI_Stats import ROIStats
+
+
+class ROIMesh(object):
+    """ Closed triangle mesh
+
+        ~~ INPUTS ~~
+        - verts (N x 3 array): vertex positions, patient mm
+        - faces (M x 3 int array): vertex indices of each triangle, wound
+          so that normals point out of the ROI
+    """
+
+    def __init__(self, verts, faces):
+        super().__init__()
+        self.verts = np.asarray(verts, dtype=float)
+        self.faces = np.asarray(faces, dtype=np.int64).reshape((-1, 3))
+
+    def __str__(self):
+        return "ROI Mesh: {} vertices, {} faces".format(len(self.verts),
+                                                       len(self.faces))
+
+    @property
+    def normals(self):
+        """ unit normal of each face """
+        corners = self.verts[self.faces]
+        cross = np.cross(corners[:, 1] - corners[:, 0],
+                         corners[:, 2] - corners[:, 0])
+        lengths = np.linalg.norm(cross, axis=1, keepdims=True)
+        return cross / np.where(lengths > 0, lengths, 1)
+
+    @property
+    def area(self):
+        """ surface area in mm^2 """
+        corners = self.verts[self.faces]
+        cross = np.cross(corners[:, 1] - corners[:, 0],
+                         corners[:, 2] - corners[:, 0])
+        return float(np.linalg.norm(cross, axis=1).sum() / 2)
+
+    @property
+    def volume(self):
+        """ enclosed volume in cc """
+        return _signed_volume(self.verts, self.faces) / 1000.0
+
+    def save(self, filePath, name='ROI'):
+        """ write as binary STL or PLY, by the file's extension """
+        extension = os.path.splitext(filePath)[1].lower()
+        if extension == '.stl':
+            write_stl(filePath, self.verts, self.faces, name)
+        elif extension == '.ply':
+            write_ply(filePath, self.verts, self.faces)
+        else:
+            raise ValueError("Unknown mesh format {}".format(extension))
+
+
+def mesh_mask(volume, pix2pat, bbox=None, step=1, decimate=None):
+    """ Surface mesh of a mask volume
+
+        ~~ INPUTS ~~
+        - volume: (Cols, Rows, NSlices) mask; ndarray or ROI_Masks type
+        - pix2pat (4x4 array): voxel index to patient mm (info['Pix2Pat'])
+        - bbox: volume's bounding box (ROIStats.bbox), if at hand
+        - step (int): marching cubes step in voxels; larger is coarser
+          (scikit-image only)
+        - decimate (float): if given, merge vertices on a grid of this
+          many mm (see cluster_vertices)
+
+        Returns an ROIMesh; empty if the mask is.
+    """
+    if bbox is None:
+        bbox = ROIStats(volume).bbox
+    if bbox is None:
+        return ROIMesh(np.zeros((0, 3)), np.zeros((0, 3), dtype=np.int64))
+
+    block = read_box(volume, bbox, bbox[0][2], bbox[1][2])
+    # a layer of outside all round, so the surface closes at the box edge
+    block = np.pad(block, 1).astype(np.float32)
+
+    if marching_cubes is not None:
+        verts, faces = marching_cubes(block, 0.5, step_size=step)[0:2]
+    else:
+        verts, faces = pg.isosurface(block, 0.5)
+    verts = verts + np.asarray(bbox[0]) - 1  # back to full-grid indices
+
+    VA = np.vstack((verts.T, np.ones((1, len(verts)))))
+    verts = np.asarray(pix2pat).dot(VA)[0:3, :].T
+    faces = np.asarray(faces, dtype=np.int64)
+
+    if decimate:
+        verts, faces = cluster_vertices(verts, faces, decimate)
+
+    # outward normals, whichever way the library and Pix2Pat turn things
+    if _signed_volume(verts, faces) < 0:
+        faces = faces[:, ::-1]
+    return ROIMesh(verts, faces)
+
+
+def cluster_vertices(verts, faces, cellSize):
+    """ Thin a mesh by merging all vertices within each cellSize (mm) grid
+        cell into their mean; triangles left with less than three
+        distinct corners are dropped """
+    cells = np.floor(verts / float(cellSize)).astype(np.int64)
+    cellKeys, inverse = np.unique(cells, axis=0, return_inverse=True)
+    inverse = inverse.reshape(-1)
+
+    counts = np.bincount(inverse, minlength=len(cellKeys))
+    newVerts = np.zeros((len(cellKeys), 3))
+    for axis in range(3):
+        newVerts[:, axis] = np.bincount(inverse, weights=verts[:, axis],
+                                        minlength=len(cellKeys))
+    newVerts /= counts[:, None]
+
+    newFaces = inverse[faces]
+    keep = ((newFaces[:, 0] != newFaces[:, 1]) &
+            (newFaces[:, 1] != newFaces[:, 2]) &
+            (newFaces[:, 0] != newFaces[:, 2]))
+    newFaces = newFaces[keep]
+    # the same triangle can turn up more than once after merging
+    newFaces = np.unique(newFaces, axis=0) if len(newFaces) else newFaces
+    return newVerts, newFaces
+
+
+def write_stl(filePath, verts, faces, name='ROI'):
+    """ binary STL of a triangle mesh """
+    mesh = ROIMesh(verts, faces)
+    record = np.dtype([('normal', '<f4', (3,)), ('corners', '<f4', (3, 3)),
+                       ('attribute', '<u2')])
+    data = np.zeros(len(mesh.faces), dtype=record)
+    data['normal'] = mesh.normals
+    data['corners'] = mesh.verts[mesh.faces]
+    header = name.encode('ascii', 'replace')[:80].ljust(80, b' ')
+    with open(filePath, 'wb') as fp:
+        fp.write(header)
+        fp.write(np.uint32(len(data)).tobytes())
+        fp.write(data.tobytes())
+
+
+def write_ply(filePath, verts, faces):
+    """ binary little-endian PLY of a triangle mesh """
+    verts = np.asarray(verts, dtype='<f4')
+    faces = np.asarray(faces).reshape((-1, 3))
+    header = ("ply\n"
+              "format binary_little_endian 1.0\n"
+              "element vertex {}\n"
+              "property float x\n"
+              "property float y\n"
+              "property float z\n"
+              "element face {}\n"
+              "property list uchar int vertex_indices\n"
+              "end_header\n").format(len(verts), len(faces))
+    record = np.dtype([('count', 'u1'), ('indices', '<i4', (3,))])
+    faceData = np.zeros(len(faces), dtype=record)
+    faceData['count'] = 3
+    faceData['indices'] = faces
+    with open(filePath, 'wb') as fp:
+        fp.write(header.encode('ascii'))
+        fp.write(verts.tobytes())
+        fp.write(faceData.tobytes())
+
+
+def _signed_volume(verts, faces):
+    """ volume enclosed by a closed mesh (mm^3), negative if its normals
+        point inwards """
+    if not len(faces):
+        return 0.0
+    corners = verts[faces]
+    return float(np.einsum('ij,ij->i', corners[:, 0],
+                           np.cross(corners[:, 1], corners[:, 2])).sum() / 6)
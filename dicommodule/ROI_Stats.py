@@ -0,0 +1,139 @@
+# ROI_Stats.py
+"""
+    ROI geometry statistics
+    Volume, centroid, bounding box, slice range and per-slice area of a
+    binary (Cols, Rows, NSlices) mask, all worked out from two profiles of
+    the mask: voxel counts per (x, slice) and per (y, slice). The profiles
+    are built in one pass over the occupied slices, and a single edited
+    slice can be swapped in without rescanning the rest.
+    Patient_ROI_Obj.stats keeps one of these per ROI, up to date with edits.
+"""
+
+# Third-Party Modules
+import numpy as np
+
+# Locals
+from dicommodule.ROI_Masks import MaskVolume, CroppedMask, occupied_slices
+
+
+class ROIStats(object):
+    """ Geometry of a mask volume
+
+        ~~ INPUTS ~~
+        - volume: (Cols, Rows, NSlices) mask; ndarray or ROI_Masks type
+        - imageInfo (dict): image info (PixelSpacing, SliceSpacing,
+          Pix2Pat); without it only voxel-index results are available
+
+        Voxel-index results: nVoxels, sliceAreas, sliceRange, bbox,
+        centroid. Millimetre results: volume (cc), sliceAreas_mm2,
+        centroid_mm, extent_mm.
+    """
+
+    def __init__(self, volume, imageInfo=None):
+        super().__init__()
+        self.shape = tuple(int(x) for x in volume.shape)
+        self.imageInfo = imageInfo or {}
+        cols, rows, nSlices = self.shape
+        self.countsX = np.zeros((cols, nSlices), dtype=np.int64)
+        self.countsY = np.zeros((rows, nSlices), dtype=np.int64)
+
+        if isinstance(volume, CroppedMask):
+            if not volume.isEmpty():
+                (x0, y0, z0), sub = volume.origin, volume.sub
+                x1, y1, z1 = volume.origin + sub.shape
+                self.countsX[x0:x1, z0:z1] = np.count_nonzero(sub, axis=1)
+                self.countsY[y0:y1, z0:z1] = np.count_nonzero(sub, axis=0)
+        elif isinstance(volume, MaskVolume):
+            for z in occupied_slices(volume):
+                self.update_slice(z, volume.peek_slice(z))
+        else:
+            volume = np.asarray(volume)
+            self.countsX[:] = np.count_nonzero(volume, axis=1)
+            self.countsY[:] = np.count_nonzero(volume, axis=0)
+
+    def __str__(self):
+        return "ROI Stats: {} voxels in {}".format(self.nVoxels, self.bbox)
+
+    def update_slice(self, sliceIndex, ImSlice):
+        """ take in new (Cols, Rows) contents of one slice """
+        self.countsX[:, sliceIndex] = np.count_nonzero(ImSlice, axis=1)
+        self.countsY[:, sliceIndex] = np.count_nonzero(ImSlice, axis=0)
+
+    # ~~ voxel-index results
+
+    @property
+    def sliceAreas(self):
+        """ voxels on each slice """
+        return self.countsX.sum(axis=0)
+
+    @property
+    def nVoxels(self):
+        return int(self.countsX.sum())
+
+    def isEmpty(self):
+        return self.nVoxels == 0
+
+    @property
+    def sliceRange(self):
+        """ (first, last) occupied slice, or None if empty """
+        occupied = np.flatnonzero(self.sliceAreas)
+        if not len(occupied):
+            return None
+        return int(occupied[0]), int(occupied[-1])
+
+    @property
+    def bbox(self):
+        """ [[x0, y0, z0], [x1, y1, z1]], upper bounds exclusive; None if
+            empty """
+        if self.isEmpty():
+            return None
+        xs = np.flatnonzero(self.countsX.any(axis=1))
+        ys = np.flatnonzero(self.countsY.any(axis=1))
+        zs = np.flatnonzero(self.sliceAreas)
+        return np.array([[xs[0], ys[0], zs[0]],
+                         [xs[-1] + 1, ys[-1] + 1, zs[-1] + 1]])
+
+    @property
+    def centroid(self):
+        """ [x, y, z] mean voxel index (as ndimage.center_of_mass) """
+        if self.isEmpty():
+            return None
+        cols, rows, nSlices = self.shape
+        sums = [self.countsX.sum(axis=1).dot(np.arange(cols)),
+                self.countsY.sum(axis=1).dot(np.arange(rows)),
+                self.sliceAreas.dot(np.arange(nSlices))]
+        return np.array(sums, dtype=float) / self.nVoxels
+
+    # ~~ millimetre results
+
+    @property
+    def spacing(self):
+        """ voxel size [x, y, z] in mm """
+        rowSpacing, colSpacing = self.imageInfo['PixelSpacing'][0:2]
+        return np.array([colSpacing, rowSpacing,
+                         self.imageInfo['SliceSpacing']], dtype=float)
+
+    @property
+    def volume(self):
+        """ in cc """
+        return self.nVoxels * np.prod(self.spacing) / 1000.0
+
+    @property
+    def sliceAreas_mm2(self):
+        return self.sliceAreas * self.spacing[0] * self.spacing[1]
+
+    @property
+    def centroid_mm(self):
+        """ centroid in patient coordinates """
+        centroid = self.centroid
+        if centroid is None:
+            return None
+        return self.imageInfo['Pix2Pat'].dot(np.append(centroid, 1))[0:3]
+
+    @property
+    def extent_mm(self):
+        """ size of the bounding box along [x, y, z] """
+        bbox = self.bbox
+        if bbox is None:
+            return np.zeros(3)
+        return (bbox[1] - bbox[0]) * self.spacing
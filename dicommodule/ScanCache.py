@@ -0,0 +1,88 @@
+# ScanCache.py
+"""
+    Persistent scan cache
+    Remembers the header of every DICOM file seen during discovery, keyed
+    by path, size and modification time, so re-scanning an unchanged
+    directory needs only an os.stat per file instead of a DICOM parse.
+"""
+
+# Built-In Modules
+import os
+import json
+import sqlite3
+
+
+class ScanCache(object):
+    """ SQLite-backed {path: header} store (see HeaderIndex.py)
+
+        ~~ INPUTS ~~
+        - dbPath (str): location of the sqlite file; created if missing
+
+        A cached header is only returned if the file's size and mtime
+        still match what was recorded; otherwise the caller re-reads it.
+    """
+
+    def __init__(self, dbPath):
+        super().__init__()
+
+        self.dbPath = dbPath
+        self.connection = sqlite3.connect(dbPath)
+        self.connection.execute(
+            """CREATE TABLE IF NOT EXISTS files (
+                   path TEXT PRIMARY KEY,
+                   size INTEGER,
+                   mtime INTEGER,
+                   sop_class_uid TEXT,
+                   series_uid TEXT,
+                   header TEXT)""")
+        self.connection.execute(
+            """CREATE INDEX IF NOT EXISTS files_series
+                   ON files (series_uid)""")
+        self.connection.commit()
+
+    def __str__(self):
+        return "Scan Cache at {}".format(self.dbPath)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def get(self, path, stat=None):
+        """ cached header for path, or None if missing / out of date """
+        if stat is None:
+            stat = os.stat(path)
+        row = self.connection.execute(
+            "SELECT size, mtime, header FROM files WHERE path = ?",
+            (path,)).fetchone()
+        if row is None:
+            return None
+        size, mtime, header = row
+        if size != stat.st_size or mtime != stat.st_mtime_ns:
+            return None
+        return json.loads(header)
+
+    def put(self, path, header, stat=None):
+        """ record header for path (not committed until commit()) """
+        if stat is None:
+            stat = os.stat(path)
+        self.connection.execute(
+            "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?)",
+            (path, stat.st_size, stat.st_mtime_ns,
+             header.get('SOPClassUID'), header.get('SeriesInstanceUID'),
+             json.dumps(header)))
+
+    def commit(self):
+        self.connection.commit()
+
+    def close(self):
+        self.connection.commit()
+        self.connection.close()
+
+
+def open_scan_cache(scanCache):
+    """ accept either a ScanCache, a path to one, or None """
+    if scanCache is None or isinstance(scanCache, ScanCache):
+        return scanCache
+    return ScanCache(scanCache)
@@ -0,0 +1,308 @@
+# SyntheticData.py
+"""
+    Synthetic DICOM datasets
+    Writes image series (MR / CT / US), a matching RT Structure Set of
+    ellipsoid ROIs and an RT Dose grid with pydicom, at whatever size is
+    asked for. Used by the benchmarks and tests in Tests/, and handy for
+    trying the viewers without patient data.
+
+    make_patient('/tmp/fake', nSlices=100, rows=256, cols=256)
+"""
+
+# Built-In Modules
+import os
+
+# Third-Party Modules
+import numpy as np
+
+try:
+    import dicom as dicom
+except ImportError:
+    import pydicom as dicom
+
+
+SOP_CLASSES = {'MR': '1.2.840.10008.5.1.4.1.1.4',
+               'CT': '1.2.840.10008.5.1.4.1.1.2',
+               'US': '1.2.840.10008.5.1.4.1.1.6.1',
+               'RTSTRUCT': '1.2.840.10008.5.1.4.1.1.481.3',
+               'RTDOSE': '1.2.840.10008.5.1.4.1.1.481.2'}
+
+EXPLICIT_VR_LE = '1.2.840.10008.1.2.1'
+
+# (name, centre as a fraction of the volume extent, radii in mm, colour)
+DEFAULT_ROIS = [('prostate', (0.5, 0.5, 0.5), (20.0, 15.0, 18.0),
+                 (255, 0, 0)),
+                ('urethra', (0.5, 0.45, 0.5), (3.0, 3.0, 20.0),
+                 (255, 255, 0)),
+                ('rectum', (0.5, 0.75, 0.5), (12.0, 8.0, 25.0),
+                 (139, 69, 19))]
+
+
+def make_patient(outDir, modality='MR', nSlices=20, rows=128, cols=128,
+                 pixelSpacing=(1.0, 1.0), sliceSpacing=2.0, rois=None,
+                 pointsPerContour=64, dose=True):
+    """ Write a complete synthetic patient below outDir
+
+        ~~ INPUTS ~~
+        - modality (str): 'MR', 'CT' or 'US'
+        - nSlices, rows, cols (int): image volume size
+        - pixelSpacing ([row, col] mm), sliceSpacing (mm)
+        - rois (list): (name, centre fraction, radii mm, colour) tuples,
+          DEFAULT_ROIS if None
+        - pointsPerContour (int): vertices in each contour
+        - dose (bool): also write an RT Dose file
+
+        Returns {'images': [paths], 'rtstruct': path, 'rtdose': path or
+        None, 'geometry': dict, 'nContours': int}
+    """
+    geometry = make_geometry(nSlices, rows, cols, pixelSpacing, sliceSpacing)
+    images = write_image_series(os.path.join(outDir, modality), geometry,
+                                modality)
+    rtstruct, nContours = write_rtstruct(os.path.join(outDir, 'RS.dcm'),
+                                         geometry, rois, pointsPerContour)
+    rtdose = None
+    if dose:
+        rtdose = write_rtdose(os.path.join(outDir, 'RD.dcm'), geometry)
+
+    return {'images': images, 'rtstruct': rtstruct, 'rtdose': rtdose,
+            'geometry': geometry, 'nContours': nContours}
+
+
+def load_synthetic_patient(outDir, **kwargs):
+    """ Write a synthetic patient below outDir (kwargs as for make_patient)
+        and read it back as a Patient """
+    # here, so writing data doesn't pull in the whole loader
+    from dicommodule.Patient import Patient
+
+    make_patient(outDir, **kwargs)
+    return Patient(outDir)
+
+
+def make_geometry(nSlices, rows, cols, pixelSpacing=(1.0, 1.0),
+                  sliceSpacing=2.0):
+    """ shared frame of reference for a synthetic patient; axial, HFS,
+        centred on the patient origin """
+    pixelSpacing = [float(x) for x in pixelSpacing]
+    origin = [-0.5 * (cols - 1) * pixelSpacing[1],
+              -0.5 * (rows - 1) * pixelSpacing[0],
+              -0.5 * (nSlices - 1) * sliceSpacing]
+    return {'Rows': int(rows),
+            'Cols': int(cols),
+            'NSlices': int(nSlices),
+            'PixelSpacing': pixelSpacing,
+            'SliceSpacing': float(sliceSpacing),
+            'Origin': origin,
+            'PatientID': 'SYNTHETIC',
+            'StudyInstanceUID': dicom.uid.generate_uid(),
+            'FrameOfReferenceUID': dicom.uid.generate_uid()}
+
+
+def make_image_info(cols=40, rows=30, nSlices=10, pixelSpacing=(0.5, 0.5),
+                    sliceSpacing=2.0, origin=(0.0, 0.0, 0.0)):
+    """ image info for an axial grid, as Patient_Image.info has it, with no
+        files written: enough for ROIs and their stats, distances, meshes
+
+        ~~ INPUTS ~~
+        - cols, rows, nSlices (int): grid size
+        - pixelSpacing ([row, col] mm), sliceSpacing (mm)
+        - origin ([x, y, z] mm): patient position of voxel [0, 0, 0]
+    """
+    rowSpacing, colSpacing = [float(x) for x in pixelSpacing]
+    pix2pat = np.diag([colSpacing, rowSpacing, float(sliceSpacing), 1.0])
+    pix2pat[0:3, 3] = origin
+    return {'Cols': int(cols), 'Rows': int(rows), 'NSlices': int(nSlices),
+            'PixelSpacing': [rowSpacing, colSpacing],
+            'SliceSpacing': float(sliceSpacing),
+            'Pix2Pat': pix2pat, 'Pat2Pix': np.linalg.inv(pix2pat)}
+
+
+def write_image_series(outDir, geometry, modality='MR'):
+    """ one file per slice, with a smooth ellipsoid phantom as pixels """
+    os.makedirs(outDir, exist_ok=True)
+    seriesUID = dicom.uid.generate_uid()
+
+    paths = []
+    for index in range(geometry['NSlices']):
+        path = os.path.join(outDir, '{}{:04d}.dcm'.format(modality, index))
+        ds = _new_dataset(path, SOP_CLASSES[modality], geometry)
+        ds.Modality = modality
+        ds.SeriesInstanceUID = seriesUID
+        ds.InstanceNumber = index + 1
+        ds.PatientPosition = 'HFS'
+        ds.ImageOrientationPatient = [1, 0, 0, 0, 1, 0]
+        ds.ImagePositionPatient = _slice_position(geometry, index)
+        ds.SliceLocation = _slice_position(geometry, index)[2]
+        ds.SliceThickness = geometry['SliceSpacing']
+        ds.PixelSpacing = geometry['PixelSpacing']
+        _set_pixels(ds, phantom_slice(geometry, index))
+        _save(ds, path)
+        paths.append(path)
+
+    return paths
+
+
+def write_rtstruct(path, geometry, rois=None, pointsPerContour=64):
+    """ ellipsoid ROIs, one closed planar contour per slice they cross
+        output: (path, total number of contours written) """
+    if rois is None:
+        rois = DEFAULT_ROIS
+
+    ds = _new_dataset(path, SOP_CLASSES['RTSTRUCT'], geometry)
+    ds.Modality = 'RTSTRUCT'
+    ds.SeriesInstanceUID = dicom.uid.generate_uid()
+    ds.StructureSetLabel = 'SYNTHETIC'
+
+    extent = np.array([geometry['Cols'] * geometry['PixelSpacing'][1],
+                       geometry['Rows'] * geometry['PixelSpacing'][0],
+                       geometry['NSlices'] * geometry['SliceSpacing']])
+    sliceZs = [_slice_position(geometry, index)[2]
+               for index in range(geometry['NSlices'])]
+    angles = np.linspace(0, 2 * np.pi, pointsPerContour, endpoint=False)
+
+    SSROIs, ROIContours, observations = [], [], []
+    nContours = 0
+    for number, (name, fraction, radii, color) in enumerate(rois, 1):
+        centre = np.asarray(geometry['Origin']) + np.asarray(fraction) * extent
+
+        SSROI = dicom.dataset.Dataset()
+        SSROI.ROINumber = number
+        SSROI.ReferencedFrameOfReferenceUID = geometry['FrameOfReferenceUID']
+        SSROI.ROIName = name
+        SSROI.ROIGenerationAlgorithm = 'SYNTHETIC'
+        SSROIs.append(SSROI)
+
+        observation = dicom.dataset.Dataset()
+        observation.ObservationNumber = number
+        observation.ReferencedROINumber = number
+        observation.RTROIInterpretedType = 'ORGAN'
+        observation.ROIInterpreter = ''
+        observations.append(observation)
+
+        contours = []
+        for z in sliceZs:
+            scale = 1 - ((z - centre[2]) / radii[2]) ** 2
+            if scale <= 0:
+                continue
+            scale = np.sqrt(scale)
+            points = np.empty((pointsPerContour, 3))
+            points[:, 0] = centre[0] + radii[0] * scale * np.cos(angles)
+            points[:, 1] = centre[1] + radii[1] * scale * np.sin(angles)
+            points[:, 2] = z
+
+            contour = dicom.dataset.Dataset()
+            contour.ContourGeometricType = 'CLOSED_PLANAR'
+            contour.NumberOfContourPoints = pointsPerContour
+            contour.ContourNumber = len(contours) + 1
+            contour.ContourData = ['{:.2f}'.format(x) for x in points.ravel()]
+            contours.append(contour)
+
+        ROIContour = dicom.dataset.Dataset()
+        ROIContour.ReferencedROINumber = number
+        ROIContour.ROIDisplayColor = list(color)
+        ROIContour.ContourSequence = dicom.sequence.Sequence(contours)
+        ROIContours.append(ROIContour)
+        nContours += len(contours)
+
+    ds.StructureSetROISequence = dicom.sequence.Sequence(SSROIs)
+    ds.ROIContourSequence = dicom.sequence.Sequence(ROIContours)
+    ds.RTROIObservationsSequence = dicom.sequence.Sequence(observations)
+    _save(ds, path)
+    return path, nContours
+
+
+def write_rtdose(path, geometry, doseSpacing=2.5, prescription=10.0):
+    """ multiframe dose grid over the image extent, peaking near 2x the
+        prescription (Gy) in the centre """
+    size = [geometry['Cols'] * geometry['PixelSpacing'][1],
+            geometry['Rows'] * geometry['PixelSpacing'][0],
+            geometry['NSlices'] * geometry['SliceSpacing']]
+    cols, rows, frames = [max(int(extent // doseSpacing), 1)
+                          for extent in size]
+    origin = geometry['Origin']
+
+    x = origin[0] + doseSpacing * np.arange(cols)
+    y = origin[1] + doseSpacing * np.arange(rows)
+    z = origin[2] + doseSpacing * np.arange(frames)
+    centre = [x.mean(), y.mean(), z.mean()]
+    sigma = 0.25 * min(size)
+    Z, Y, X = np.meshgrid(z - centre[2], y - centre[1], x - centre[0],
+                          indexing='ij')
+    doseGy = 2 * prescription * np.exp(-(X ** 2 + Y ** 2 + Z ** 2) /
+                                       (2 * sigma ** 2))
+
+    scaling = doseGy.max() / 65535.0
+    pixels = np.around(doseGy / scaling).astype(np.uint16)
+
+    ds = _new_dataset(path, SOP_CLASSES['RTDOSE'], geometry)
+    ds.Modality = 'RTDOSE'
+    ds.SeriesInstanceUID = dicom.uid.generate_uid()
+    ds.DoseUnits = 'GY'
+    ds.DoseType = 'PHYSICAL'
+    ds.DoseSummationType = 'PLAN'
+    ds.DoseGridScaling = '{:.10g}'.format(scaling)
+    ds.NumberOfFrames = frames
+    ds.FrameIncrementPointer = dicom.tag.Tag('GridFrameOffsetVector')
+    ds.GridFrameOffsetVector = [float(doseSpacing * f) for f in range(frames)]
+    ds.ImageOrientationPatient = [1, 0, 0, 0, 1, 0]
+    ds.ImagePositionPatient = [float(v) for v in origin]
+    ds.PixelSpacing = [doseSpacing, doseSpacing]
+    ds.SliceThickness = doseSpacing
+    _set_pixels(ds, pixels)
+    _save(ds, path)
+    return path
+
+
+def phantom_slice(geometry, index):
+    """ uint16 [Rows, Cols] slice of a bright ellipsoid body, darker core """
+    r = np.linspace(-1, 1, geometry['Rows'])[:, None]
+    c = np.linspace(-1, 1, geometry['Cols'])[None, :]
+    s = np.linspace(-1, 1, geometry['NSlices'])[index]
+    radius = np.sqrt((r / 0.9) ** 2 + (c / 0.8) ** 2 + (s / 1.2) ** 2)
+    pixels = 800 * (radius < 1) + 400 * (radius < 0.4) + 100 * (1 - r ** 2)
+    return pixels.astype(np.uint16)
+
+
+def _slice_position(geometry, index):
+    origin = geometry['Origin']
+    return [origin[0], origin[1], origin[2] + index * geometry['SliceSpacing']]
+
+
+def _new_dataset(path, SOPClassUID, geometry):
+    meta = _file_meta_class()()
+    meta.MediaStorageSOPClassUID = SOPClassUID
+    meta.MediaStorageSOPInstanceUID = dicom.uid.generate_uid()
+    meta.TransferSyntaxUID = EXPLICIT_VR_LE
+
+    ds = dicom.dataset.FileDataset(path, {}, file_meta=meta,
+                                   preamble=b'\0' * 128)
+    ds.is_little_endian = True
+    ds.is_implicit_VR = False
+    ds.SOPClassUID = SOPClassUID
+    ds.SOPInstanceUID = meta.MediaStorageSOPInstanceUID
+    ds.PatientName = 'Synthetic^Patient'
+    ds.PatientID = geometry['PatientID']
+    ds.StudyInstanceUID = geometry['StudyInstanceUID']
+    ds.FrameOfReferenceUID = geometry['FrameOfReferenceUID']
+    return ds
+
+
+def _file_meta_class():
+    # FileMetaDataset only exists in pydicom >= 2
+    return getattr(dicom.dataset, 'FileMetaDataset', dicom.dataset.Dataset)
+
+
+def _set_pixels(ds, pixels):
+    """ 2D [rows, cols] or 3D [frames, rows, cols] uint16 pixel data """
+    ds.Rows, ds.Columns = pixels.shape[-2:]
+    ds.SamplesPerPixel = 1
+    ds.PhotometricInterpretation = 'MONOCHROME2'
+    ds.BitsAllocated = 16
+    ds.BitsStored = 16
+    ds.HighBit = 15
+    ds.PixelRepresentation = 0
+    ds.PixelData = np.ascontiguousarray(pixels, dtype='<u2').tobytes()
+
+
+def _save(ds, path):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    ds.save_as(path, write_like_original=False)
@@ -4,7 +4,6 @@
 import os
 import time
 from copy import deepcopy
-from multiprocessing.pool import ThreadPool
 # import sys
 # import itertools
 
@@ -16,6 +15,9 @@ try:
 except:
     import pydicom as pydicom
 
+# Locals
+from dicommodule.Executors import get_executor
+
 
 class DicomDataModel(object):
     """
@@ -85,8 +87,7 @@ class DicomDataModel(object):
 
         NSlices = self.NSlices = len(imFileList)
         print("N:", NSlices)
-        pool = ThreadPool(NSlices)
-        results = pool.map(func=getDicomFileData, iterable=imFileList)
+        results = get_executor().map(getDicomFileData, imFileList)
 
         for ind, entry in enumerate(results):  # each dicom's data
 